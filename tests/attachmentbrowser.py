@@ -208,6 +208,56 @@ class TestThumbnailQueue(tests.TestCase):
 					self.assertIsNone(r[0], None)
 
 
+	def testVisibleFirst(self):
+		dir = tests.ZIM_DATA_FOLDER.folder('pixmaps')
+		files = [dir.file(n) for n in sorted(dir.list_names()) if not n.endswith('.svg')]
+		self.assertGreater(len(files), 3)
+
+		queue = ThumbnailQueue(n_workers=1)
+		for file in files:
+			queue.queue_thumbnail_request(file, 64)
+		self.assertEqual(queue._count, len(files))
+
+		# Requests that scroll out of view are cancelled
+		queue.set_visible(files[1:3], 64)
+		queue.set_visible(files[-1:], 64)
+		self.assertEqual(queue._count, len(files) - 2)
+
+		# ... and queued again when they come back in view
+		queue.set_visible(files[1:2] + files[-1:], 64)
+		self.assertEqual(queue._count, len(files) - 1)
+
+		queue.start()
+		first = [queue.get_ready_thumbnail(block=True)[0].path for i in range(2)]
+		self.assertEqual(sorted(first), sorted([files[1].path, files[-1].path]))
+		while not queue.queue_empty():
+			queue.get_ready_thumbnail(block=True)
+
+		pixbuf, mtime = queue.cache.get(files[1], 64)
+		self.assertIsInstance(pixbuf, GdkPixbuf.Pixbuf)
+		self.assertEqual(mtime, files[1].mtime())
+		self.assertEqual(queue.cache.get(files[2], 64), (None, None)) # was cancelled
+
+
+class TestPixbufCache(tests.TestCase):
+
+	def runTest(self):
+		folder = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		a, b, c = [folder.file(n) for n in ('a.png', 'b.png', 'c.png')]
+
+		cache = PixbufCache(max_size=2)
+		cache.set(a, 64, 'A', 1)
+		cache.set(b, 64, 'B', 2)
+		self.assertEqual(cache.get(a, 64), ('A', 1))
+		self.assertEqual(cache.get(a, 128), (None, None))
+		cache.set(c, 64, 'C', 3) # drops "b", "a" was used more recently
+		self.assertEqual(len(cache), 2)
+		self.assertEqual(cache.get(b, 64), (None, None))
+		self.assertEqual(cache.get(a, 64), ('A', 1))
+		cache.clear()
+		self.assertEqual(len(cache), 0)
+
+
 @tests.slowTest
 class TestFileBrowserIconView(tests.TestCase):
 
@@ -427,6 +427,133 @@ class TestMultiFileExporter(tests.TestCase):
 		self.assertIn('<li><a href="./roundtrip.html" title="roundtrip" class="page">roundtrip</a></li>', text)
 
 
+@tests.slowTest
+class TestParallelMultiFileExporter(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content=tests.FULL_NOTEBOOK)
+		notebook.index.check_and_update()
+		attachment = notebook.get_attachments_dir(Path('Bar')).file('data.txt')
+		attachment.write('abc')
+
+		def export(name, jobs):
+			folder = self.setUpFolder(name, mock=tests.MOCK_ALWAYS_REAL)
+			exporter = build_notebook_exporter(folder, 'html', 'Default', index_page='Index', jobs=jobs)
+			pages = AllPages(notebook)
+			exported = [p.name if isinstance(p, Path) else p.path for p in exporter.export_iter(pages)]
+			files = {}
+			for file in folder.walk():
+				if isinstance(file, File):
+					files[file.relpath(folder)] = file.read_binary()
+			return exported, files
+
+		serial_pages, serial_files = export('serial', None)
+		self.assertIn(attachment.path, serial_pages)
+		self.assertTrue(PageExportPool.can_export(
+			build_notebook_exporter(self.setUpFolder('dummy'), 'html', 'Default'),
+			AllPages(notebook)
+		))
+		parallel_pages, parallel_files = export('parallel', 3)
+		self.assertEqual(parallel_pages, serial_pages)
+		self.assertEqual(sorted(parallel_files), sorted(serial_files))
+		for path in serial_files:
+			self.assertEqual(parallel_files[path], serial_files[path], path)
+
+
+class TestParallelExportWorkerPlugins(tests.TestCase):
+
+	def runTest(self):
+		from zim.plugins import PluginManager
+		import zim.export.exporters.files
+		from zim.export.exporters.files import _init_export_worker
+		self.addCleanup(setattr, zim.export.exporters.files, '_worker', None)
+
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content={'Foo': 'Foo\n'})
+		notebook.index.check_and_update()
+		PluginManager.load_plugin('tableeditor')
+
+		folder = self.setUpFolder('output', mock=tests.MOCK_ALWAYS_REAL)
+		exporter = build_notebook_exporter(folder, 'html', 'Default')
+		with PageExportPool(exporter, AllPages(notebook), 1) as pool:
+			spec = pool._spec
+
+		# Workers not started with "fork" do not inherit the plugins
+		PluginManager.remove_plugin('tableeditor')
+		self.assertNotIn('table', PluginManager.insertedobjects)
+		_init_export_worker(*spec)
+		self.assertIn('tableeditor', PluginManager)
+		self.assertIn('table', PluginManager.insertedobjects)
+
+
+class TestIncrementalMultiFileExporter(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content={
+			'Bar': 'Bar\n',
+			'Baz': 'Baz\n',
+			'Foo': 'Foo\n',
+		})
+		notebook.index.check_and_update()
+		attachment = notebook.get_attachments_dir(Path('Baz')).file('data.txt')
+		attachment.write('abc')
+		folder = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+
+		def export(template='Default'):
+			exporter = build_notebook_exporter(folder, 'html', template, incremental=True)
+			for p in exporter.export_iter(AllPages(notebook)):
+				pass
+
+		def mark_files():
+			for name in ('Bar', 'Baz', 'Foo'):
+				folder.file(name + '.html').write('OLD')
+
+		def assertExported(*names):
+			for name in ('Bar', 'Baz', 'Foo'):
+				text = folder.file(name + '.html').read()
+				if name in names:
+					self.assertNotEqual(text, 'OLD', name)
+				else:
+					self.assertEqual(text, 'OLD', name)
+
+		export()
+		self.assertTrue(folder.file(MANIFEST_FILE).exists())
+		target = folder.file('Baz/data.txt')
+		self.assertEqual(target.read(), 'abc')
+
+		# Nothing changed, nothing exported
+		mark_files()
+		target.write('xyz')
+		os.utime(target.path, (attachment.mtime(), attachment.mtime()))
+		export()
+		assertExported()
+		self.assertEqual(target.read(), 'xyz')
+
+		# Changed page and target of new link are exported
+		page = notebook.get_page(Path('Bar'))
+		page.parse('wiki', 'Bar\nSee [[Foo]]\n')
+		notebook.store_page(page)
+		export()
+		assertExported('Bar', 'Foo')
+
+		# Attachment that differs in size is copied
+		mark_files()
+		attachment.write('abcd')
+		export()
+		assertExported('Baz')
+		self.assertEqual(target.read(), 'abcd')
+
+		# Pages that are touched, but not modified are not exported
+		mark_files()
+		file = notebook.get_page(Path('Baz')).source_file
+		os.utime(file.path, (file.mtime() + 10, file.mtime() + 10))
+		export()
+		assertExported()
+
+		# A different template exports all pages
+		export('Print')
+		assertExported('Bar', 'Baz', 'Foo')
+
+
 class TestSingleFileExporter(tests.TestCase):
 
 	def runTest(self):
@@ -526,6 +653,15 @@ class TestExportCommand(tests.TestCase):
 		self.notebookfolder = self.tmpfolder.folder('notebook')
 		init_notebook(self.notebookfolder)
 
+	def testInvalidJobs(self):
+		for value in ('foo', '0'):
+			cmd = ExportCommand('export')
+			cmd.parse_options(self.notebookfolder.path,
+				'--output', self.tmpfolder.folder('output').path,
+				'--jobs', value,
+			)
+			self.assertRaises(UsageError, cmd.get_exporter, None)
+
 	def testOptions(self):
 		# Only testing we get a valid exporter, not the full command,
 		# because the command is very slow
@@ -281,6 +281,33 @@ class TestParseTree(tests.TestCase):
 			tree = ParseTree().fromstring(xml)
 			self.assertEqual(tree.get_ends_with_newline(), newline)
 
+	def testIterChunks(self):
+		text = ['line %i **bold**\n' % i for i in range(10)]
+		text += ['\n', '* item 1\n', '* item 2\n', '\t* item 3\n', '\n']
+		text += ["'''\n"] + ['code %i\n' % i for i in range(6)] + ["'''\n"]
+		parser = get_format('wiki').Parser()
+		dumper = get_format('wiki').Dumper()
+		tree = parser.parse(''.join(text))
+
+		chunks = list(tree.iter_chunks(3, first_n_lines=2))
+		self.assertGreater(len(chunks), 3)
+		self.assertEqual(dumper.dump(chunks[0]), text[:2])
+		for chunk in chunks:
+			lines = dumper.dump(chunk)
+			self.assertGreaterEqual(len(lines), 2)
+			self.assertFalse(lines[0].startswith('\t')) # list not split
+		self.assertEqual(
+			''.join(''.join(dumper.dump(chunk)) for chunk in chunks),
+			''.join(dumper.dump(tree))
+		)
+
+		chunks = list(tree.iter_chunks(1000))
+		self.assertEqual(len(chunks), 1)
+		self.assertEqual(dumper.dump(chunks[0]), dumper.dump(tree))
+
+		chunks = list(ParseTree().fromstring('<zim-tree></zim-tree>').iter_chunks(10))
+		self.assertEqual(len(chunks), 1)
+
 	def testReplace(self):
 		def replace(elt):
 			# level 2 becomes 3
@@ -8,13 +8,14 @@ import os
 import sys
 import sqlite3
 import time
+import threading
 
 from zim.notebook.layout import FilesLayout
 from zim.newfs import LocalFolder, File
 from zim.notebook import Path
 from zim.notebook.index import Index, DB_VERSION
 from zim.notebook.index.files import FilesIndexer, TestFilesDBTable, FilesIndexChecker, TYPE_FOLDER
-from zim.notebook.index.pages import PagesIndexer, TestPagesDBTable
+from zim.notebook.index.pages import PagesIndexer, PagesView, TestPagesDBTable
 from zim.notebook.index.links import LinksIndexer
 from zim.notebook.index.tags import TagsIndexer
 
@@ -85,6 +86,41 @@ class TestIndexInitialization(tests.TestCase):
 		self.assertEqual(index.get_property('db_version'), DB_VERSION)
 
 
+@tests.slowTest
+class TestIndexConnections(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content={'Foo': 'test 123\n'})
+		index = notebook.index
+		self.assertEqual(index._db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+		pages = PagesView.new_from_index(index)
+		self.assertIs(index.connections.get_connection(), index._db)
+		self.assertEqual(pages.lookup_by_pagename(Path('Foo')).name, 'Foo')
+
+		results = []
+		def reader():
+			db = index.connections.get_connection()
+			results.append(db is index._db)
+			results.append(pages.lookup_by_pagename(Path('Foo')).name)
+			try:
+				db.execute('DELETE FROM pages')
+			except sqlite3.OperationalError:
+				results.append('readonly')
+
+		# Reader in other thread does not block on ongoing transaction
+		index._db.execute('UPDATE pages SET name="Bar" WHERE name="Foo"')
+		thread = threading.Thread(target=reader)
+		thread.start()
+		thread.join()
+		self.assertEqual(results, [False, 'Foo', 'readonly'])
+		self.assertEqual(len(index.connections._idle), 1) # connection released
+		index._db.rollback()
+
+		index.connections.close()
+		self.assertEqual(index.connections._idle, [])
+
+
 class TestFilesIndexer(tests.TestCase, TestFilesDBTable):
 
 	FILES = tuple(map(os_native_path, (
@@ -140,6 +176,9 @@ class TestFilesIndexer(tests.TestCase, TestFilesDBTable):
 			if name in ('start-update', 'finish-update'):
 				self.assertFalse(a)
 				return ()
+			elif name == 'file-rows-pending':
+				rows, = a
+				return tuple(row['path'] for row in rows)
 			else:
 				row, = a
 				self.assertIsInstance(row, sqlite3.Row)
@@ -242,6 +281,17 @@ class TestFilesIndexerRobustForFolderMtime(TestFilesIndexer):
 		assert count > 0
 
 
+class TestFilesIndexerWithSmallBatches(TestFilesIndexer):
+	# Like TestFilesIndexer but with batch and transaction sizes small enough
+	# that updates span multiple batches, and rows in a batch can be outdated
+	# by updates of previous rows in the same batch
+
+	def setUp(self):
+		for attr, value in (('batch_size', 2), ('transaction_size', 3)):
+			self.addCleanup(setattr, FilesIndexer, attr, getattr(FilesIndexer, attr))
+			setattr(FilesIndexer, attr, value)
+
+
 class TestFilesIndexerWithCaseInsensitiveFilesytem(tests.TestCase, TestFilesDBTable):
 
 	def runTest(self):
@@ -340,6 +390,7 @@ class TestPagesIndexer(TestPagesDBTable, tests.TestCase):
 		db = sqlite3.connect(':memory:')
 		db.row_factory = sqlite3.Row
 
+		FilesIndexer(db, self.root) # files table for digests
 		file_indexer = tests.MockObject(methods=('connect',))
 
 		indexer = PagesIndexer(db, layout, file_indexer)
@@ -377,7 +428,7 @@ class TestPagesIndexer(TestPagesDBTable, tests.TestCase):
 		# 2. update files
 		signals.clear()
 		for i, path in enumerate(self.FILES):
-			row = {'id': i, 'path': path}
+			row = {'id': i, 'path': path, 'digest': None}
 			indexer.on_file_row_changed(file_indexer, row)
 			self.assertPagesDBConsistent(db)
 
@@ -387,6 +438,17 @@ class TestPagesIndexer(TestPagesDBTable, tests.TestCase):
 		self.assertEqual(signals['page-row-deleted'], [])
 		self.assertEqual(set(signals['page-changed']), set(self.CONTENT))
 
+		# 2b. update files with same content digest
+		signals.clear()
+		for i, path in enumerate(self.FILES):
+			content, (mtime, digest) = self.root.file(path).read_with_etag()
+			row = {'id': i, 'path': path, 'digest': digest}
+			indexer.on_file_row_changed(file_indexer, row)
+
+		self.assertPagesDBEquals(db, self.PAGES)
+		self.assertEqual(signals['page-row-changed'], [])
+		self.assertEqual(signals['page-changed'], [])
+
 		# 3. add some placeholders
 		for pagename in self.PLACEHOLDERS:
 			indexer.insert_link_placeholder(Path(pagename))
@@ -515,6 +577,42 @@ class TestLinksIndexer(tests.TestCase):
 		self.assertEqual(rows, [])
 
 
+class TestLinksIndexerFloatingLinks(tests.TestCase):
+
+	# Floating links from pages in the same namespace share an anchor
+	# lookup, check the outcome matches resolving each link by itself
+
+	PAGES = {
+		'Foo': 'test 123\n',
+		'Foo:Bar': 'test 123\n',
+		'A:Foo:Dus': 'test 123\n',
+		'A:Page1': '[[Foo]]\n[[Foo:Bar]]\n[[Foo:Dus]]\n[[foo:bar:baz]]\n',
+		'A:Page2': '[[Foo]]\n[[Foo:Bar]]\n[[Page1]]\n',
+		'A:B:Page3': '[[Foo:Dus]]\n[[Foo:Bar]]\n[[Page1]]\n[[Page4]]\n',
+		'C:Page5': '[[Foo:Bar]]\n[[Foo:Dus]]\n[[Page6]]\n',
+		'Page7': '[[Foo:Bar]]\n[[:Foo:Dus]]\n[[+Sub]]\n',
+	}
+
+	def runTest(self):
+		notebook = self.setUpNotebook(content=self.PAGES)
+		notebook.index.check_and_update()
+		db = notebook.index._db
+		iview = PagesViewInternal(db)
+
+		rows = db.execute(
+			'SELECT links.*, pages.name FROM links '
+			'JOIN pages ON links.source = pages.id '
+			'WHERE pages.is_link_placeholder=0'
+		).fetchall()
+		self.assertEqual(len(rows), 17)
+		for row in rows:
+			href = HRef(row['rel'], row['names'])
+			target_id, targetname = iview.resolve_link(Path(row['name']), href)
+			self.assertIsNotNone(target_id)
+			self.assertEqual(row['target'], target_id, '%s -> %s' % (row['name'], href))
+			self.assertEqual(row['needscheck'], 0)
+
+
 class TestUnicodeRepresentationAlternatives(tests.TestCase):
 
 	# Write "Glück" as either
@@ -612,6 +710,51 @@ class TestTagsIndexer(tests.TestCase):
 		self.assertEqual(tagsources, wantedsources)
 
 
+class TestPageDigest(tests.TestCase):
+
+	def runTest(self):
+		from zim.notebook.index.pages import PageDigest
+		from zim.plugins.tasklist.indexer import TaskParser
+		from zim.formats import ParseTree
+
+		tree = tests.new_parsetree()
+		digest = PageDigest(tree)
+
+		self.assertEqual(
+			sorted(h.to_wiki_link() for h in digest.iter_href()),
+			sorted(h.to_wiki_link() for h in tree.iter_href())
+		)
+		self.assertEqual(list(digest.iter_tag_names()), list(tree.iter_tag_names()))
+		self.assertEqual(
+			''.join(digest.iter_text()).split(),
+			''.join(tree._etree.getroot().itertext()).split()
+		)
+		self.assertIn('head-4-anchor', list(digest.iter_anchors()))
+		self.assertEqual(list(digest.iter_headings())[0], (1, 'Head 1'))
+
+		parser = TaskParser()
+		self.assertEqual(
+			parser.parse(digest.iter_task_tokens()),
+			parser.parse(tree.iter_tokens())
+		)
+
+		# Rest of the ParseTree interface for indexers written for it
+		self.assertEqual(list(digest.iter_tokens()), list(tree.iter_tokens()))
+		self.assertEqual(digest.get_heading_text(), tree.get_heading_text())
+		self.assertEqual(digest.hascontent, tree.hascontent)
+		self.assertRaises(AttributeError, getattr, digest, 'no_such_method')
+
+		# All of the above comes from a single walk
+		walks = []
+		tree._get_tokens = lambda *a, **kw: walks.append(a) or ParseTree._get_tokens(tree, *a, **kw)
+		digest = PageDigest(tree)
+		list(digest.iter_href())
+		list(digest.iter_tag_names())
+		list(digest.iter_text())
+		list(digest.iter_task_tokens())
+		self.assertEqual(len(walks), 1)
+
+
 from zim.notebook.index import IndexUpdateIter
 
 
@@ -653,3 +796,64 @@ class TestFullIndexer(TestFilesIndexer):
 		# 3. Check and update after files disappear
 		self.remove_files(self.FILES_UPDATE)
 		update_iter.check_and_update()
+
+
+class TestSkipUnchangedContent(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content={
+			'Foo': 'test 123\n',
+			'Foo:Bar': '[[Foo]]\n',
+			'Dus': 'test 456\n',
+		})
+		changed = []
+		notebook.index.update_iter.pages.connect('page-changed',
+			lambda o, row, doc: changed.append(row['name']))
+
+		# Only mtime changed - e.g. by a file sync tool
+		for path in ('Foo', 'Foo:Bar'):
+			file = notebook.get_page(Path(path)).source_file
+			os.utime(file.path, (time.time() + 10, time.time() + 10))
+		notebook.index.check_and_update()
+		self.assertTrue(notebook.index.is_uptodate)
+		self.assertEqual(changed, [])
+		record = notebook.pages.lookup_by_pagename(Path('Foo'))
+		self.assertEqual(record.mtime, notebook.get_page(Path('Foo')).source_file.mtime())
+
+		# Content changed
+		file = notebook.get_page(Path('Dus')).source_file
+		file.write(file.read().replace('456', '789'))
+		os.utime(file.path, (time.time() + 20, time.time() + 20))
+		notebook.index.check_and_update()
+		self.assertEqual(changed, ['Dus'])
+
+		# Re-index always parses
+		changed[:] = []
+		notebook.index.flag_reindex()
+		notebook.index.update()
+		self.assertEqual(sorted(changed), ['Dus', 'Foo', 'Foo:Bar'])
+
+
+class TestParallelParsing(tests.TestCase):
+
+	def runTest(self):
+		# Index the same notebook serial and with a pool of worker
+		# processes, the resulting tables should be the same
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content=tests.FULL_NOTEBOOK)
+		db = notebook.index._db
+
+		def dump_tables():
+			return dict(
+				(table, sorted(tuple(r) for r in db.execute('SELECT * FROM %s' % table)))
+					for table in ('pages', 'links', 'tags', 'tagsources')
+			)
+
+		notebook.index.flush()
+		notebook.index.update()
+		serial = dump_tables()
+		self.assertTrue(len(serial['pages']) > 10)
+
+		notebook.index.flush()
+		notebook.index.update(jobs=2)
+		self.assertIsNone(notebook.index.update_iter.pages._parser_pool)
+		self.assertEqual(dump_tables(), serial)
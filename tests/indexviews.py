@@ -72,31 +72,29 @@ TREEPATHS_TAGS_12 = (
 		('Foo:Child1:GrandChild1', (1, 3,)),
 )
 
-_SQL = None
+_DB = None
 def new_test_database(files=FILES):
 	if files == FILES:
-		global _SQL
-		if _SQL is None:
-			_SQL = _get_sql(FILES)
-		sql = _SQL
+		global _DB
+		if _DB is None:
+			_DB = _get_db(FILES)
+		template = _DB
 	else:
-		sql = _get_sql(files)
+		template = _get_db(files)
 
 	db = sqlite3.Connection(':memory:')
 	db.row_factory = sqlite3.Row
-	db.executescript(sql)
+	template.backup(db) # unlike iterdump() this supports virtual tables
 	return db
 
 
-def _get_sql(files):
+def _get_db(files):
 	folder = MockFolder('/mock/notebook/')
 	indexer = buildUpdateIter(folder)
 	for path, text in files:
 		folder.file(path).write('Content-Type: text/x-zim-wiki\n\n' + text)
 	indexer.check_and_update()
-	lines = list(indexer.db.iterdump())
-	indexer.db.close()
-	return '\n'.join(lines)
+	return indexer.db
 
 
 #class TestMemoryIndex(tests.TestCase):
@@ -113,6 +111,19 @@ from zim.notebook.index.pages import PagesIndexer, PagesView, \
 	#get_treepaths_for_indexpath_flatlist_factory, get_indexpath_for_treepath_flatlist_factory, \
 
 
+class MockPagesTreeModel(PagesTreeModelMixin):
+	# Provide the Gtk.TreeModel methods used by the signal handlers
+
+	def flush_cache(self):
+		self.cache.clear()
+
+	def get_iter(self, treepath):
+		return self.get_mytreeiter(tuple(treepath))
+
+	def emit(self, signal, *args):
+		pass
+
+
 class TestPagesView(tests.TestCase):
 
 	def testBasics(self):
@@ -277,6 +288,40 @@ class TestPagesView(tests.TestCase):
 		self.assertIsNone(p)
 		self.assertRaises(IndexNotFoundError, model.find, Path('non-existing-page'))
 
+	def testTreePathMethodsLargeNamespace(self):
+		files = [('Big/Page%03i.txt' % i, 'test 123\n') for i in range(100)]
+		files.append(('Big.txt', 'test 123\n'))
+		db = new_test_database(files)
+		names = ['Big:Page%03i' % i for i in range(100)]
+
+		for reverse in (False, True):
+			mockindex = tests.MockObject(methods=('connect',))
+			mockindex._db = db
+			mockindex.update_iter = tests.MockObject(methods=('connect',))
+			mockindex.update_iter.pages = tests.MockObject(methods=('connect',))
+
+			model = MockPagesTreeModel(mockindex, root=Path('Big'), reverse=reverse)
+			wanted = list(reversed(names)) if reverse else names
+			self.assertEqual(model.n_children_top(), 100)
+			for i in (0, 1, 19, 20, 21, 55, 99, 42, 0):
+				model.cache.clear()
+				myiter = model.get_mytreeiter((i,))
+				self.assertEqual(myiter.row['name'], wanted[i])
+				self.assertEqual(model.find(Path(wanted[i])), Gtk.TreePath((i,)))
+			self.assertIsNone(model.get_mytreeiter((100,)))
+
+			# Keys are updated by the row signals
+			parent = db.execute('SELECT * FROM pages WHERE name="Big"').fetchone()
+			row = db.execute('SELECT * FROM pages WHERE name="Big:Page050"').fetchone()
+			next = db.execute('SELECT * FROM pages WHERE name="Big:Page051"').fetchone()
+			model.on_page_row_delete(None, row)
+			model.on_page_row_deleted(None, row)
+			self.assertEqual(model.n_children_top(), 99)
+			self.assertEqual(model._get_offset(parent['id'], next['sortkey'], next['name']), 48 if reverse else 50)
+			model.on_page_row_inserted(None, row)
+			self.assertEqual(model.n_children_top(), 100)
+			self.assertEqual(model._get_offset(parent['id'], next['sortkey'], next['name']), 48 if reverse else 51)
+
 	def testMatchPages(self):
 		db = new_test_database()
 		pages = PagesView(db)
@@ -469,3 +514,77 @@ class TestLinksView(tests.TestCase):
 		uclinks = [(l.source, l.target) for l in linksview.list_floating_links('FOO')]
 		self.assertGreater(len(lclinks), 0)
 		self.assertEqual(lclinks, uclinks)
+
+
+class TestLinksNeighbourhood(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(content={
+			'A': '[[B]]\n',
+			'B': '[[C]]\n',
+			'C': '[[D]] [[Missing]]\n',
+			'D': 'no links\n',
+			'E': '[[A]]\n',
+		})
+		linksview = notebook.links
+
+		def neighbourhood(*args, **kwargs):
+			nodes, links = linksview.neighbourhood(Path('B'), *args, **kwargs)
+			return (
+				[(p.name, d) for p, d in nodes],
+				sorted((l.source.name, l.target.name) for l in links)
+			)
+
+		self.assertEqual(neighbourhood(0), ([('B', 0)], []))
+		self.assertEqual(neighbourhood(1), (
+			[('B', 0), ('A', 1), ('C', 1)],
+			[('A', 'B'), ('B', 'C')]
+		))
+		self.assertEqual(neighbourhood(2, LINK_DIR_FORWARD), (
+			[('B', 0), ('C', 1), ('D', 2), ('Missing', 2)],
+			[('B', 'C'), ('C', 'D'), ('C', 'Missing')]
+		))
+		self.assertEqual(neighbourhood(5, LINK_DIR_BACKWARD), (
+			[('B', 0), ('A', 1), ('E', 2)],
+			[('A', 'B'), ('E', 'A')]
+		))
+		self.assertEqual(neighbourhood(2, LINK_DIR_BOTH, limit=4), (
+			[('B', 0), ('A', 1), ('C', 1), ('D', 2)],
+			[('A', 'B'), ('B', 'C'), ('C', 'D')]
+		))
+		self.assertRaises(IndexNotFoundError, linksview.neighbourhood, Path('NoSuchPage'))
+
+
+class TestLinksGraphStats(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(content={
+			'A': '[[B]] [[C]]\n',
+			'B': '[[C]] [[B]]\n',
+			'C': '[[Missing]]\n',
+			'D': '[[C]]\n',
+			'E': 'no links\n',
+			'F': '[[F]]\n',
+			'G': '[[H]]\n',
+			'H': 'no links\n',
+		})
+		linksview = notebook.links
+
+		def names(paths):
+			return [p.name for p in paths]
+
+		self.assertEqual(linksview.n_all_links(), 6) # self links B -> B and F -> F not counted
+		self.assertEqual(names(linksview.list_orphan_pages()), ['E', 'F'])
+		self.assertEqual(names(linksview.list_pages_without_backlinks()), ['A', 'D', 'E', 'F', 'G'])
+		self.assertEqual(
+			[(p.name, n) for p, n in linksview.list_link_placeholders()],
+			[('Missing', 1)]
+		)
+		self.assertEqual(
+			[(p.name, n) for p, n in linksview.list_most_linked_pages(3)],
+			[('C', 3), ('B', 1), ('H', 1)]
+		)
+		self.assertEqual(
+			[names(c) for c in linksview.list_components()],
+			[['A', 'B', 'C', 'D', 'Missing'], ['G', 'H'], ['E'], ['F']]
+		)
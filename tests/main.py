@@ -291,6 +291,40 @@ class TestServerGui(tests.TestCase):
 ## ExportCommand() is tested in tests/export.py
 
 
+class TestGraphStats(tests.TestCase):
+
+	def runTest(self):
+		folder = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		for name, text in (
+			('Foo', '[[Bar]]\n'),
+			('Bar', '[[Foo]] [[Missing]]\n'),
+			('Orphan', 'no links\n'),
+		):
+			folder.file(name + '.txt').write('Content-Type: text/x-zim-wiki\n\n' + text)
+
+		cmd = GraphStatsCommand('graph-stats')
+		cmd.parse_options(folder.path, '--list')
+		with capture_stdout() as output:
+			cmd.run()
+
+		lines = output.getvalue().splitlines()
+		for line in (
+			'Links: 3',
+			'Orphan pages: 1',
+			'Placeholders: 1',
+			'Connected components: 2',
+			'Largest component: 3 pages',
+			'     1  Missing',
+			'  Orphan',
+		):
+			self.assertIn(line, lines)
+
+		for value in ('foo', '-1'):
+			cmd = GraphStatsCommand('graph-stats')
+			cmd.parse_options(folder.path, '--top', value)
+			self.assertRaises(UsageError, cmd.run)
+
+
 class TestIPC(tests.TestCase):
 
 	def runTest(self):
@@ -1156,6 +1156,214 @@ class TestUpdateCacheOnMovePage(tests.TestCase):
 		self.assertEqual(''.join(page2.dump('wiki')), '')
 
 
+class TestMovePageIndex(tests.TestCase):
+	# Moving a page updates the index rows in place, the outcome should be
+	# the same as indexing the moved notebook from scratch
+
+	PAGES = {
+		'A': '[[+A1]]\n[[B]]\n@foo\n',
+		'A:A1': '[[A2]]\n[[:B:B1]]\n[[Dus]]\n',
+		'A:A2': '[[A]]\n[[A1:Sub]]\n',
+		'B': '[[A:A1]]\n[[C]]\n',
+		'B:B1': '[[A]]\n[[C:A1]]\n',
+		'Dus': 'test 123\n',
+		'C_D': '[[Foo_Bar]]\n',
+		'Foo_Bar': 'test 123\n',
+	}
+
+	def dumpIndex(self, notebook):
+		db = notebook.index._db
+		pages = sorted(
+			(r['name'], r['n_children'], r['is_link_placeholder'], r['source_file'] is not None)
+				for r in db.execute('SELECT * FROM pages')
+		)
+		links = sorted(
+			(r[0], r[1], r[2])
+				for r in db.execute(
+					'SELECT s.name, t.name, links.names FROM links '
+					'JOIN pages s ON links.source = s.id '
+					'JOIN pages t ON links.target = t.id'
+				)
+		)
+		tags = sorted(
+			(r[0], r[1])
+				for r in db.execute(
+					'SELECT pages.name, tags.name FROM tagsources '
+					'JOIN pages ON tagsources.source = pages.id '
+					'JOIN tags ON tagsources.tag = tags.id'
+				)
+		)
+		files = sorted(r['path'] for r in db.execute('SELECT * FROM files'))
+		return pages, links, tags, files
+
+	def runTest(self):
+		for oldpath, newpath in (
+			('A', 'C'), # new name exists as placeholder
+			('A', 'B:A'),
+			('B:B1', 'New:Namespace:B1'),
+			('C D', 'C E'), # file names have "_", a wildcard for LIKE
+			('Dus', 'DUS'),
+		):
+			notebook = self.setUpNotebook(content=self.PAGES)
+			oldrecord = notebook.pages.lookup_by_pagename(Path(oldpath))
+			children = dict(
+				(p.relname(oldrecord), p.id)
+					for p in notebook.pages.walk(oldrecord)
+			)
+
+			changed = []
+			notebook.index.update_iter.pages.connect('page-changed',
+				lambda o, row, doc: changed.append(row['name']))
+			notebook.move_page(Path(oldpath), Path(newpath), update_links=False)
+			self.assertEqual(changed, [])
+
+			# Ids remain the same
+			newrecord = notebook.pages.lookup_by_pagename(Path(newpath))
+			self.assertEqual(newrecord.id, oldrecord.id)
+			for child in notebook.pages.walk(newrecord):
+				name = child.relname(newrecord)
+				if name in children:
+					self.assertEqual(child.id, children.pop(name))
+			self.assertEqual(children, {})
+
+			moved = self.dumpIndex(notebook)
+			notebook.index.flush()
+			notebook.index.check_and_update()
+			self.assertEqual(moved, self.dumpIndex(notebook))
+
+
+class TestBatchUpdateLinks(tests.TestCase):
+	# Links in many pages are updated with a single index update
+
+	def setUp(self):
+		content = {'Hub': 'test 123\n'}
+		for i in range(20):
+			content['Page%02i' % i] = '[[Hub]] [[:Hub]]\n'
+		self.notebook = self.setUpNotebook(content=content)
+		self.commits = []
+		self.notebook.index.connect('changed', lambda o: self.commits.append(1))
+
+	def testMovePage(self):
+		from zim.notebook.index import LINK_DIR_BACKWARD
+		steps = list(self.notebook.move_page_iter(Path('Hub'), Path('NewHub')))
+		self.assertEqual(len(steps), 20)
+		self.assertEqual([s[:2] for s in steps], [(i, 20) for i in range(20)])
+		self.assertEqual(sorted(s[2].name for s in steps), ['Page%02i' % i for i in range(20)])
+		self.assertEqual(len(self.commits), 2) # move + links
+
+		for i in range(20):
+			page = self.notebook.get_page(Path('Page%02i' % i))
+			self.assertEqual(page.dump('wiki'), ['[[NewHub]] [[:NewHub]]\n'])
+		self.assertEqual(self.notebook.links.n_list_links(Path('NewHub'), LINK_DIR_BACKWARD), 40)
+		self.assertRaises(IndexNotFoundError, self.notebook.pages.lookup_by_pagename, Path('Hub'))
+
+	def testCancelMovePage(self):
+		from zim.notebook.index import LINK_DIR_BACKWARD
+		stored = []
+		self.notebook.connect('stored-page', lambda o, p: stored.append(p.name))
+
+		iter = self.notebook.move_page_iter(Path('Hub'), Path('NewHub'))
+		for i in range(5):
+			step = next(iter)
+		self.assertEqual(step[:2], (4, 20))
+		iter.close() # cancel while storing pages, first 4 pages are done
+
+		self.assertEqual(len(stored), 4)
+		self.assertEqual(len(self.commits), 2) # move + links stored so far
+		for i in range(20):
+			page = self.notebook.get_page(Path('Page%02i' % i))
+			if page.name in stored:
+				self.assertEqual(page.dump('wiki'), ['[[NewHub]] [[:NewHub]]\n'])
+			else:
+				self.assertEqual(page.dump('wiki'), ['[[Hub]] [[:Hub]]\n'])
+		self.assertEqual(self.notebook.links.n_list_links(Path('NewHub'), LINK_DIR_BACKWARD), 8)
+
+	def testDeletePage(self):
+		steps = list(self.notebook.delete_page_iter(Path('Hub')))
+		self.assertEqual(len(steps), 20)
+		self.assertEqual(len(self.commits), 2) # file + links
+
+		for i in range(20):
+			page = self.notebook.get_page(Path('Page%02i' % i))
+			self.assertEqual(page.dump('wiki'), ['Hub :Hub\n'])
+		self.assertRaises(IndexNotFoundError, self.notebook.pages.lookup_by_pagename, Path('Hub'))
+
+
+class TestParseTreeCache(tests.TestCase):
+
+	def testEncoding(self):
+		from zim.notebook.parsetreecache import encode_parsetree, decode_parsetree
+		tree = tests.new_parsetree()
+		tree.meta['Creation-Date'] = '2026-01-01T00:00:00+01:00'
+		copy = decode_parsetree(encode_parsetree(tree))
+		self.assertEqual(copy.tostring(), tree.tostring())
+		self.assertEqual(dict(copy.meta), dict(tree.meta))
+
+	def testGetAndSet(self):
+		from zim.notebook.parsetreecache import ParseTreeCache
+		import zim.formats.wiki as format
+		folder = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		file = folder.file('page.txt')
+		file.write('Content-Type: text/x-zim-wiki\n\n**test** 123\n')
+
+		cache = ParseTreeCache(':memory:')
+		self.assertIsNone(cache.get(file, format))
+
+		text, etag = file.read_with_etag()
+		tree = format.Parser().parse(text, file_input=True)
+		cache.set(file, format, tree, etag)
+		cached, cached_etag = cache.get(file, format)
+		self.assertEqual(cached.tostring(), tree.tostring())
+		self.assertEqual(cached_etag, etag)
+
+		file.write('Content-Type: text/x-zim-wiki\n\n**test** 123 456\n')
+		self.assertIsNone(cache.get(file, format))
+
+	def testSizeBound(self):
+		from zim.notebook.parsetreecache import ParseTreeCache, encode_parsetree
+		import zim.formats.wiki as format
+		folder = self.setUpFolder(mock=tests.MOCK_ALWAYS_REAL)
+		tree = tests.new_parsetree()
+		size = len(encode_parsetree(tree))
+
+		cache = ParseTreeCache(':memory:', max_size=size * 4)
+		files = [folder.file('page%i.txt' % i) for i in range(6)]
+		for file in files:
+			file.write('test 123\n')
+			cache.set(file, format, tree, file.read_with_etag()[1])
+			cache.get(files[0], format) # keep first one in use
+
+		self.assertIsNotNone(cache.get(files[0], format))
+		self.assertIsNone(cache.get(files[1], format))
+		self.assertIsNotNone(cache.get(files[-1], format))
+
+	def testNotebook(self):
+		from zim.notebook.parsetreecache import ParseTreeCache
+		import zim.formats.wiki
+
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL, content={'Foo': '**test** 123\n'})
+		notebook.parsetree_cache = ParseTreeCache(':memory:')
+		page = notebook.get_page(Path('Foo'))
+		xml = page.get_parsetree().tostring()
+		del page
+
+		def parse(*a, **kwa):
+			raise AssertionError('Page was parsed again')
+
+		orig = zim.formats.wiki.Parser.parse
+		zim.formats.wiki.Parser.parse = parse
+		self.addCleanup(setattr, zim.formats.wiki.Parser, 'parse', orig)
+
+		page = notebook.get_page(Path('Foo'))
+		self.assertEqual(page.get_parsetree().tostring(), xml)
+
+		# Storing uses the etag from the cache
+		zim.formats.wiki.Parser.parse = orig
+		page.parse('plain', 'new text\n')
+		notebook.store_page(page)
+		self.assertEqual(page.source_file.read().splitlines()[-1], 'new text')
+
+
 class TestPath(tests.TestCase):
 	'''Test path object'''
 
@@ -1630,6 +1838,90 @@ class TestBackgroundSave(tests.TestCase):
 		self.assertEqual(signals['stored-page'], [(page,)]) # post handler happened as well
 
 
+class TestIndexStoredPage(tests.TestCase):
+
+	def setUp(self):
+		import zim.notebook.index.pages
+
+		def parse_file(*a):
+			raise AssertionError('Stored page was parsed again for the index')
+
+		orig = zim.notebook.index.pages._parse_file
+		zim.notebook.index.pages._parse_file = parse_file
+		self.addCleanup(setattr, zim.notebook.index.pages, '_parse_file', orig)
+
+	def testStoreAndIndex(self):
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL)
+		changed = []
+		notebook.index.update_iter.pages.connect('page-changed',
+			lambda o, row, doc: changed.append(row['name']))
+
+		# New page
+		page = notebook.get_page(Path('Foo'))
+		page.parse('wiki', 'test [[Bar]] @tag1\n')
+		notebook.store_page(page)
+		self.assertEqual(changed, ['Foo'])
+		self.assertEqual([l.target.name for l in notebook.links.list_links(Path('Foo'))], ['Bar'])
+		self.assertEqual([t.name for t in notebook.tags.list_tags(Path('Foo'))], ['tag1'])
+
+		# Same content again
+		notebook.store_page(page)
+		self.assertEqual(changed, ['Foo'])
+
+		# Changed content, in the background
+		tree = WikiParser().parse('test [[Dus]] @tag2\n')
+		op = notebook.store_page_async(page, tree)
+		while op._thread.is_alive():
+			tests.gtk_process_events()
+		tests.gtk_process_events()
+		self.assertFalse(op.error_event.is_set())
+		self.assertEqual(changed, ['Foo', 'Foo'])
+		self.assertEqual([l.target.name for l in notebook.links.list_links(Path('Foo'))], ['Dus'])
+		self.assertEqual([t.name for t in notebook.tags.list_tags(Path('Foo'))], ['tag2'])
+
+		# Index is consistent with the files
+		self.assertTrue(notebook.index.is_uptodate)
+		notebook.index.check_and_update()
+		self.assertEqual(changed, ['Foo', 'Foo'])
+
+	def testIndexAsReadFromFile(self):
+		# The tree from the editor can have plain text that is parsed as
+		# tags, links and urls when the file is read, the index should
+		# match what is read from the file
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL)
+		page = notebook.get_page(Path('Foo'))
+		page.set_parsetree(ParseTree().fromstring(
+			'<zim-tree>hello @mytag see [[Bar]] and https://example.com\n</zim-tree>'
+		))
+		notebook.store_page(page)
+		self.assertEqual([t.name for t in notebook.tags.list_tags(Path('Foo'))], ['mytag'])
+		self.assertEqual([l.target.name for l in notebook.links.list_links(Path('Foo'))], ['Bar'])
+
+	def testParsedTreeIsNotParsedAgain(self):
+		# A tree that is parser output, like the tree from the editor, is
+		# indexed as is
+		import zim.formats.wiki
+
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL)
+		file, folder = notebook.layout.map_page(Path('Foo'))
+		file.write('Content-Type: text/x-zim-wiki\n\ntest [[Dus]] @tag2\n') # not yet indexed
+		page = notebook.get_page(Path('Foo'))
+		self.assertIsNotNone(page.get_parsetree())
+
+		parsed = []
+		orig = zim.formats.wiki.Parser.parse
+		def parse(parser, *a, **kwa):
+			parsed.append(a)
+			return orig(parser, *a, **kwa)
+		zim.formats.wiki.Parser.parse = parse
+		self.addCleanup(setattr, zim.formats.wiki.Parser, 'parse', orig)
+
+		notebook.store_page(page)
+		self.assertEqual(parsed, [])
+		self.assertEqual([t.name for t in notebook.tags.list_tags(Path('Foo'))], ['tag2'])
+		self.assertEqual([l.target.name for l in notebook.links.list_links(Path('Foo'))], ['Dus'])
+
+
 class TestFilesLayout(tests.TestCase):
 
 	def _test_page_vs_not_a_page(self, folder, layout, pagefile, notapagefile):
@@ -215,6 +215,84 @@ More text
 
 		self.assertEqual(newwikitext, wikitext)
 
+	def testIncrementalParseTree(self):
+		# The whole buffer is serialized per block and unchanged blocks
+		# are cached, check this gives the same result as a full walk
+		tree = tests.new_parsetree() # uses tests/data/formats/wiki.txt
+		notebook = self.setUpNotebook()
+		page = notebook.get_page(Path('Test'))
+		buffer = TextBuffer(notebook, page)
+		with FilterNoSuchImageWarning():
+			buffer.set_parsetree(tree)
+
+		def assertParseTreeEqual():
+			wanted = buffer.get_parsetree(bounds=buffer.get_bounds())
+			self.assertEqual(buffer.get_parsetree().tostring(), wanted.tostring())
+
+		assertParseTreeEqual()
+		self.assertGreater(len(buffer._blocks), 10)
+
+		serialized = []
+		orig = buffer._serialize
+		def serialize(builder, start, end, raw):
+			serialized.append(start.get_line())
+			return orig(builder, start, end, raw)
+		buffer._serialize = serialize
+
+		# Insert text
+		iter = buffer.get_iter_at_line(10)
+		buffer.insert(iter, 'Some new text ')
+		assertParseTreeEqual()
+		self.assertLess(len(serialized), len(buffer._blocks) // 2)
+
+		# Apply formatting
+		start = buffer.get_iter_at_line(20)
+		end = start.copy()
+		end.forward_to_line_end()
+		buffer.apply_tag_by_name('style-strong', start, end)
+		assertParseTreeEqual()
+
+		# Split and merge blocks
+		buffer.insert(buffer.get_iter_at_line(30), '\n\n')
+		assertParseTreeEqual()
+		start = buffer.get_iter_at_line(25)
+		end = buffer.get_iter_at_line(40)
+		buffer.delete(start, end)
+		assertParseTreeEqual()
+
+		# Nothing changed, only blocks with objects are serialized again
+		serialized[:] = []
+		assertParseTreeEqual()
+		self.assertLess(len(serialized), len(buffer._blocks) // 2)
+
+	def testProgressiveLoad(self):
+		tree = tests.new_parsetree() # uses tests/data/formats/wiki.txt
+		notebook = self.setUpNotebook()
+		page = notebook.get_page(Path('Test'))
+
+		buffer = TextBuffer(notebook, page)
+		with FilterNoSuchImageWarning():
+			buffer.set_parsetree(tree)
+		wanted = buffer.get_parsetree().tostring()
+
+		buffer = TextBuffer(notebook, page)
+		buffer.PROGRESSIVE_FIRST_LINES = 10
+		buffer.PROGRESSIVE_CHUNK_LINES = 20
+		with FilterNoSuchImageWarning():
+			buffer.set_parsetree(tree, progressive=True)
+			buffer.set_modified(False)
+			self.assertIsNotNone(buffer._progressive_load)
+			n_lines = buffer.get_line_count()
+			n_undo = (len(buffer.undostack.stack), len(buffer.undostack.group))
+			buffer._on_progressive_load_idle()
+			self.assertGreater(buffer.get_line_count(), n_lines)
+			self.assertFalse(buffer.get_modified())
+			self.assertEqual((len(buffer.undostack.stack), len(buffer.undostack.group)), n_undo)
+
+			self.assertEqual(buffer.get_parsetree().tostring(), wanted)
+			self.assertIsNone(buffer._progressive_load)
+			self.assertFalse(buffer.get_modified())
+
 	def testGetPartialParseTree(self):
 		# See issue #1895 for bug found here
 		# Select list item until end of line, not including newline
@@ -3092,6 +3170,34 @@ Baz
 		self.assertFalse(pageview.edit_bar.get_property('visible'))
 		self.assertFalse(pageview.find_bar.get_property('visible'))
 
+	def testSetCursorPosBeyondProgressiveLoad(self):
+		text = ''.join('line %i\n' % i for i in range(1000))
+		pageview = setUpPageView(self.setUpNotebook(), text)
+		buffer = pageview.textview.get_buffer()
+		self.assertIsNotNone(buffer._progressive_load)
+		self.assertLess(buffer.get_char_count(), len(text))
+
+		pos = text.index('line 900\n')
+		pageview.set_cursor_pos(pos)
+		self.assertEqual(pageview.get_cursor_pos(), pos)
+		iter = buffer.get_iter_at_mark(buffer.get_insert())
+		self.assertEqual(iter.get_line(), 900)
+
+	def testNavigateToAnchorBeyondProgressiveLoad(self):
+		text = ''.join('line %i\n' % i for i in range(1000))
+		text += '== Deep heading ==\nsome text <anchor name="deep" />\n'
+		pageview = setUpPageView(self.setUpNotebook(), text)
+		buffer = pageview.textview.get_buffer()
+		self.assertIsNotNone(buffer._progressive_load)
+
+		pageview.navigate_to_anchor('deep-heading')
+		iter = buffer.get_iter_at_mark(buffer.get_insert())
+		self.assertEqual(iter.get_line(), 1000)
+
+		pageview.navigate_to_anchor('deep')
+		iter = buffer.get_iter_at_mark(buffer.get_insert())
+		self.assertEqual(iter.get_line(), 1001)
+
 
 class TestFormatActions(tests.TestCase, TextBufferTestCaseMixin):
 
@@ -246,6 +246,42 @@ class TestSearchFiles(TestSearch):
 		TestSearch.runTest(self)
 
 
+class TestSearchFullText(tests.TestCase):
+
+	def runTest(self):
+		'''Test search results from full text index are same as regex search'''
+		from zim.notebook.index import FullTextView
+
+		notebook = self.setUpNotebook(content=tests.FULL_NOTEBOOK)
+		notebook.index.check_and_update()
+		if not FullTextView.new_from_index(notebook.index).is_available():
+			self.skipTest('SQLite without FTS5 support')
+
+		def search(string):
+			results = SearchSelection(notebook)
+			results.search(Query(string))
+			self.assertTrue(set(results.scores.keys()) == results)
+			self.assertTrue(all(results.scores.values()))
+			return set(results)
+
+		queries = (
+			'foo bar', '+TODO -bar', 'TODO or bar', 'content:foo',
+			'content:foo*', 'Namespace: "TaskList" fix', 'content:*oo',
+			'foo* -bar', 'TODO or "foo bar"', 'content:TODO content:*bar',
+			'ThisWordDoesNotExistingInTheTestNotebook',
+		)
+		with_index = dict((q, search(q)) for q in queries)
+		self.assertTrue(with_index['content:foo'])
+
+		is_available = FullTextView.is_available
+		FullTextView.is_available = lambda self: False
+		self.addCleanup(setattr, FullTextView, 'is_available', is_available)
+		without_index = dict((q, search(q)) for q in queries)
+
+		for q in queries:
+			self.assertEqual(with_index[q], without_index[q], 'Query: %s' % q)
+
+
 class TestUnicode(tests.TestCase):
 
 	def runTest(self):
@@ -127,6 +127,7 @@ Edge case with wrongly nested list
 '''
 
 from zim.plugins.tasklist.indexer import TaskParser, _MAX_DUE_DATE, _MIN_START_DATE
+from zim.notebook.index.pages import PageDigest
 from zim.parsing import parse_date
 
 def t(desc, status=TASK_STATUS_OPEN, waiting=False, start=_MIN_START_DATE, due=_MAX_DUE_DATE, prio=0, tags=''):
@@ -153,6 +154,11 @@ class TestTaskParser(tests.TestCase):
 		#~ import pprint; pprint.pprint(tasks)
 		self.assertEqual(tasks, wanted)
 
+		# Same result for the tokens of the page digest used when indexing
+		with tests.LoggingFilter('zim.plugins.tasklist', 'Invalid date format'):
+			tasks = parser.parse(PageDigest(tree).iter_task_tokens(), **parse_args)
+		self.assertEqual(tasks, wanted)
+
 	def testAllCheckboxes(self):
 		mydate = '%04i-%02i-%02i' % parse_date('11/12')
 
@@ -499,6 +505,72 @@ class TestTaskList(tests.TestCase):
 				path = view.get_path(task)
 				self.assertTrue(not path is None)
 
+	def testIncrementalUpdate(self):
+		from zim.plugins import find_extension
+		plugin = PluginManager.load_plugin('tasklist')
+		notebook = self.setUpNotebook(content={'Test': '[ ] Foo\n[ ] Bar\n\t[ ] Child\n'})
+		indexer = find_extension(notebook, TaskListNotebookExtension).indexer
+		view = AllTasks.new_from_index(notebook.index)
+		view.set_status_included(TASK_STATUS_OPEN, TASK_STATUS_CLOSED)
+
+		def list_tasks():
+			def walk(parent):
+				for row in view.list_tasks(parent):
+					yield row['description'], row['id']
+					yield from walk(row)
+			return dict(walk(None))
+
+		def store(text):
+			page = notebook.get_page(Path('Test'))
+			page.get_parsetree() # set etag for existing file
+			page.parse('wiki', text)
+			notebook.store_page(page)
+
+		before = list_tasks()
+		self.assertEqual(set(before), {'Foo', 'Bar', 'Child'})
+		signals = tests.SignalLogger(indexer)
+
+		# Saving without changes in tasks does not change the table
+		store('Some text\n\n[ ] Foo\n[ ] Bar\n\t[ ] Child\n')
+		self.assertEqual(signals['tasklist-changed'], [])
+		self.assertEqual(list_tasks(), before)
+
+		# Existing tasks keep their id
+		store('[ ] New\n[ ] Foo\n[*] Bar\n\t[*] Child\n')
+		after = list_tasks()
+		new = after.pop('New')
+		self.assertEqual(after, before)
+		self.assertEqual(signals['tasklist-changed'], [
+			([new], [before['Bar'], before['Child']], [])
+		])
+		self.assertEqual( # order in page is kept
+			[r['description'] for r in view.list_tasks()],
+			['New', 'Foo', 'Bar']
+		)
+
+		signals.clear()
+		store('[ ] Foo\n')
+		self.assertEqual(signals['tasklist-changed'], [
+			([], [], [before['Bar'], before['Child'], new])
+		])
+
+	def testMovePageIntoExcludedSubtree(self):
+		plugin = PluginManager.load_plugin('tasklist')
+		notebook = self.setUpNotebook(content={
+			'Foo': '[ ] Task\n',
+			'Archive:Bar': 'no tasks\n',
+		})
+		properties = plugin.notebook_properties(notebook)
+		properties['excluded_subtrees'] = 'Archive'
+		notebook.index.check_and_update()
+
+		view = AllTasks.new_from_index(notebook.index)
+		self.assertEqual([r['description'] for r in view.list_tasks()], ['Task'])
+
+		notebook.move_page(Path('Foo'), Path('Archive:Foo'), update_links=False)
+		notebook.index.check_and_update()
+		self.assertEqual([r['description'] for r in view.list_tasks()], [])
+
 	def testTaskListTreeView(self):
 		plugin = PluginManager.load_plugin('tasklist')
 
@@ -795,6 +867,32 @@ class TestSelection(tests.TestCase):
 			{}
 		))
 
+		# Labels that are not configured for the indexer are matched on
+		# the description
+		page = notebook.get_page(Path('PageC'))
+		page.parse('wiki', '[ ] Waiting: dus\n[ ] Waitingroom\n')
+		notebook.store_page(page)
+		self.assertEqual(
+			alltasks.count_labels_and_tags_pages(('TODO', 'FIXME', 'Waiting'))[0],
+			{'TODO': 2, 'FIXME': 2, 'Waiting': 1}
+		)
+		self.assertEqual(
+			alltasks.count_labels_and_tags_pages(('TODO', 'FIXME', 'Waiting'), intersect=(('Waiting',), ()))[2],
+			{'PageC': 1}
+		)
+		notebook.delete_page(Path('PageC'))
+
+		# Tags of tasks are removed when page changes
+		page = notebook.get_page(Path('PageB:Child'))
+		page.get_parsetree() # set etag for existing file
+		page.parse('wiki', 'FIXME: dus @Foo\n')
+		notebook.store_page(page)
+		self.assertEqual(count(), (
+			{'TODO': 2, 'FIXME': 1},
+			{'__no_tags__': 3, 'bar': 4, 'Foo': 2}, # merged, keeps upper case
+			{'PageA': 4, 'PageB': 4, 'Child': 1}
+		))
+
 
 class TestUI(tests.TestCase):
 
@@ -4,7 +4,7 @@
 import tests
 
 from zim.tokenparser import *
-from zim.formats import ParseTreeBuilder
+from zim.formats import ParseTree, ParseTreeBuilder
 
 class TestTokenParser(tests.TestCase):
 
@@ -103,3 +103,45 @@ class TestFunctions(tests.TestCase):
 			tokens_to_text([('B', {}), ('T', 'Foo'), (END, 'B'), ('T', 'Bar')]),
 			'FooBar'
 		)
+
+
+class TestTokenList(tests.TestCase):
+
+	def testNewFromParseTree(self):
+		tree = tests.new_parsetree()
+		tokenlist = TokenList.new_from_parsetree(tree)
+		self.assertEqual(list(tokenlist.iter_tokens()), list(tree.iter_tokens()))
+		self.assertEqual(len(tokenlist), len(list(tree._get_tokens(tree._etree.getroot()))))
+		self.assertEqual(tokenlist.get_parsetree().tostring(), tree.tostring())
+
+	def testParseTokens(self):
+		from zim.formats import get_format
+
+		text = tests.TEST_DATA_FOLDER.file('formats/wiki.txt').read()
+		parser = get_format('wiki').Parser()
+		tree = parser.parse(text)
+		tokenlist = parser.parse_tokens(text)
+		self.assertIsInstance(tokenlist, TokenList)
+		self.assertEqual(list(tokenlist.iter_tokens()), list(tree.iter_tokens()))
+
+		dumper = get_format('wiki').Dumper()
+		self.assertEqual(dumper.dump(tokenlist), dumper.dump(tree))
+
+	def testSharedAttributes(self):
+		tokenlist = TokenList()
+		for i in range(3):
+			tokenlist.append('link', {'href': 'Foo'}, 'Foo\n')
+		tokenlist.append('link', {'href': 'Bar'}, 'Bar')
+		tokenlist.append('img', {'src': ['unhashable']})
+		tokens = list(tokenlist)
+		self.assertEqual(len(tokens), 14)
+		self.assertEqual(tokens[:3], [('link', {'href': 'Foo'}), (TEXT, 'Foo\n'), (END, 'link')])
+		self.assertIs(tokens[0][1], tokens[3][1])
+		self.assertIsNot(tokens[0][1], tokens[9][1])
+		self.assertEqual(tokens[12], ('img', {'src': ['unhashable']}))
+		self.assertEqual(list(tokenlist.iter_text()), ['Foo\n', 'Foo\n', 'Foo\n', 'Bar'])
+
+	def testNewFromTokensWithGenerator(self):
+		tree = tests.new_parsetree()
+		newtree = ParseTree.new_from_tokens(t for t in tree.iter_tokens())
+		self.assertEqual(newtree.tostring(), tree.tostring())
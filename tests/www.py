@@ -13,7 +13,7 @@ import wsgiref.validate
 import wsgiref.handlers
 import base64
 
-from zim.www import WWWInterface
+from zim.www import WWWInterface, FileChunkIterator, ThreadingWSGIServer, make_server
 from zim.notebook import Path
 
 # TODO how to test fetching from a socket while mainloop is running ?
@@ -178,3 +178,136 @@ class TestWWWInterfaceTemplateResources(TestWWWInterface):
 	def runTest(self):
 		'Test WWW interface with a template with resources.'
 		TestWWWInterface.runTest(self)
+
+
+@tests.slowTest
+class TestWWWCache(tests.TestCase):
+
+	def call(self, interface, path, **environ):
+		environ.update({
+			'REQUEST_METHOD': 'GET',
+			'SCRIPT_NAME': '',
+			'PATH_INFO': path,
+			'QUERY_STRING': '',
+			'SERVER_NAME': 'localhost',
+			'SERVER_PORT': '80',
+			'SERVER_PROTOCOL': '1.0'
+		})
+		wfile = BytesIO()
+		handler = wsgiref.handlers.SimpleHandler(BytesIO(b''), wfile, sys.stderr, environ)
+		handler.run(wsgiref.validate.validator(interface))
+		header, body = wfile.getvalue().split(b'\r\n\r\n', 1)
+		header = header.decode('UTF-8').split('\r\n')
+		headers = dict(l.split(': ', 1) for l in header[1:])
+		return header[0], headers, body
+
+	def runTest(self):
+		notebook = self.setUpNotebook(content=tests.FULL_NOTEBOOK)
+		notebook.index.check_and_update()
+		interface = WWWInterface(notebook)
+
+		rendered = []
+		orig = interface.render_page
+		def render_page(page):
+			rendered.append(page.name)
+			return orig(page)
+		interface.render_page = render_page
+
+		# Second request is served from cache
+		status, headers, body = self.call(interface, '/Test/foo.html')
+		self.assertEqual(status, 'HTTP/1.0 200 OK')
+		self.assertIn('ETag', headers)
+		etag = headers['ETag']
+		status, headers, cached = self.call(interface, '/Test/foo.html')
+		self.assertEqual(cached, body)
+		self.assertEqual(headers['ETag'], etag)
+		self.assertEqual(rendered, ['Test:foo'])
+
+		# Conditional request
+		status, headers, body = self.call(interface, '/Test/foo.html', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(status, 'HTTP/1.0 304 Not Modified')
+		self.assertEqual(body, b'')
+		status, headers, body = self.call(interface, '/Test/foo.html', HTTP_IF_NONE_MATCH='"other"')
+		self.assertEqual(status, 'HTTP/1.0 200 OK')
+
+		# Static files
+		status, headers, body = self.call(interface, '/favicon.ico')
+		self.assertIn('Last-Modified', headers)
+		status, headers, body = self.call(interface, '/favicon.ico',
+			HTTP_IF_MODIFIED_SINCE=headers['Last-Modified'])
+		self.assertEqual(status, 'HTTP/1.0 304 Not Modified')
+
+		# Index changes invalidate the cache
+		page = notebook.get_page(Path('Test:new'))
+		page.parse('wiki', 'test 123\n')
+		notebook.store_page(page)
+		status, headers, body = self.call(interface, '/Test/foo.html', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(status, 'HTTP/1.0 200 OK')
+		self.assertNotEqual(headers['ETag'], etag)
+		self.assertEqual(rendered, ['Test:foo', 'Test:foo'])
+
+
+@tests.slowTest
+class TestWWWStaticFiles(TestWWWCache):
+
+	def runTest(self):
+		from zim.config import data_file
+		notebook = self.setUpNotebook()
+		interface = WWWInterface(notebook)
+		data = data_file('pixmaps/favicon.ico').read_binary()
+		size = len(data)
+
+		status, headers, body = self.call(interface, '/favicon.ico')
+		self.assertEqual(status, 'HTTP/1.0 200 OK')
+		self.assertEqual(headers['Content-Length'], str(size))
+		self.assertEqual(headers['Accept-Ranges'], 'bytes')
+		self.assertEqual(body, data)
+
+		for range, start, end in (
+			('bytes=0-9', 0, 9),
+			('bytes=10-', 10, size - 1),
+			('bytes=-10', size - 10, size - 1),
+			('bytes=5-100000000', 5, size - 1),
+		):
+			status, headers, body = self.call(interface, '/favicon.ico', HTTP_RANGE=range)
+			self.assertEqual(status, 'HTTP/1.0 206 Partial Content')
+			self.assertEqual(headers['Content-Range'], 'bytes %i-%i/%i' % (start, end, size))
+			self.assertEqual(body, data[start:end+1])
+
+		# Multiple ranges or changed file: send all
+		for environ in (
+			{'HTTP_RANGE': 'bytes=0-9,20-29'},
+			{'HTTP_RANGE': 'bytes=0-9', 'HTTP_IF_RANGE': '"other"'},
+		):
+			status, headers, body = self.call(interface, '/favicon.ico', **environ)
+			self.assertEqual(status, 'HTTP/1.0 200 OK')
+			self.assertEqual(body, data)
+
+		with tests.LoggingFilter('zim.www', '416'):
+			status, headers, body = self.call(interface, '/favicon.ico', HTTP_RANGE='bytes=%i-' % size)
+		self.assertEqual(status, 'HTTP/1.0 416 Range Not Satisfiable')
+		self.assertEqual(headers['Content-Range'], 'bytes */%i' % size)
+
+		# Files are send in chunks
+		iter = FileChunkIterator(BytesIO(data), size - 1, chunk_size=100)
+		chunks = list(iter)
+		iter.close()
+		self.assertTrue(all(len(c) <= 100 for c in chunks))
+		self.assertEqual(b''.join(chunks), data[:-1])
+
+
+class TestMakeServer(tests.TestCase):
+
+	def runTest(self):
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_REAL)
+		self.assertNotEqual(notebook.index.dbpath, ':memory:')
+		httpd = make_server(notebook, port=0, public=False, threaded=True)
+		self.addCleanup(httpd.server_close)
+		self.assertIsInstance(httpd, ThreadingWSGIServer)
+
+		# In-memory index can not be shared with request threads
+		notebook = self.setUpNotebook(mock=tests.MOCK_ALWAYS_MOCK)
+		self.assertEqual(notebook.index.dbpath, ':memory:')
+		httpd = make_server(notebook, port=0, public=False, threaded=True)
+		self.addCleanup(httpd.server_close)
+		self.assertNotIsInstance(httpd, ThreadingWSGIServer)
@@ -0,0 +1,306 @@
+#!/usr/bin/python3
+
+# Copyright 2026 agent <agent@local>
+
+'''Benchmark for the index and the operations that depend on it
+
+Generates a synthetic notebook and times indexing, searching, listing
+links and exporting. Results are written as JSON, so they can be
+compared between releases.
+
+Usage: tools/benchmark_index.py [OPTIONS]
+Run with "--help" for the options.
+'''
+
+import sys
+import os
+
+ZIM_SOURCE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ZIM_SOURCE)
+
+import json
+import time
+import math
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+
+import zim
+zim.ZIM_EXECUTABLE = os.path.join(ZIM_SOURCE, 'zim.py') # use data dir of the source tree
+
+from zim.newfs import LocalFolder
+from zim.notebook import Path, init_notebook
+from zim.notebook.notebook import Notebook
+from zim.plugins import PluginManager
+from zim.search import SearchSelection, Query
+from zim.export import build_notebook_exporter
+from zim.export.selections import AllPages
+
+
+WORDS = (
+	'lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing',
+	'elit', 'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore',
+	'et', 'dolore', 'magna', 'aliqua', 'enim', 'ad', 'minim', 'veniam',
+	'quis', 'nostrud', 'exercitation', 'ullamco', 'laboris', 'nisi',
+)
+
+SEARCH_QUERIES = (
+	'lorem', # common word, all pages
+	'Page1*', # wildcard, matches page names
+	'"magna aliqua"', # phrase, needs content regex
+	'@tag1', # tag
+	'LinksTo: Page1', # links
+	'Section: Page1 ipsum', # namespace plus content
+)
+
+
+def _count(rng, density):
+	# Random count with "density" as average
+	n = int(density)
+	if rng.random() < density - n:
+		n += 1
+	return n
+
+
+def generate_names(rng, n_pages, depth):
+	'''Generate page names for a notebook with C{n_pages} pages in a
+	hierarchy of at most C{depth} levels
+	@returns: a list of page names
+	'''
+	width = max(2, int(math.ceil(n_pages ** (1.0 / max(depth, 1)))))
+	names = []
+	parents = [''] # namespaces that can get more children
+	children = {'': 0}
+	while len(names) < n_pages:
+		parent = parents[0]
+		name = '%s:Page%i' % (parent, len(names) + 1) if parent else 'Page%i' % (len(names) + 1)
+		names.append(name)
+		children[parent] += 1
+		if children[parent] >= width:
+			parents.pop(0)
+		if name.count(':') + 1 < depth:
+			parents.append(name)
+			children[name] = 0
+	return names
+
+
+def generate_page(rng, name, names, n_tags, links, tags, tasks, lines):
+	'''Generate the content of a page
+	@returns: the page content as wiki text
+	'''
+	text = [
+		'Content-Type: text/x-zim-wiki\n',
+		'Wiki-Format: zim 0.6\n',
+		'\n',
+		'====== %s ======\n' % name.split(':')[-1],
+	]
+
+	for i in range(lines):
+		words = rng.sample(WORDS, 10)
+		text.append(' '.join(words) + '\n')
+	text.append('\n')
+
+	for i in range(_count(rng, links)):
+		target = rng.choice(names)
+		if rng.random() < 0.5:
+			text.append('[[%s]] ' % target.split(':')[-1]) # floating link
+		else:
+			text.append('[[:%s]] ' % target)
+	for i in range(_count(rng, tags)):
+		text.append('@tag%i ' % rng.randint(1, n_tags))
+	text.append('\n\n')
+
+	n = _count(rng, tasks)
+	if n:
+		text.append('TODO:\n')
+		for i in range(n):
+			text.append('[ ] %s task %i %s\n' % (rng.choice(WORDS), i, '!' * rng.randint(0, 2)))
+		text.append('\n')
+
+	return ''.join(text)
+
+
+def generate_notebook(folder, options):
+	'''Generate a synthetic notebook
+	@param folder: a L{LocalFolder} for the notebook, must not exist
+	@param options: the command line options
+	@returns: a list of the page names
+	'''
+	rng = random.Random(options.seed)
+	init_notebook(folder, name='Benchmark')
+	names = generate_names(rng, options.pages, options.depth)
+	n_tags = max(10, options.pages // 10)
+	for name in names:
+		file = folder.file(name.replace(':', '/') + '.txt')
+		file.write(generate_page(
+			rng, name, names, n_tags,
+			options.links, options.tags, options.tasks, options.lines
+		))
+	return names
+
+
+class Timer(object):
+	'''Collects timings for named operations'''
+
+	def __init__(self):
+		self.results = {}
+
+	def time(self, name, func, repeat=1, count=None):
+		'''Time a function
+		@param name: the name for the result
+		@param func: the function to call, takes no arguments
+		@param repeat: the number of times to call the function, the
+		fastest run is reported
+		@param count: the number of items processed by one call, used to
+		report throughput
+		@returns: the return value of the last call
+		'''
+		times = []
+		for i in range(repeat):
+			start = time.perf_counter()
+			value = func()
+			times.append(time.perf_counter() - start)
+
+		result = {
+			'seconds': min(times),
+			'max_seconds': max(times),
+			'repeat': repeat,
+		}
+		if count:
+			result['count'] = count
+			result['per_second'] = count / min(times) if min(times) > 0 else None
+		self.results[name] = result
+		print('%-40s %10.4f s' % (name, min(times)), file=sys.stderr)
+		return value
+
+
+def run_benchmark(options):
+	tmpdir = tempfile.mkdtemp(prefix='zim-benchmark-')
+	try:
+		return _run_benchmark(options, tmpdir)
+	finally:
+		if options.keep:
+			print('Notebook kept in: %s' % tmpdir, file=sys.stderr)
+		else:
+			shutil.rmtree(tmpdir)
+
+
+def _run_benchmark(options, tmpdir):
+	timer = Timer()
+	folder = LocalFolder(tmpdir).folder('notebook')
+	names = timer.time('generate', lambda: generate_notebook(folder, options), count=options.pages)
+
+	plugins = []
+	for name in options.plugin:
+		try:
+			PluginManager.load_plugin(name)
+		except Exception:
+			logging.exception('Could not load plugin: %s', name)
+		else:
+			plugins.append(name)
+
+	notebook = Notebook.new_from_dir(folder)
+	index = notebook.index
+	jobs = options.jobs
+
+	def update():
+		index.flush()
+		index.update(jobs)
+
+	timer.time('index.update', update, count=len(names))
+	timer.time('index.check_and_update.unchanged',
+		lambda: index.check_and_update(jobs), repeat=options.repeat, count=len(names))
+
+	rng = random.Random(options.seed)
+	changed = rng.sample(names, max(1, len(names) // 100))
+	for name in changed:
+		file = folder.file(name.replace(':', '/') + '.txt')
+		file.write(file.read() + 'changed %s\n' % rng.choice(WORDS))
+	timer.time('index.check_and_update.changed',
+		lambda: index.check_and_update(jobs), count=len(changed))
+
+	for string in SEARCH_QUERIES:
+		def search():
+			selection = SearchSelection(notebook)
+			selection.search(Query(string))
+			return selection
+		selection = timer.time('search: %s' % string, search, repeat=options.repeat)
+		timer.results['search: %s' % string]['matches'] = len(selection)
+
+	paths = [Path(name) for name in names]
+	def list_links():
+		n = 0
+		for path in paths:
+			for link in notebook.links.list_links(path):
+				n += 1
+		return n
+	n_links = timer.time('links.list_links', list_links, repeat=options.repeat, count=len(paths))
+	timer.results['links.list_links']['links'] = n_links
+
+	if not options.no_export:
+		def export():
+			output = LocalFolder(tmpdir).folder('export')
+			if output.exists():
+				output.remove_children()
+				output.remove()
+			exporter = build_notebook_exporter(output, 'html', 'Default')
+			exporter.export(AllPages(notebook))
+		timer.time('export.html', export, count=len(names))
+
+	return {
+		'zim_version': zim.__version__,
+		'python_version': platform.python_version(),
+		'platform': platform.platform(),
+		'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'parameters': {
+			'pages': options.pages,
+			'depth': options.depth,
+			'links': options.links,
+			'tags': options.tags,
+			'tasks': options.tasks,
+			'lines': options.lines,
+			'seed': options.seed,
+			'jobs': options.jobs,
+			'plugins': plugins,
+		},
+		'results': timer.results,
+	}
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(
+		description='Benchmark indexing, search and export on a synthetic notebook'
+	)
+	parser.add_argument('--pages', type=int, default=1000, help='number of pages (default: 1000)')
+	parser.add_argument('--depth', type=int, default=3, help='maximum namespace depth (default: 3)')
+	parser.add_argument('--links', type=float, default=5, help='average number of links per page (default: 5)')
+	parser.add_argument('--tags', type=float, default=1, help='average number of tags per page (default: 1)')
+	parser.add_argument('--tasks', type=float, default=1, help='average number of tasks per page (default: 1)')
+	parser.add_argument('--lines', type=int, default=20, help='lines of text per page (default: 20)')
+	parser.add_argument('--seed', type=int, default=1, help='seed for the random generator (default: 1)')
+	parser.add_argument('--jobs', type=int, default=None, help='number of processes used to parse pages when indexing')
+	parser.add_argument('--repeat', type=int, default=3, help='repeat read-only operations, report the fastest (default: 3)')
+	parser.add_argument('--plugin', action='append', default=None, help='plugin to load, can be repeated (default: tasklist)')
+	parser.add_argument('--no-export', action='store_true', help='skip the export benchmark')
+	parser.add_argument('--keep', action='store_true', help='do not remove the generated notebook')
+	parser.add_argument('--output', '-o', help='file to write the JSON results to (default: stdout)')
+	options = parser.parse_args(argv)
+	if options.plugin is None:
+		options.plugin = ['tasklist']
+
+	logging.basicConfig(level=logging.WARNING)
+	results = run_benchmark(options)
+
+	data = json.dumps(results, indent=2, sort_keys=True)
+	if options.output:
+		with open(options.output, 'w') as fh:
+			fh.write(data + '\n')
+	else:
+		print(data)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -4,6 +4,7 @@
 from functools import partial
 
 import logging
+import concurrent.futures
 
 logger = logging.getLogger('zim.export')
 
@@ -16,15 +17,18 @@ from zim.formats import get_format
 from zim.export.exporters import Exporter, createIndexPage
 from zim.export.linker import ExportLinker
 from zim.export.template import ExportTemplateContext
+from zim.export.manifest import ExportManifest, MANIFEST_FILE, template_uses_index
 
 from zim.fs import adapt_from_oldfs
-from zim.newfs import FileNotFoundError, LocalFolder
+from zim.newfs import FileNotFoundError, LocalFolder, LocalFile
 
 
 
 class FilesExporterBase(Exporter):
 	'''Base class for exporters that export to files'''
 
+	incremental = False #: if C{True} only changed files are exported
+
 	def __init__(self, layout, template, format, document_root_url=None):
 		'''Constructor
 		@param layout: a L{ExportLayout} to map pages to files
@@ -47,6 +51,10 @@ class FilesExporterBase(Exporter):
 					yield file
 					targetfile = target.file(file.basename)
 					if targetfile.exists():
+						if self.incremental \
+						and targetfile.size() == file.size() \
+						and targetfile.mtime() == file.mtime():
+							continue # copy keeps the mtime, so unchanged
 						targetfile.remove() # Export does overwrite by default
 					file.copyto(targetfile)
 		except FileNotFoundError:
@@ -76,15 +84,23 @@ class FilesExporterBase(Exporter):
 class MultiFileExporter(FilesExporterBase):
 	'''Exporter that exports each page to a single file'''
 
-	def __init__(self, layout, template, format, index_page=None, document_root_url=None):
+	def __init__(self, layout, template, format, index_page=None, document_root_url=None, jobs=None, incremental=False):
 		'''Constructor
 		@param layout: a L{ExportLayout} to map pages to files
 		@param template: a L{Template} object
 		@param format: the format for the file content
 		@param index_page: a page to output the index or C{None}
 		@param document_root_url: optional URL for the document root
+		@param jobs: number of worker processes used to export pages, if
+		C{None} or C{1} all pages are exported in the current process,
+		see L{PageExportPool}
+		@param incremental: if C{True} only export pages that changed
+		since the previous export to the same folder, see
+		L{ExportManifest}
 		'''
 		FilesExporterBase.__init__(self, layout, template, format, document_root_url)
+		self.jobs = jobs
+		self.incremental = incremental
 		if index_page:
 			if isinstance(index_page, str):
 				self.index_page = Path(Path.makeValidPageName(index_page))
@@ -97,17 +113,33 @@ class MultiFileExporter(FilesExporterBase):
 	def export_iter(self, pages):
 		self.export_resources()
 
-		for prev, page, next in MovingWindowIter(pages):
-			yield page
-			try:
-				self.export_page(pages.notebook, page, pages, prevpage=prev, nextpage=next)
-					# XXX FIXME remove need for notebook here
-				for file in self.export_attachments_iter(pages.notebook, page):
-					yield file
-					# XXX FIXME remove need for notebook here
-			except:
-				raise
-				logger.exception('Error while exporting: %s', page.name)
+		manifest = self._open_manifest(pages) if self.incremental else None
+		windows = self._windows_iter(pages, manifest)
+		try:
+			if self.jobs and self.jobs > 1 and PageExportPool.can_export(self, pages):
+				with PageExportPool(self, pages, self.jobs) as pool:
+					for item in pool.export_iter(windows):
+						if manifest and isinstance(item, Path):
+							manifest.commit_page(item)
+						yield item
+			else:
+				for prev, page, next, export in windows:
+					yield page
+					try:
+						if export:
+							self.export_page(pages.notebook, page, pages, prevpage=prev, nextpage=next)
+								# XXX FIXME remove need for notebook here
+						for file in self.export_attachments_iter(pages.notebook, page):
+							yield file
+							# XXX FIXME remove need for notebook here
+					except:
+						raise
+						logger.exception('Error while exporting: %s', page.name)
+					if manifest:
+						manifest.commit_page(page)
+		finally:
+			if manifest:
+				manifest.write()
 
 		if self.index_page:
 			try:
@@ -117,6 +149,26 @@ class MultiFileExporter(FilesExporterBase):
 			except:
 				logger.exception('Error while exporting index')
 
+	def _open_manifest(self, pages):
+		settings = {
+			'layout': [self.layout.__class__.__name__, str(self.layout.namespace)],
+			'template': str(self.template.parts),
+			'format': self.format.__name__,
+			'index_page': self.index_page.name if self.index_page else None,
+			'document_root_url': self.document_root_url,
+			'pages': [p.name for p in pages] if template_uses_index(self.template) else None,
+		}
+		return ExportManifest(self.layout.dir.file(MANIFEST_FILE), settings)
+
+	def _windows_iter(self, pages, manifest):
+		# Yields 4-tuples of previous page, page, next page and a flag
+		# whether the page needs to be exported
+		for prev, page, next in MovingWindowIter(pages):
+			export = manifest is None \
+				or manifest.check_page(pages.notebook, page, prev, next) \
+				or not self.layout.page_file(page).exists()
+			yield prev, page, next, export
+
 	def export_page(self, notebook, page, pages, prevpage=None, nextpage=None):
 		# XXX FIXME remove need for notebook here
 
@@ -158,6 +210,150 @@ class MultiFileExporter(FilesExporterBase):
 		self.export_page(pages.notebook, page, pages)
 
 
+_worker = None # exporter and selection in a worker process
+
+
+def _init_export_worker(folderpath, dbpath, selection, exporter, plugins):
+	# Runs in a worker process of the L{PageExportPool}, on first use
+	global _worker
+	from zim.notebook import Notebook
+	from zim.templates import Template
+	from zim.plugins import PluginManager
+
+	# Plugins can define objects that are part of the output, load the
+	# same plugins as the main process - with "fork" they are already
+	# loaded and this is a no-op
+	PluginManager.load_plugins_from_preferences(plugins)
+
+	notebook = Notebook.new_for_reading(LocalFolder(folderpath), dbpath)
+	selection_class, path = selection
+	pages = selection_class(notebook) if path is None else selection_class(notebook, path)
+
+	layout, template, format, index_page, document_root_url, incremental = exporter
+	exporter = MultiFileExporter(
+		layout, Template(LocalFile(template)), format,
+		index_page=index_page, document_root_url=document_root_url,
+		incremental=incremental
+	)
+	_worker = (exporter, pages)
+
+
+def _export_pages(spec, batch):
+	# Runs in a worker process of the L{PageExportPool}, each pool
+	# has its own processes, so the spec is the same for all calls.
+	# Returns for each page the names of the attachments
+	if _worker is None:
+		_init_export_worker(*spec)
+	exporter, pages = _worker
+	notebook = pages.notebook
+	attachments = []
+	for prev, name, next, export in batch:
+		page = notebook.get_page(Path(name))
+		if export:
+			exporter.export_page(notebook, page, pages,
+				prevpage=Path(prev) if prev else None,
+				nextpage=Path(next) if next else None,
+			)
+		attachments.append([file.basename for file in exporter.export_attachments_iter(notebook, page)])
+	return attachments
+
+
+class PageExportPool(object):
+	'''Pool of worker processes that export pages for a
+	L{MultiFileExporter} in parallel. Each worker opens the notebook
+	with a read-only index connection and loads its own copy of the
+	template, and loads the same plugins as the main process. The main
+	process determines the order of the pages, so the output is the
+	same as for a serial export.
+	'''
+
+	BATCH_SIZE = 20 #: number of pages per task for a worker
+
+	def __init__(self, exporter, pages, jobs=None):
+		'''Constructor
+		@param exporter: a L{MultiFileExporter}
+		@param pages: a L{PageSelection}, must be supported by
+		L{can_export()}
+		@param jobs: number of worker processes, defaults to the number
+		of processors
+		'''
+		from zim.export.selections import SinglePage
+		from zim.plugins import PluginManager
+		notebook = pages.notebook
+		selection = (pages.__class__, pages.page if isinstance(pages, SinglePage) else None)
+		spec = (
+			exporter.layout, exporter.template.filename,
+			exporter.format.__name__.rsplit('.', 1)[-1],
+			exporter.index_page, exporter.document_root_url,
+			exporter.incremental
+		)
+		plugins = list(PluginManager)
+		self._spec = (notebook.folder.path, notebook.index.dbpath, selection, spec, plugins)
+		self._notebook = notebook
+		self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+		self._pending = [] # 2-tuples of future and pages, in order
+
+	@staticmethod
+	def can_export(exporter, pages):
+		'''Check whether an export can be done by worker processes. This
+		requires a notebook on the local file system with an index on
+		disk, a template file and one of the standard page selections.
+		@param exporter: a L{MultiFileExporter}
+		@param pages: a L{PageSelection}
+		@returns: C{True} if supported
+		'''
+		from zim.export.selections import AllPages, SinglePage, SubPages
+		notebook = pages.notebook
+		return type(pages) in (AllPages, SinglePage, SubPages) \
+			and isinstance(notebook.folder, LocalFolder) \
+			and notebook.index.dbpath != ':memory:' \
+			and LocalFile(exporter.template.filename).exists()
+
+	def export_iter(self, windows):
+		'''Export pages while yielding the pages that are done, each page
+		is followed by its attachments, like for a serial export
+		@param windows: iterable of 4-tuples of the previous page, the
+		page, the next page and a flag whether the page itself needs to
+		be exported, if not only the attachments are updated
+		'''
+		pending = self._pending
+		batch, batch_pages = [], []
+		for prev, page, next, export in windows:
+			batch.append((prev.name if prev else None, page.name, next.name if next else None, export))
+			batch_pages.append(page)
+			if len(batch) == self.BATCH_SIZE:
+				pending.append((self._executor.submit(_export_pages, self._spec, batch), batch_pages))
+				batch, batch_pages = [], []
+				yield from self._collect(pending, wait=False)
+
+		if batch:
+			pending.append((self._executor.submit(_export_pages, self._spec, batch), batch_pages))
+		yield from self._collect(pending, wait=True)
+
+	def _collect(self, pending, wait):
+		# Yield pages for finished batches, keeping the order
+		while pending and (wait or pending[0][0].done()):
+			future, pages = pending.pop(0)
+			attachments = future.result() # raises error from worker
+			for page, names in zip(pages, attachments):
+				yield page
+				folder = self._notebook.get_attachments_dir(page)
+				for name in names:
+					yield folder.file(name)
+
+	def close(self):
+		for future, pages in self._pending:
+			future.cancel()
+		self._pending = []
+		self._executor.shutdown()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *a):
+		self.close()
+
+
 class SingleFileExporter(FilesExporterBase):
 	'''Exporter that exports all page to the same file'''
 
@@ -0,0 +1,156 @@
+# Copyright 2026 agent <agent@local>
+
+'''The export manifest records the inputs used for each page of a
+previous export, this allows an incremental export to skip pages for
+which none of the inputs changed.
+
+The inputs of a page are the source file, the template and export
+options, the previous and next page, the pages that it links to, the
+pages that link to it and the list of attachments. When the template
+uses the C{index()} function also the list of all pages in the
+selection is an input for each page.
+'''
+
+import json
+import hashlib
+import logging
+
+from zim.parser import SimpleTreeElement
+from zim.templates.expression import Expression
+from zim.notebook.index import IndexNotFoundError, LINK_DIR_FORWARD, LINK_DIR_BACKWARD
+
+
+logger = logging.getLogger('zim.export')
+
+
+MANIFEST_FILE = '.zim-export-manifest.json' #: name of the manifest file in the output folder
+MANIFEST_VERSION = 1
+
+
+def _hash(data):
+	return hashlib.md5(
+		json.dumps(data, separators=(',', ':')).encode('UTF-8')
+	).hexdigest()
+
+
+def template_uses_index(template):
+	'''Check whether a template calls the C{index()} function. Templates
+	that include other files are assumed to use it.
+	@param template: a L{Template} object
+	@returns: C{True} if the output of the template depends on the
+	list of pages in the export
+	'''
+	def check(parts):
+		for node in parts:
+			if isinstance(node, SimpleTreeElement):
+				if node.tag == 'INCLUDE':
+					return True
+				for value in (node.attrib or {}).values():
+					if isinstance(value, Expression) and 'CALL(index:' in value.pprint():
+						return True
+				if check(node):
+					return True
+		return False
+
+	return check(template.parts)
+
+
+class ExportManifest(object):
+	'''Keeps track of the state of all pages in an export folder
+
+	The manifest is read from the output folder when constructed. For
+	each page L{check_page()} tells whether the page needs to be
+	exported, after a page is exported L{commit_page()} records the new
+	state. Finally L{write()} saves the manifest, only pages that were
+	committed in this run are kept.
+	'''
+
+	def __init__(self, file, settings):
+		'''Constructor
+		@param file: a L{File} object for the manifest
+		@param settings: a json serializable object with the export
+		options that apply to all pages, like the template and format.
+		If these differ from the previous export all pages are exported
+		'''
+		self.file = file
+		self.settings = _hash(settings)
+		self._pages = {} # state of previous export
+		self._checked = {} # state of pages checked, but not yet committed
+		self._committed = {} # state for pages exported in this run
+
+		try:
+			data = json.loads(file.read())
+		except Exception:
+			if file.exists():
+				logger.warning('Could not read export manifest: %s', file)
+		else:
+			if isinstance(data, dict) \
+			and data.get('version') == MANIFEST_VERSION \
+			and data.get('settings') == self.settings:
+				self._pages = data.get('pages', {})
+
+	def check_page(self, notebook, page, prevpage=None, nextpage=None):
+		'''Check whether a page changed since the previous export
+		@param notebook: the L{Notebook}
+		@param page: the L{Page} object
+		@param prevpage: the previous page in the export or C{None}
+		@param nextpage: the next page in the export or C{None}
+		@returns: C{True} if the page needs to be exported
+		'''
+		old = self._pages.get(page.name)
+		state = {
+			'source': self._source_state(page, old),
+			'inputs': self._inputs_state(notebook, page, prevpage, nextpage),
+		}
+		self._checked[page.name] = state
+		return old is None \
+			or old['source'][1] != state['source'][1] \
+			or old['inputs'] != state['inputs']
+
+	def commit_page(self, page):
+		'''Record the state of a page that was exported
+		@param page: the L{Page} object, must have been checked
+		with L{check_page()}
+		'''
+		self._committed[page.name] = self._checked.pop(page.name)
+
+	def _source_state(self, page, old):
+		# Returns 2-tuple of mtime and hash, if the mtime did not change
+		# the file is not read again.
+		file = page.source_file
+		if not file.exists():
+			return (None, None)
+
+		mtime = file.mtime()
+		if old and old['source'][0] == mtime:
+			return old['source']
+		else:
+			return (mtime, hashlib.md5(file.read_binary()).hexdigest())
+
+	def _inputs_state(self, notebook, page, prevpage, nextpage):
+		try:
+			links = sorted(l.target.name for l in notebook.links.list_links(page, LINK_DIR_FORWARD))
+			backlinks = sorted(l.source.name for l in notebook.links.list_links(page, LINK_DIR_BACKWARD))
+		except IndexNotFoundError:
+			links, backlinks = [], []
+
+		attachments = []
+		folder = notebook.get_attachments_dir(page)
+		if folder.exists():
+			for file in folder.list_files():
+				attachments.append((file.basename, file.size(), file.mtime()))
+			attachments.sort()
+
+		return _hash([
+			prevpage.name if prevpage else None,
+			nextpage.name if nextpage else None,
+			links, backlinks, attachments
+		])
+
+	def write(self):
+		'''Write the manifest file'''
+		self.file.write(json.dumps({
+			'version': MANIFEST_VERSION,
+			'settings': self.settings,
+			'pages': self._committed,
+		}, separators=(',', ':'), sort_keys=True))
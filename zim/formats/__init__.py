@@ -294,6 +294,38 @@ def heading_to_anchor(name):
 	return re.sub(r'[^\w\-_]', '', name)
 
 
+def iter_page_hrefs(hrefs, include_anchors=False):
+	'''Generator for links to pages, used by L{ParseTree.iter_href()}
+	@param hrefs: iterable with link targets as strings, can contain C{None}
+	@param include_anchors: if C{False} remove the target location from the
+	link and only yield unique links to pages
+	@returns: yields a list of unique L{HRef} objects
+	'''
+	from zim.notebook.page import HRef # XXX
+
+	seen = set()
+	for href in hrefs:
+		if not href or link_type(href) != 'page':
+			continue
+
+		try:
+			href_obj = HRef.new_from_wiki_link(href)
+		except ValueError:
+			continue
+
+		if not include_anchors:
+			if not href_obj.names:
+				continue # internal link within same page
+			elif href_obj.anchor:
+				href_obj.anchor = None
+				href = href_obj.to_wiki_link()
+
+		if href in seen:
+			continue
+		seen.add(href)
+		yield href_obj
+
+
 TokenListElement = collections.namedtuple('TokenListElement', ('tag', 'attrib', 'content'))
 
 
@@ -313,11 +345,20 @@ class ParseTree(object):
 	@classmethod
 	def new_from_tokens(klass, tokens):
 		from zim.tokenparser import TokenParser
-		tokens = list(tokens) # TODO: allow efficient use of generator here ?
-		assert tokens
-		if tokens[0][0] != FORMATTEDTEXT:
-			tokens.insert(0, (FORMATTEDTEXT, None))
-			tokens.append((END, FORMATTEDTEXT))
+		token_iter = iter(tokens)
+		try:
+			first = next(token_iter)
+		except StopIteration:
+			raise AssertionError('Empty token list')
+
+		if first[0] == FORMATTEDTEXT:
+			tokens = itertools.chain((first,), token_iter)
+		else:
+			tokens = itertools.chain(
+				((FORMATTEDTEXT, None), first),
+				token_iter,
+				((END, FORMATTEDTEXT),)
+			)
 
 		builder = ParseTreeBuilder()
 		parser = TokenParser(builder)
@@ -397,25 +438,82 @@ class ParseTree(object):
 		return ParseTree().fromstring(self.tostring())
 
 	def iter_tokens(self):
-		from zim.tokenparser import topLevelLists
-
-		return iter(topLevelLists(self._get_tokens(self._etree.getroot())))
-
-	def _get_tokens(self, node):
-		tokens = [(node.tag, node.attrib.copy())]
-
+		from zim.tokenparser import iterTopLevelLists
+
+		return iterTopLevelLists(self._get_tokens(self._etree.getroot()))
+
+	def iter_chunks(self, n_lines, first_n_lines=None):
+		'''Split the tree in a sequence of smaller trees, e.g. to load a
+		large page in steps. Trees are only split after a line end in a
+		top level paragraph, other elements like lists, tables and
+		verbatim blocks are never split.
+		@param n_lines: the minimum number of lines per tree
+		@param first_n_lines: the number of lines in the first tree,
+		defaults to C{n_lines}
+		@returns: yields L{ParseTree} objects, at least one
+		'''
+		tokens = self.iter_tokens()
+		root = next(tokens)
+		chunk = [root]
+		stack = []
+		has_content = False
+		lines = 0
+		limit = first_n_lines or n_lines
+		for t in tokens:
+			if t[0] == END:
+				if not stack:
+					break # end of root
+				stack.pop()
+			elif t[0] == TEXT:
+				has_content = True
+				if t[1].endswith('\n'):
+					lines += 1
+			else:
+				has_content = True
+				stack.append(t)
+			chunk.append(t)
+
+			if lines >= limit and t[0] == TEXT and t[1].endswith('\n') \
+				and (not stack or (len(stack) == 1 and stack[0][0] == PARAGRAPH)):
+					chunk.extend((END, s[0]) for s in reversed(stack))
+					chunk.append((END, root[0]))
+					yield self.new_from_tokens(chunk)
+
+					chunk = [(root[0], root[1].copy())]
+					chunk.extend((s[0], s[1].copy()) for s in stack)
+					has_content = False
+					lines = 0
+					limit = n_lines
+
+		if has_content or len(chunk) == 1:
+			chunk.extend((END, s[0]) for s in reversed(stack))
+			chunk.append((END, root[0]))
+			yield self.new_from_tokens(chunk)
+
+	def _get_tokens(self, node, copy_attrib=True):
+		# Walk the tree without recursion and without building a list,
+		# so large trees can be streamed
+		yield (node.tag, node.attrib.copy() if copy_attrib else node.attrib)
 		if node.text:
 			for t in node.text.splitlines(True):
-				tokens.append((TEXT, t))
-
-		for child in node:
-			tokens.extend(self._get_tokens(child)) # recurs
-			if child.tail:
-				for t in child.tail.splitlines(True):
-					tokens.append((TEXT, t))
-
-		tokens.append((END, node.tag))
-		return tokens
+				yield (TEXT, t)
+
+		stack = [(node, iter(node))]
+		while stack:
+			parent, children = stack[-1]
+			for child in children:
+				yield (child.tag, child.attrib.copy() if copy_attrib else child.attrib)
+				if child.text:
+					for t in child.text.splitlines(True):
+						yield (TEXT, t)
+				stack.append((child, iter(child)))
+				break
+			else:
+				stack.pop()
+				yield (END, parent.tag)
+				if parent.tail and stack:
+					for t in parent.tail.splitlines(True):
+						yield (TEXT, t)
 
 	def iter_href(self, include_page_local_links=False, include_anchors=False):
 		'''Generator for links in the text
@@ -423,33 +521,15 @@ class ParseTree(object):
 		link and only yield unique links to pages
 		@returns: yields a list of unique L{HRef} objects
 		'''
-		from zim.notebook.page import HRef # XXX
-
-		seen = set()
-		for elt in itertools.chain(
-			self._etree.iter(LINK),
-			self._etree.iter(IMAGE)
-		):
-			href = elt.attrib.get('href')
-			if not href or link_type(href) != 'page':
-				continue
-
-			try:
-				href_obj = HRef.new_from_wiki_link(href)
-			except ValueError:
-				continue
-
-			if not include_anchors:
-				if not href_obj.names:
-					continue # internal link within same page
-				elif href_obj.anchor:
-					href_obj.anchor = None
-					href = href_obj.to_wiki_link()
-
-			if href in seen:
-				continue
-			seen.add(href)
-			yield href_obj
+		return iter_page_hrefs(
+			(
+				elt.attrib.get('href') for elt in itertools.chain(
+					self._etree.iter(LINK),
+					self._etree.iter(IMAGE)
+				)
+			),
+			include_anchors
+		)
 
 	def iter_tag_names(self):
 		'''Generator for tags in the page content
@@ -573,15 +653,22 @@ class ParseTree(object):
 		in this tree.
 		'''
 		count = 0
+		for text in self.iter_text():
+			newstring, n = regex.subn('', text)
+			count += n
+
+		return count
+
+	def iter_text(self):
+		'''Generator for all text in this tree, yields the text and tail
+		of each element in document order. This is the text that is matched
+		by L{countre()}.
+		'''
 		for element in self._etree.iter():
 			if element.text:
-				newstring, n = regex.subn('', element.text)
-				count += n
+				yield element.text
 			if element.tail:
-				newstring, n = regex.subn('', element.tail)
-				count += n
-
-		return count
+				yield element.tail
 
 	def get_ends_with_newline(self):
 		'''Checks whether this tree ends in a newline or not'''
@@ -780,6 +867,14 @@ class BackwardParseTreeBuilderWithCleanup(object):
 		if tag != '_ignore_':
 			self._tokens.append((END, tag))
 
+	def get_tokens(self):
+		'''Returns the list of tokens collected so far, before clean up'''
+		return self._tokens
+
+	def extend(self, tokens):
+		'''Append tokens as returned by L{get_tokens()}'''
+		self._tokens.extend(tokens)
+
 	def close(self):
 		_pop_empty_head_and_linke(self._tokens)
 		tokens = list(strip_whitespace(iter(self._tokens)))
@@ -899,6 +994,17 @@ class ParserClass(object):
 		'''
 		raise NotImplementedError
 
+	def parse_tokens(self, input, *arg, **kwarg):
+		'''Like L{parse()} but returns a L{TokenList} instead of a
+		L{ParseTree}. This is more compact for large content that is only
+		used as a stream of tokens, e.g. for dumping or indexing.
+
+		Default implementation converts the result of L{parse()}, parsers
+		can overload this method to build the token list directly.
+		'''
+		from zim.tokenparser import TokenList
+		return TokenList.new_from_parsetree(self.parse(input, *arg, **kwarg))
+
 	@classmethod
 	def parse_image_url(self, url):
 		'''Parse urls style options for images like "foo.png?width=500" and
@@ -985,7 +1091,7 @@ class DumperClass(object):
 
 	def dump(self, tree):
 		'''Format a parsetree to text
-		@param tree: a C{ParseTree} object
+		@param tree: a C{ParseTree} object, or a L{TokenList}
 		@returns: a list of lines
 		'''
 		# FIXME - issue here is that we need to reset state - should be in __init__
@@ -15,6 +15,7 @@ from zim.parsing import url_encode, URL_ENCODE_DATA, \
 from zim.parsing import url_re as old_url_re
 from zim.formats import *
 from zim.formats.plain import Dumper as TextDumper
+from zim.tokenparser import TokenList
 
 old_url_re = old_url_re.p
 
@@ -626,6 +627,19 @@ class Parser(ParserClass):
 		self.version = version
 
 	def parse(self, input, file_input=False):
+		builder = ParseTreeBuilder()
+		meta = self._parse(builder, input, file_input)
+		parsetree = builder.get_parsetree()
+		parsetree.meta.update(meta)
+		return parsetree
+
+	def parse_tokens(self, input, file_input=False):
+		builder = TokenList()
+		meta = self._parse(builder, input, file_input)
+		builder.meta.update(meta)
+		return builder
+
+	def _parse(self, builder, input, file_input):
 		if not isinstance(input, str):
 			input = ''.join(input)
 
@@ -646,20 +660,17 @@ class Parser(ParserClass):
 		else:
 			mywikiparser = WikiParser(backward_indented_blocks=True, backward_url_parsing=True)
 
-		builder = ParseTreeBuilder()
 		mywikiparser(builder, input)
 
-		parsetree = builder.get_parsetree()
-		if meta is not None:
-			for k, v in list(meta.items()):
-				# Skip headers that are only interesting for the parser
-				#
-				# Also remove "Modification-Date" here because it causes conflicts
-				# when merging branches with version control, use mtime from filesystem
-				# If we see this header, remove it because it will not be updated.
-				if k not in ('Content-Type', 'Wiki-Format', 'Modification-Date'):
-					parsetree.meta[k] = v
-		return parsetree
+		# Skip headers that are only interesting for the parser
+		#
+		# Also remove "Modification-Date" here because it causes conflicts
+		# when merging branches with version control, use mtime from filesystem
+		# If we see this header, remove it because it will not be updated.
+		return [
+			(k, v) for k, v in (meta or {}).items()
+				if k not in ('Content-Type', 'Wiki-Format', 'Modification-Date')
+		]
 
 
 class Dumper(TextDumper):
@@ -944,7 +944,7 @@ class PageView(GSignalEmitterMixin, Gtk.VBox):
 
 	def _create_textbuffer(self, parsetree=None):
 		# Callback for page.get_textbuffer
-		buffer = TextBuffer(self.notebook, self.page, parsetree=parsetree)
+		buffer = TextBuffer(self.notebook, self.page, parsetree=parsetree, progressive=True)
 
 		readonly = self._readonly_set or self.notebook.readonly or self.page.readonly
 			# Do not use "self.readonly" here, may not yet be intialized
@@ -1088,6 +1088,10 @@ class PageView(GSignalEmitterMixin, Gtk.VBox):
 		is set at the end of the buffer.
 		'''
 		buffer = self.textview.get_buffer()
+		if pos < 0 or pos > buffer.get_char_count():
+			# Position is (possibly) in the part not yet loaded
+			buffer.finish_progressive_load()
+
 		if pos < 0:
 			start, end = buffer.get_bounds()
 			iter = end
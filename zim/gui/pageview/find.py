@@ -102,6 +102,8 @@ class TextFinder(object):
 		else:
 			self.regex = re.compile(string, re.U | re.I)
 
+		self.buffer.finish_progressive_load() # need full content to search
+
 	def find_next(self):
 		'''Skip to the next match and select it
 
@@ -334,13 +334,15 @@ class TextBuffer(Gtk.TextBuffer):
 		'rise': Integer(None),
 	} #: Valid properties for a style in tag_styles
 
-	def __init__(self, notebook, page, parsetree=None):
+	def __init__(self, notebook, page, parsetree=None, progressive=False):
 		'''Constructor
 
 		@param notebook: a L{Notebook} object
 		@param page: a L{Page} object
 		@param parsetree: optional L{ParseTree} object, if given this will
 		initialize the buffer content *before* initializing the undostack
+		@param progressive: if C{True} large parse trees are loaded in
+		steps, see L{set_parsetree()}
 		'''
 		GObject.GObject.__init__(self)
 		self.notebook = notebook
@@ -354,6 +356,8 @@ class TextBuffer(Gtk.TextBuffer):
 		self.user_action = UserActionContext(self)
 		self.finder = TextFinder(self)
 		self.showing_template = False
+		self._progressive_load = None
+		self._inserting_chunk = False
 
 		for name in self._static_style_tags:
 			tag = self.create_tag('style-' + name, **self.tag_styles[name])
@@ -372,9 +376,24 @@ class TextBuffer(Gtk.TextBuffer):
 		self.connect('delete-range', self.__class__.do_pre_delete_range)
 		self.connect_after('delete-range', self.__class__.do_post_delete_range)
 
+		# Cache for get_parsetree(), list of [mark, tokens] for blocks of
+		# text, see _get_tokens_cached()
+		self._blocks = []
+		self.connect('insert-text', lambda o, iter, *a: self._invalidate_blocks(iter, iter))
+		self.connect('insert-pixbuf', lambda o, iter, *a: self._invalidate_blocks(iter, iter))
+		self.connect('insert-child-anchor', lambda o, iter, *a: self._invalidate_blocks(iter, iter))
+		self.connect('delete-range', lambda o, start, end: self._invalidate_blocks(start, end))
+		self.connect('apply-tag', self.__class__._on_tag_changed)
+		self.connect('remove-tag', self.__class__._on_tag_changed)
+
+		# Loading the remainder of a page in the background should not
+		# look like an edit, see set_parsetree()
+		self.connect('modified-changed', self.__class__._on_modified_changed_while_loading)
+		self.connect('begin-user-action', self.__class__._on_begin_user_action_while_loading)
+
 		if parsetree is not None:
 			# Do this *before* initializing the undostack
-			self.set_parsetree(parsetree)
+			self.set_parsetree(parsetree, progressive=progressive)
 			self.set_modified(False)
 
 		self.undostack = UndoStackManager(self)
@@ -411,11 +430,15 @@ class TextBuffer(Gtk.TextBuffer):
 			self._check_renumber = []
 
 	def clear(self):
+		self._cancel_progressive_load()
 		self.delete(*self.get_bounds())
 		if self._deleted_editmode_mark is not None:
 			self.delete_mark(self._deleted_editmode_mark)
 			self._deleted_editmode_mark = None
 		self._editmode_tags = []
+		for mark, tokens in self._blocks:
+			self.delete_mark(mark)
+		self._blocks = []
 
 	def get_insert_iter(self):
 		'''Get a C{Gtk.TextIter} for the current cursor position'''
@@ -432,22 +455,99 @@ class TextBuffer(Gtk.TextBuffer):
 		'''
 		return SaveCursorContext(self, iter, gravity)
 
-	def set_parsetree(self, tree, showing_template=False):
+	PROGRESSIVE_FIRST_LINES = 200 #: lines loaded directly by a progressive load
+	PROGRESSIVE_CHUNK_LINES = 500 #: lines loaded per idle callback
+
+	def set_parsetree(self, tree, showing_template=False, progressive=False):
 		'''Load a new L{ParseTree} in the buffer
 
 		This method replaces any content in the buffer with the new
 		parser tree.
 
+		For large pages inserting the whole tree can take a noticeable
+		time. With C{progressive} set only the first part of the tree is
+		inserted directly and the rest is appended in idle callbacks.
+		These appends do not go on the undo stack and do not change the
+		modified state. The load is completed directly as soon as the
+		user starts editing, or the full content is needed by
+		L{get_parsetree()}, the L{TextFinder} or an anchor lookup.
+
 		@param tree: a L{ParseTree} object
 		@param showing_template: if C{True} the C{tree} represents a template
 		and not actual page content (yet)
-		'''
+		@param progressive: if C{True} load large trees in steps
+		'''
+		self._cancel_progressive_load()
+		chunks = None
+		if progressive:
+			chunks = tree.iter_chunks(self.PROGRESSIVE_CHUNK_LINES, self.PROGRESSIVE_FIRST_LINES)
+			first = next(chunks)
+			second = next(chunks, None)
+			if second is None:
+				chunks = None # small tree, load in one go
+			else:
+				tree = first
+
 		with self.user_action:
 			self.clear()
 			self.insert_parsetree_at_cursor(tree)
 
 		self.showing_template = showing_template # Set after modifying!
 
+		if chunks is not None:
+			self._progressive_load = [second, chunks, None]
+			self._progressive_load[2] = GLib.idle_add(self._on_progressive_load_idle)
+
+	def finish_progressive_load(self):
+		'''Insert any content still pending from a progressive load
+		started by L{set_parsetree()}
+		'''
+		if self._progressive_load is not None:
+			first, chunks, id = self._progressive_load
+			self._progressive_load = None
+			GLib.source_remove(id)
+			self._insert_chunk(first)
+			for tree in chunks:
+				self._insert_chunk(tree)
+
+	def _cancel_progressive_load(self):
+		if self._progressive_load is not None:
+			GLib.source_remove(self._progressive_load[2])
+			self._progressive_load = None
+
+	def _on_progressive_load_idle(self):
+		if self._progressive_load is None:
+			return False
+
+		tree = self._progressive_load[0]
+		self._progressive_load[0] = next(self._progressive_load[1], None)
+		if self._progressive_load[0] is None:
+			self._progressive_load = None
+		self._insert_chunk(tree)
+		return self._progressive_load is not None # repeat
+
+	def _insert_chunk(self, tree):
+		modified = self.get_modified()
+		undostack = getattr(self, 'undostack', None) # not yet set in constructor
+		self._inserting_chunk = True
+		if undostack:
+			undostack.block()
+		try:
+			self.insert_parsetree(self.get_end_iter(), tree)
+		finally:
+			self.set_modified(modified)
+			if undostack:
+				undostack.unblock()
+			self._inserting_chunk = False
+
+	def _on_modified_changed_while_loading(self):
+		if self._inserting_chunk:
+			self.stop_emission_by_name('modified-changed')
+
+	def _on_begin_user_action_while_loading(self):
+		if not self._inserting_chunk:
+			self.finish_progressive_load()
+
 	def insert_parsetree(self, iter, tree, interactive=False):
 		'''Insert a L{ParseTree} in the buffer
 
@@ -2478,6 +2578,9 @@ class TextBuffer(Gtk.TextBuffer):
 		if self.showing_template and not raw:
 			return None
 
+		if bounds is None:
+			self.finish_progressive_load()
+
 		attrib = {}
 		start, end = bounds or self.get_bounds()
 
@@ -2485,10 +2588,37 @@ class TextBuffer(Gtk.TextBuffer):
 			builder = ElementTreeModule.TreeBuilder()
 			attrib['raw'] = True
 			builder.start('zim-tree', attrib)
+			self._serialize(builder, start, end, raw=True)
 		else:
 			builder = BackwardParseTreeBuilderWithCleanup()
 			builder.start('zim-tree', attrib)
+			if bounds is None:
+				builder.extend(self._get_tokens_cached())
+			else:
+				self._serialize(builder, start, end, raw=False)
+
+		builder.end('zim-tree')
+		tree = ParseTree(builder.close())
+		tree.encode_urls()
+
+		if not raw and tree.hascontent:
+			# Reparsing the parsetree in order to find raw wiki codes
+			# and get rid of oddities in our generated parsetree.
+			#print(">>> Parsetree original:\n", tree.tostring())
+			from zim.formats import get_format
+			format = get_format("wiki") # FIXME should the format used here depend on the store ?
+			dumper = format.Dumper()
+			parser = format.Parser()
+			text = dumper.dump(tree)
+			#print(">>> Wiki text:\n", ''.join(text))
+			tree = parser.parse(text)
+			#print(">>> Parsetree recreated:\n", tree.tostring())
+
+		return tree
 
+	def _serialize(self, builder, start, end, raw):
+		# Walk the buffer between start and end and call the builder
+		# for the content, used by get_parsetree()
 		open_tags = []
 		def set_tags(iter, tags):
 			# This function changes the parse tree based on the TextTags in
@@ -2728,24 +2858,112 @@ class TextBuffer(Gtk.TextBuffer):
 		# close any open tags
 		set_tags(end, [])
 
-		builder.end('zim-tree')
-		tree = ParseTree(builder.close())
-		tree.encode_urls()
+	def _on_tag_changed(self, tag, start, end):
+		if _is_zim_tag(tag):
+			self._invalidate_blocks(start, end)
 
-		if not raw and tree.hascontent:
-			# Reparsing the parsetree in order to find raw wiki codes
-			# and get rid of oddities in our generated parsetree.
-			#print(">>> Parsetree original:\n", tree.tostring())
-			from zim.formats import get_format
-			format = get_format("wiki") # FIXME should the format used here depend on the store ?
-			dumper = format.Dumper()
-			parser = format.Parser()
-			text = dumper.dump(tree)
-			#print(">>> Wiki text:\n", ''.join(text))
-			tree = parser.parse(text)
-			#print(">>> Parsetree recreated:\n", tree.tostring())
+	def _invalidate_blocks(self, start, end):
+		# Flag cached blocks that overlap with a change between start and
+		# end as dirty, called before the change is done. Find the last
+		# block starting at or before start with a binary search.
+		if not self._blocks:
+			return
 
-		return tree
+		offset, end_offset = start.get_offset(), end.get_offset()
+		lo, hi = 0, len(self._blocks)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.get_iter_at_mark(self._blocks[mid][0]).get_offset() > offset:
+				hi = mid
+			else:
+				lo = mid + 1
+
+		for i in range(max(lo - 1, 0), len(self._blocks)):
+			block = self._blocks[i]
+			block_offset = self.get_iter_at_mark(block[0]).get_offset()
+			if block_offset > end_offset \
+				or (block_offset == end_offset and end_offset > offset):
+					break
+			block[1] = None
+
+	def _is_block_boundary(self, iter):
+		# Block boundaries are line starts after an empty line without
+		# formatting, no state of _serialize() carries over such a line,
+		# so blocks can be serialized independently.
+		if not iter.starts_line() or iter.get_line() == 0:
+			return False
+		prev = iter.copy()
+		prev.backward_line()
+		return prev.ends_line() and not any(filter(_is_zim_tag, prev.get_tags()))
+
+	def _has_objects(self, start, end):
+		text = start.get_slice(end)
+		iter = start.copy()
+		i, offset = text.find(PIXBUF_CHR), 0
+		while i >= 0:
+			iter.forward_chars(i - offset)
+			if iter.get_child_anchor() is not None:
+				return True
+			i, offset = text.find(PIXBUF_CHR, i + 1), i
+		return False
+
+	def _get_tokens_cached(self):
+		# Serialize the whole buffer as a list of tokens, re-using tokens
+		# of blocks that did not change since the last call. Only dirty
+		# blocks are walked again and split at the new block boundaries.
+		# Blocks are tracked with marks, so they move along with edits.
+		blocks = []
+		if not self._blocks:
+			mark = self.create_mark(None, self.get_start_iter(), left_gravity=True)
+			blocks.append([mark, None])
+		for mark, tokens in self._blocks:
+			iter = self.get_iter_at_mark(mark)
+			if blocks and iter.equal(self.get_iter_at_mark(blocks[-1][0])):
+				# Previous block became empty
+				self.delete_mark(blocks[-1][0])
+				blocks[-1] = [mark, tokens]
+			elif blocks and not self._is_block_boundary(iter):
+				# Merge with previous block
+				self.delete_mark(mark)
+				blocks[-1][1] = None
+			else:
+				blocks.append([mark, tokens])
+
+		self._blocks = []
+		all_tokens = []
+		for i, (mark, tokens) in enumerate(blocks):
+			if tokens is None:
+				start = self.get_iter_at_mark(mark)
+				if i + 1 < len(blocks):
+					end = self.get_iter_at_mark(blocks[i+1][0])
+				else:
+					end = self.get_end_iter()
+
+				bounds = [start]
+				for line in range(start.get_line() + 1, end.get_line() + 1):
+					iter = self.get_iter_at_line(line)
+					if iter.compare(end) < 0 and self._is_block_boundary(iter):
+						bounds.append(iter)
+				bounds.append(end)
+
+				for j in range(len(bounds) - 1):
+					builder = BackwardParseTreeBuilderWithCleanup()
+					self._serialize(builder, bounds[j], bounds[j+1], raw=False)
+					tokens = builder.get_tokens()
+					if j > 0:
+						mark = self.create_mark(None, bounds[j], left_gravity=True)
+					if self._has_objects(bounds[j], bounds[j+1]):
+						# Objects can change without changing the buffer,
+						# so do not cache these blocks
+						self._blocks.append([mark, None])
+					else:
+						self._blocks.append([mark, tokens])
+					all_tokens.extend(tokens)
+			else:
+				self._blocks.append([mark, tokens])
+				all_tokens.extend(tokens)
+
+		return all_tokens
 
 	def _sort_nesting_style_tags(self, iter, end, tags, open_tags):
 		new_block, new_nesting, new_leaf = self._split_nesting_style_tags(tags)
@@ -2920,6 +3138,7 @@ class TextBuffer(Gtk.TextBuffer):
 		@param name: the name of the anchor
 		@returns: a C{Gtk.TextIter} pointing to the start of the heading or C{None}.
 		"""
+		self.finish_progressive_load()
 		iter = self.get_start_iter()
 		while True:
 			tags = list(filter(_is_heading_tag, iter.get_tags()))
@@ -2944,6 +3163,7 @@ class TextBuffer(Gtk.TextBuffer):
 		@returns: a C{Gtk.TextIter} pointing to the start of the heading or C{None}.
 		"""
 		# look for explicit anchors tags including image or object tags
+		self.finish_progressive_load()
 		start, end = self.get_bounds()
 		for iter, myname in self.iter_anchors_for_range(start, end):
 			if myname == name:
@@ -46,6 +46,7 @@ usage: zim [OPTIONS] [NOTEBOOK [PAGE_LINK]]
    or: zim --export [OPTIONS] NOTEBOOK [PAGE]
    or: zim --search NOTEBOOK QUERY
    or: zim --index  [OPTIONS] NOTEBOOK
+   or: zim --graph-stats [OPTIONS] NOTEBOOK
    or: zim --plugin PLUGIN [ARGUMENTS]
    or: zim --manual [OPTIONS] [PAGE_LINK]
    or: zim --help
@@ -61,6 +62,7 @@ General Options:
   --export         export to a different format
   --search         run a search query on a notebook
   --index          build an index for a notebook
+  --graph-stats    print statistics on the links between pages
   --plugin         call a specific plugin function
   --manual         open the user manual
   -V, --verbose    print information to terminal
@@ -90,12 +92,21 @@ Export Options:
   -r, --recursive  when exporting a page, also export sub-pages
   -s, --singlefile export all pages to a single output file
   -O, --overwrite  force overwriting existing file(s)
+  -j, --jobs       number of processes used to export pages
+  --incremental    only export pages that changed since the last export
 
 Search Options:
   None
 
 Index Options:
   -f, --flush      flush the index first and force re-building
+  -j, --jobs       number of processes used to parse pages
+                   (defaults to the number of processors)
+
+Graph Stats Options:
+  -n, --top        number of most linked pages to show (defaults to 10)
+  -l, --list       also list orphan pages, pages without backlinks
+                   and placeholders
 
 Try 'zim --manual' for more help.
 '''
@@ -193,6 +204,33 @@ class NotebookCommand(Command):
 
 		return notebook, pagelink or uripagelink
 
+	def get_int_option(self, name, default, minimum=0):
+		'''Get the value of an option that takes a number
+		@param name: the option name
+		@param default: value to use when the option is not given
+		@param minimum: the lowest value allowed
+		@returns: the value as an integer
+		@raises UsageError: when the value is not an integer or less
+		than C{minimum}
+		'''
+		value = self.opts.get(name, default)
+		try:
+			number = int(value)
+		except ValueError:
+			number = None
+		if number is None or number < minimum:
+			raise UsageError(_('Option "--%(option)s" needs a number of at least %(minimum)i, got: %(value)s') % {'option': name, 'minimum': minimum, 'value': value})
+				# T: error message for a commandline option that takes a number
+		return number
+
+	def get_jobs(self, default=1):
+		'''Get the value of the C{--jobs} option
+		@param default: value to use when the option is not given
+		@returns: the number of processes as an integer
+		@raises UsageError: when the value is not a positive integer
+		'''
+		return self.get_int_option('jobs', default, minimum=1)
+
 
 class GuiCommand(NotebookCommand, GtkCommand):
 	'''Class implementing the C{--gui} command and run the gtk interface'''
@@ -378,7 +416,7 @@ class ServerCommand(NotebookCommand):
 		notebook, x = self.build_notebook()
 		is_public = not self.opts.get('private', False)
 
-		self.server = httpd = zim.www.make_server(notebook, public=is_public, template=template, port=port)
+		self.server = httpd = zim.www.make_server(notebook, public=is_public, template=template, port=port, threaded=True)
 			# server attribute used in testing to stop sever in thread
 		logger.info("Serving HTTP on %s port %i...", httpd.server_name, httpd.server_port)
 		httpd.serve_forever()
@@ -430,6 +468,8 @@ class ExportCommand(NotebookCommand):
 		('recursive', 'r', 'when exporting a page, also export sub-pages'),
 		('singlefile', 's', 'export all pages to a single output file'),
 		('overwrite', 'O', 'overwrite existing file(s)'),
+		('jobs=', 'j', 'number of processes used to export pages'),
+		('incremental', '', 'only export pages that changed since the last export'),
 	)
 
 	def get_exporter(self, page):
@@ -454,7 +494,7 @@ class ExportCommand(NotebookCommand):
 			output = FilePath(self.pwd).get_abspath(self.opts['output']) # can raise again for mal-formed paths
 		else:
 			# file or folder exists
-			if not self.opts.get('overwrite'):
+			if not (self.opts.get('overwrite') or self.opts.get('incremental')):
 				if isinstance(output, LocalFolder):
 					if len(output.list_names()) > 0:
 						raise Error(_('Output folder exists and not empty, specify "--overwrite" to force export'))  # T: error message for export
@@ -464,7 +504,7 @@ class ExportCommand(NotebookCommand):
 					raise Error(_('Output file exists, specify "--overwrite" to force export'))  # T: error message for export
 
 		if format == 'mhtml':
-			self.ignore_options('index-page')
+			self.ignore_options('index-page', 'jobs', 'incremental')
 			if isinstance(output, LocalFolder): # implies exists
 				raise UsageError(_('Need output file to export MHTML')) # T: error message for export
 			else:
@@ -475,7 +515,7 @@ class ExportCommand(NotebookCommand):
 				document_root_url=self.opts.get('root-url'),
 			)
 		elif self.opts.get('singlefile'):
-			self.ignore_options('index-page')
+			self.ignore_options('index-page', 'jobs', 'incremental')
 			if isinstance(output, LocalFolder):
 				ext = get_format(format).info['extension']
 				output = output.file(page.basename) + '.' + ext
@@ -497,6 +537,8 @@ class ExportCommand(NotebookCommand):
 			exporter = build_page_exporter(
 				output, format, template, page,
 				document_root_url=self.opts.get('root-url'),
+				jobs=self.get_jobs(),
+				incremental=bool(self.opts.get('incremental')),
 			)
 		else:
 			if isinstance(output, LocalFile): # implies exists
@@ -508,6 +550,8 @@ class ExportCommand(NotebookCommand):
 				output, format, template,
 				index_page=self.opts.get('index-page'),
 				document_root_url=self.opts.get('root-url'),
+				jobs=self.get_jobs(),
+				incremental=bool(self.opts.get('incremental')),
 			)
 
 		return exporter
@@ -516,7 +560,7 @@ class ExportCommand(NotebookCommand):
 		from zim.export.selections import AllPages, SinglePage, SubPages
 
 		notebook, href = self.build_notebook()
-		notebook.index.check_and_update()
+		notebook.index.check_and_update(jobs=self.get_jobs())
 
 		if href and self.opts.get('recursive'):
 			page = Path(href.names) # ignore anchor
@@ -562,6 +606,7 @@ class IndexCommand(NotebookCommand):
 	arguments = ('NOTEBOOK',)
 	options = (
 		('flush', 'f', 'flush the index first and force re-building'),
+		('jobs=', 'j', 'number of processes used to parse pages'),
 	)
 
 	def run(self):
@@ -577,18 +622,66 @@ class IndexCommand(NotebookCommand):
 		mylogger.setLevel(logging.DEBUG)
 		mylogger.addFilter(elevate_index_logging)
 
+		jobs = self.get_jobs(os.cpu_count() or 1)
 		notebook, x = self.build_notebook(ensure_uptodate=False)
 		if self.opts.get('flush'):
 			notebook.index.flush()
-			notebook.index.update()
+			notebook.index.update(jobs=jobs)
 		else:
 			# Effectively the same as check_and_update_index ui action
 			logger.info('Checking notebook index')
-			notebook.index.check_and_update()
+			notebook.index.check_and_update(jobs=jobs)
 
 		logger.info('Index up to date!')
 
 
+class GraphStatsCommand(NotebookCommand):
+	'''Class implementing the C{--graph-stats} command'''
+
+	arguments = ('NOTEBOOK',)
+	options = (
+		('top=', 'n', 'number of most linked pages to show'),
+		('list', 'l', 'also list orphan pages, pages without backlinks and placeholders'),
+	)
+
+	def run(self):
+		top = self.get_int_option('top', 10)
+		notebook, x = self.build_notebook(ensure_uptodate=False)
+		logger.info('Checking notebook index')
+		notebook.index.check_and_update() # statistics need all links to be resolved
+		links = notebook.links
+
+		orphans = list(links.list_orphan_pages())
+		unlinked = list(links.list_pages_without_backlinks())
+		placeholders = list(links.list_link_placeholders())
+		components = links.list_components()
+
+		print('Pages: %i' % notebook.pages.n_all_pages())
+		print('Links: %i' % links.n_all_links())
+		print('Orphan pages: %i' % len(orphans))
+		print('Pages without backlinks: %i' % len(unlinked))
+		print('Placeholders: %i' % len(placeholders))
+		print('Connected components: %i' % len(components))
+		if components:
+			print('Largest component: %i pages' % len(components[0]))
+
+		if top > 0:
+			print('\nMost linked pages:')
+			for path, n in links.list_most_linked_pages(top):
+				print('%6i  %s' % (n, path.name))
+
+		if self.opts.get('list'):
+			print('\nOrphan pages:')
+			for path in orphans:
+				print('  ' + path.name)
+			print('\nPages without backlinks:')
+			for path in unlinked:
+				print('  ' + path.name)
+			print('\nPlaceholders:')
+			for path, n in placeholders:
+				print('%6i  %s' % (n, path.name))
+
+
 commands = {
 	'help': HelpCommand,
 	'version': VersionCommand,
@@ -599,6 +692,7 @@ commands = {
 	'export': ExportCommand,
 	'search': SearchCommand,
 	'index': IndexCommand,
+	'graph-stats': GraphStatsCommand,
 }
 
 
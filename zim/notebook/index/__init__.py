@@ -5,6 +5,7 @@
 
 import sqlite3
 import logging
+import contextlib
 
 logger = logging.getLogger('zim.notebook.index')
 
@@ -25,9 +26,11 @@ from .base import *
 from .pages import *
 from .links import *
 from .tags import *
+from .fulltext import *
+from .connections import ConnectionPool, set_wal_mode, open_readonly_connection
 
 
-DB_VERSION = '0.8'
+DB_VERSION = '0.10'
 DB_SORTKEY_CONTENT = 'text_1.2.3_unicode_αβγ_žžž'
 
 
@@ -56,14 +59,25 @@ class Index(SignalEmitter):
 		'changed': (None, None, ()),
 	}
 
-	def __init__(self, dbpath, layout):
+	def __init__(self, dbpath, layout, readonly=False):
 		'''Constructor
 		@param dbpath: a file path for the sqlite db, or C{":memory:"}
 		@param layout: a L{NotebookLayout} instance to index
+		@param readonly: if C{True} open an existing index for reading
+		only, e.g. in a worker process, updates will fail
+		@raises ValueError: for a read-only index that does not exist
+		or has an outdated version
 		'''
 		self.dbpath = dbpath
 		self.layout = layout
-		self._db_connect()
+		self.readonly = readonly
+		self._deferred = None # queue of files for "deferred_update()"
+		if readonly:
+			self._db_connect_readonly()
+		else:
+			self._db_connect()
+		self.connections = ConnectionPool(self.dbpath, self._db)
+			# Used by index views, see L{IndexView.new_from_index()}
 		if not hasattr(self, 'update_iter'):
 			self._update_iter_init()
 		# else _update_iter_init already called via _db_init()
@@ -91,16 +105,19 @@ class Index(SignalEmitter):
 			logger.debug('Connecting to in-memory database')
 
 		try:
-			self._db = sqlite3.Connection(self.dbpath)
+			self._db_open()
 		except:
 			self._db_recover()
 
-		self._db.row_factory = sqlite3.Row
-
 		try:
 			self._db.execute('PRAGMA synchronous=OFF;')
 			# Don't wait for disk writes, we can recover from crashes
 			# anyway. Allows us to use commit more frequently.
+			if self.dbpath != ':memory:':
+				set_wal_mode(self._db)
+				# Readers, like the server process or worker threads
+				# using the connection pool, are not blocked by an
+				# ongoing update and vice versa
 
 			if self.get_property('db_version') != DB_VERSION:
 				logger.info('Index db_version out of date')
@@ -120,6 +137,16 @@ class Index(SignalEmitter):
 		except sqlite3.DatabaseError:
 			self._db_recover()
 
+	def _db_connect_readonly(self):
+		logger.debug('Connecting read-only to database file: %s', self.dbpath)
+		try:
+			self._db = open_readonly_connection(self.dbpath)
+			version = self.get_property('db_version')
+		except sqlite3.Error:
+			raise ValueError('Could not open index: %s' % self.dbpath)
+		if version != DB_VERSION:
+			raise ValueError('Index out of date: %s' % self.dbpath)
+
 	def _db_recover(self):
 		assert not self.dbpath == ':memory:'
 		file = LocalFile(self.dbpath)
@@ -131,17 +158,24 @@ class Index(SignalEmitter):
 			logger.error('Could not access database file, running in-memory database')
 			self.dbpath = ':memory:'
 		finally:
-			self._db = sqlite3.Connection(self.dbpath)
-			self._db.row_factory = sqlite3.Row
+			self._db_open()
+			if self.dbpath != ':memory:':
+				set_wal_mode(self._db)
 			self._db_init()
 
+	def _db_open(self):
+		self._db = sqlite3.Connection(self.dbpath)
+		self._db.row_factory = sqlite3.Row
+
 	def _db_init(self):
 		tables = [r[0] for r in self._db.execute(
 			'SELECT name FROM sqlite_master '
 			'WHERE type="table" and name NOT LIKE "sqlite%"'
 		)]
 		for table in tables:
-			self._db.execute('DROP TABLE %s' % table)
+			self._db.execute('DROP TABLE IF EXISTS %s' % table)
+				# "IF EXISTS" because virtual tables drop their own
+				# shadow tables
 
 		logger.debug('(Re-)Initializing database for index')
 		self._db.executescript('''
@@ -172,13 +206,19 @@ class Index(SignalEmitter):
 	def is_uptodate(self):
 		return self.update_iter.is_uptodate()
 
-	def update(self):
-		'''Update all data in the index'''
-		self.update_iter.update()
+	def update(self, jobs=None):
+		'''Update all data in the index
+		@param jobs: number of worker processes used to parse pages, see
+		L{IndexUpdateIter.update()}
+		'''
+		self.update_iter.update(jobs)
 
-	def check_and_update(self):
-		'''Check and update all data in the index'''
-		self.update_iter.check_and_update()
+	def check_and_update(self, jobs=None):
+		'''Check and update all data in the index
+		@param jobs: number of worker processes used to parse pages, see
+		L{IndexUpdateIter.update()}
+		'''
+		self.update_iter.check_and_update(jobs=jobs)
 
 	def check_and_update_iter(self):
 		return self.update_iter.check_and_update_iter()
@@ -207,10 +247,10 @@ class Index(SignalEmitter):
 		'''
 		from .files import STATUS_NEED_UPDATE
 		self._db.execute(
-			'UPDATE files SET index_status = ?'
+			'UPDATE files SET index_status = ?, digest = NULL '
 			'WHERE id IN (SELECT source_file FROM pages)',
 			(STATUS_NEED_UPDATE,)
-		)
+		) # reset digest, else unchanged pages are skipped
 
 	def start_background_check(self, notebook):
 		self.check_async(notebook, [Path(':')], recursive=True)
@@ -218,15 +258,38 @@ class Index(SignalEmitter):
 	def stop_background_check(self):
 		self.background_check.stop()
 
-	def update_file(self, file):
+	def update_file(self, file, lines=None, etag=None, parsetree=None):
+		'''Update the index for a file or folder that changed
+		@param file: a L{File} or L{Folder} object
+		@param lines: the lines that were written to C{file}, if known,
+		e.g. because the page was just stored. The file is then not read
+		again for indexing.
+		@param etag: the etag for the content of C{file} as returned by
+		L{File.writelines_with_etag()}, required when C{lines} is given
+		@param parsetree: the L{ParseTree} that results from parsing
+		C{lines}, if known. The lines are then not parsed again either.
+		Only give a tree that is the output of the parser for this file
+		format, other trees can differ from what is read from the file.
+		'''
 		if not file.exists():
 			return self.remove_file(file)
 
+		if lines is not None:
+			assert etag is not None, 'Need etag for lines'
+			path = file.relpath(self.layout.root)
+			self.update_iter.pages.set_known_content(path, lines, etag, parsetree)
+
+		if self._deferred is not None:
+			self._deferred[file.path] = file
+		else:
+			self._update_file_row(file)
+			self._commit_update()
+
+	def _update_file_row(self, file):
 		path = file.relpath(self.layout.root)
 		row = self._db.execute('SELECT id FROM files WHERE path=?', (path,)).fetchone()
 
 		filesindexer = self.update_iter.files
-
 		if row:
 			node_id = row[0]
 			if isinstance(file, File):
@@ -243,17 +306,17 @@ class Index(SignalEmitter):
 			else:
 				raise TypeError
 
-		for i in self.update_iter.partial_update_iter():
-			pass
-
-		self._db.commit()
-		self.on_commit(None)
-
 	def remove_file(self, file):
+		if self._deferred is not None:
+			self._deferred[file.path] = file
+		elif self._remove_file_row(file):
+			self._commit_update()
+
+	def _remove_file_row(self, file):
 		path = file.relpath(self.layout.root)
 		row = self._db.execute('SELECT id FROM files WHERE path=?', (path,)).fetchone()
 		if row is None:
-			return
+			return False
 
 		filesindexer = self.update_iter.files
 
@@ -265,18 +328,113 @@ class Index(SignalEmitter):
 		else:
 			raise TypeError
 
+		return True
+
+	def _commit_update(self):
 		for i in self.update_iter.partial_update_iter():
 			pass
 
 		self._db.commit()
 		self.on_commit(None)
 
+	@contextlib.contextmanager
+	def deferred_update(self):
+		'''Context manager to combine many calls to L{update_file()} and
+		L{remove_file()} in a single index update. Within the context
+		files are only queued, when the context exits they are indexed
+		with a single pass of the indexers and a single commit. Used
+		e.g. when updating links in many pages at once.
+
+		Nested contexts are combined with the outer context.
+		'''
+		if self._deferred is not None:
+			yield
+			return
+
+		self._deferred = {}
+		try:
+			yield
+		finally:
+			files, self._deferred = self._deferred, None
+			if files:
+				for file in files.values():
+					if file.exists():
+						self._update_file_row(file)
+					else:
+						self._remove_file_row(file)
+				self._commit_update()
+
 	def file_moved(self, oldfile, newfile):
-		# TODO: make this more efficient, specific for moved folders
-		#       by supporting moved pages in indexers
+		# See page_moved() for moving pages without re-indexing them
 		self.remove_file(oldfile)
 		self.update_file(newfile)
 
+	def page_moved(self, oldpath, newpath, files):
+		'''Update the index for a page that was moved on disk, including
+		all child pages. The page rows keep their id and page contents
+		are not parsed again, only links that can resolve differently
+		at the new location are updated. Falls back to L{file_moved()}
+		if the move can not be done in place, e.g. when a page is moved
+		below itself.
+		@param oldpath: the old L{Path} of the page
+		@param newpath: the new L{Path} of the page
+		@param files: list of 2-tuples of the old and new L{File} or
+		L{Folder} objects that were moved on disk
+		'''
+		pagesindexer = self.update_iter.pages
+		if not pagesindexer.can_move_page(oldpath, newpath):
+			for oldfile, newfile in files:
+				self.file_moved(oldfile, newfile)
+			return
+
+		filesindexer = self.update_iter.files
+		not_indexed = []
+		for oldfile, newfile in files:
+			path = oldfile.relpath(self.layout.root)
+			row = self._db.execute('SELECT id FROM files WHERE path=?', (path,)).fetchone()
+			if row is None:
+				not_indexed.append(newfile)
+			elif isinstance(newfile, File):
+				filesindexer.move_file(row[0], newfile)
+			elif isinstance(newfile, Folder):
+				filesindexer.move_folder(row[0], newfile)
+			else:
+				raise TypeError
+
+		# Drop empty folders that were cleaned up after the move
+		for oldfile, newfile in files:
+			folder = oldfile.parent()
+			if folder.exists():
+				continue
+			while not folder.parent().exists():
+				folder = folder.parent()
+			row = self._db.execute(
+				'SELECT id FROM files WHERE path=?',
+				(folder.relpath(self.layout.root),)
+			).fetchone()
+			if row is not None:
+				filesindexer.delete_folder(row[0])
+
+		pagesindexer.move_page(oldpath, newpath)
+		for i in self.update_iter.partial_update_iter():
+			pass
+
+		self._db.commit()
+
+		# Indexers can flag moved pages for re-indexing, e.g. when the
+		# index depends on the page name
+		if not filesindexer.is_uptodate():
+			for i in filesindexer.update_iter():
+				pass
+			for i in self.update_iter.partial_update_iter():
+				pass
+			self._db.commit()
+
+		self.on_commit(None)
+
+		for newfile in not_indexed:
+			self.update_file(newfile)
+
 	def touch_current_page_placeholder(self, path):
 		'''Create a placeholder for C{path} if the page does not
 		exist. Cleans up old placeholders.
@@ -322,6 +480,12 @@ class IndexUpdateIter(SignalEmitter):
 		self.links = LinksIndexer(db, self.pages)
 		self.tags = TagsIndexer(db, self.pages)
 		self._indexers = [self.files, self.pages, self.links, self.tags]
+		if FullTextIndexer.is_available(db):
+			self.fulltext = FullTextIndexer(db, self.pages)
+			self._indexers.append(self.fulltext)
+		else:
+			logger.debug('SQLite has no FTS5 support, content search will not use the index')
+			self.fulltext = None
 
 	def add_indexer(self, indexer):
 		self._indexers.append(indexer)
@@ -348,15 +512,34 @@ class IndexUpdateIter(SignalEmitter):
 				yield
 		self.emit('commit')
 
-	def update(self):
-		'''Convenience method to do a full update at once'''
-		for i in self:
-			pass
-
-	def check_and_update(self, file=None):
-		'''Convenience method to do a full update and check at once'''
-		for i in self.check_and_update_iter(file):
-			pass
+	def update(self, jobs=None):
+		'''Convenience method to do a full update at once
+		@param jobs: number of worker processes used to parse pages, if
+		C{None} or C{1} all pages are parsed in the current process
+		'''
+		with self._parser_pool(jobs):
+			for i in self:
+				pass
+
+	def check_and_update(self, file=None, jobs=None):
+		'''Convenience method to do a full update and check at once
+		@param jobs: number of worker processes used to parse pages, see
+		L{update()}
+		'''
+		with self._parser_pool(jobs):
+			for i in self.check_and_update_iter(file):
+				pass
+
+	@contextlib.contextmanager
+	def _parser_pool(self, jobs):
+		if jobs and jobs > 1:
+			self.pages.start_parser_pool(jobs)
+			try:
+				yield
+			finally:
+				self.pages.stop_parser_pool()
+		else:
+			yield
 
 	def check_and_update_iter(self, file=None):
 		checker = FilesIndexChecker(self.db, self.layout.root)
@@ -26,7 +26,9 @@ class IndexView(object):
 
 	@classmethod
 	def new_from_index(cls, index):
-		return cls(index._db)
+		# The pool behaves as the writer connection in the thread
+		# owning the index and as a read-only connection in other threads
+		return cls(index.connections)
 
 	def __init__(self, db):
 		self.db = db
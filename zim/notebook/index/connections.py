@@ -0,0 +1,139 @@
+# Copyright 2026 agent <agent@local>
+
+'''Connection management for the index database
+
+The index has a single writer connection that is owned by the thread
+that created the L{Index}, this is the thread that runs the updates.
+Other threads, like the worker threads of the web server, get a
+read-only connection from a pool. The database uses the "WAL" journal
+mode, so these readers see the last committed state and are not
+blocked by an ongoing update, also when the update runs in another
+process.
+'''
+
+import sqlite3
+import logging
+import threading
+
+from urllib.request import pathname2url
+
+
+logger = logging.getLogger('zim.notebook.index')
+
+
+def set_wal_mode(db):
+	'''Switch a database to the "WAL" journal mode
+	@param db: a C{sqlite3.Connection} for a database file
+	@returns: C{True} if successful
+	'''
+	try:
+		mode, = db.execute('PRAGMA journal_mode=WAL;').fetchone()
+	except sqlite3.DatabaseError:
+		mode = None
+	if mode != 'wal':
+		logger.warning('Could not enable WAL mode for index, journal mode is: %s', mode)
+		return False
+	else:
+		return True
+
+
+def open_readonly_connection(dbpath):
+	'''Open a read-only connection for a database file
+	@param dbpath: the file path of the database
+	@returns: a C{sqlite3.Connection}
+	'''
+	db = sqlite3.connect(
+		'file:%s?mode=ro' % pathname2url(dbpath),
+		uri=True, check_same_thread=False
+	)
+	db.row_factory = sqlite3.Row
+	db.execute('PRAGMA query_only=ON;')
+	return db
+
+
+class _Lease(object):
+	# Object kept in thread local storage, returns the connection to the
+	# pool when the thread exits
+
+	__slots__ = ('pool', 'db')
+
+	def __init__(self, pool, db):
+		self.pool = pool
+		self.db = db
+
+	def __del__(self):
+		self.pool._release(self.db)
+
+
+class ConnectionPool(object):
+	'''Hands out a connection to the index database for the current
+	thread. In the thread that owns the writer connection this is the
+	writer itself, so views see changes directly, also before they are
+	committed. Any other thread gets a read-only connection that it keeps
+	as long as the thread lives, after that the connection goes back to
+	the pool for re-use.
+
+	For an in-memory database a second connection would see a different
+	database, so in that case the writer is always used.
+	'''
+
+	def __init__(self, dbpath, writer, max_idle=4):
+		'''Constructor
+		@param dbpath: the file path of the database or C{":memory:"}
+		@param writer: the C{sqlite3.Connection} used for updates
+		@param max_idle: maximum number of unused read-only connections
+		to keep open
+		'''
+		self.dbpath = dbpath
+		self.writer = writer
+		self.max_idle = max_idle
+		self._writer_thread = threading.get_ident()
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._idle = []
+		self._closed = False
+
+	def get_connection(self):
+		'''Get the connection to use in the current thread
+		@returns: a C{sqlite3.Connection}
+		'''
+		if self.dbpath == ':memory:' \
+			or threading.get_ident() == self._writer_thread:
+				return self.writer
+
+		lease = getattr(self._local, 'lease', None)
+		if lease is None:
+			with self._lock:
+				db = self._idle.pop() if self._idle else None
+			if db is None:
+				db = open_readonly_connection(self.dbpath)
+			lease = _Lease(self, db)
+			self._local.lease = lease
+		return lease.db
+
+	def _release(self, db):
+		with self._lock:
+			if self._closed or len(self._idle) >= self.max_idle:
+				close = True
+			else:
+				self._idle.append(db)
+				close = False
+		if close:
+			db.close()
+
+	def close(self):
+		'''Close all read-only connections in the pool. Connections that
+		are in use by other threads are closed when they are released.
+		'''
+		with self._lock:
+			self._closed = True
+			idle, self._idle = self._idle, []
+		for db in idle:
+			db.close()
+
+	def __getattr__(self, name):
+		# Proxy for the connection of the current thread, so the pool can
+		# be used in place of a C{sqlite3.Connection} by index views
+		if name.startswith('_'):
+			raise AttributeError(name)
+		return getattr(self.get_connection(), name)
@@ -1,6 +1,7 @@
 
 
 import os
+import time
 import logging
 
 logger = logging.getLogger('zim.notebook.index')
@@ -33,6 +34,8 @@ class FilesIndexer(SignalEmitter):
 	@signal: C{file-row-inserted (row, file)}: on new file found
 	@signal: C{file-row-changed (row, file)}: on file content changed
 	@signal: C{file-row-deleted (row)}: on file deleted
+	@signal: C{file-rows-pending (rows)}: emitted with a list of rows
+	before a batch of files is updated, allows pre-fetching file contents
 
 	'''
 
@@ -48,8 +51,12 @@ class FilesIndexer(SignalEmitter):
 		'file-row-inserted': (None, None, (object,)),
 		'file-row-changed': (None, None, (object,)),
 		'file-row-deleted': (None, None, (object,)),
+		'file-rows-pending': (None, None, (object,)),
 	}
 
+	batch_size = 200 #: number of pending rows fetched from the table at once
+	transaction_size = 100 #: number of rows updated between commits
+
 	def __init__(self, db, folder):
 		self.db = db
 		self.folder = folder
@@ -62,12 +69,17 @@ class FilesIndexer(SignalEmitter):
 			path TEXT UNIQUE NOT NULL,
 			node_type INTEGER NOT NULL,
 			mtime TIMESTAMP,
+			digest BLOB,
 
 			index_status INTEGER DEFAULT 3
 
 			CONSTRAINT no_self_ref CHECK (parent <> id)
 		);
+		CREATE INDEX IF NOT EXISTS files_index_status ON files(index_status, node_type);
+		CREATE INDEX IF NOT EXISTS files_parent ON files(parent);
 		''')
+		# The "files_index_status" index implicitly includes the "id" column
+		# as row id, so it serves the work queue sorted by "node_type, id"
 		row = self.db.execute('SELECT * FROM files WHERE id == 1').fetchone()
 		if row is None:
 			c = self.db.execute(
@@ -93,42 +105,75 @@ class FilesIndexer(SignalEmitter):
 		# sort folders before files: first index structure, then contents
 		# this makes e.g. index links more efficient and robust
 		# sort by id to ensure parents are found before children
+		#
+		# Pending rows are fetched in batches, folders first. Updating a
+		# folder can add new pending folders, so we re-query folders after
+		# each batch before moving on to files. Commits are grouped per
+		# "transaction_size" rows.
+		count = 0
+		start = time.time()
 		while True:
-			row = self.db.execute(
-				'SELECT id, path, node_type FROM files'
-				' WHERE index_status = ? AND path LIKE ?'
-				' ORDER BY node_type, id',
-				(STATUS_NEED_UPDATE, prefix + '%')
-			).fetchone()
+			batch = self._get_pending_batch(TYPE_FOLDER, prefix)
+			if not batch:
+				batch = self._get_pending_batch(TYPE_FILE, prefix)
+				if batch:
+					self.emit('file-rows-pending', batch)
+				else:
+					break
+
+			for node_id, path, node_type in batch:
+				if not self._is_pending(node_id):
+					continue # updated or dropped as part of a previous row
+
+				self._update_node(node_id, path, node_type)
+				count += 1
+				if count % self.transaction_size == 0:
+					self.db.commit()
+				yield
+
+		self.db.commit()
+		if count:
+			seconds = time.time() - start
+			logger.debug(
+				'Indexed %i files and folders in %.2fs (%.0f nodes/s)',
+				count, seconds, count / seconds if seconds > 0 else count
+			)
 
-			if row:
-				node_id, path, node_type = row
-			else:
-				break
+	def _get_pending_batch(self, node_type, prefix=''):
+		return self.db.execute(
+			'SELECT id, path, node_type FROM files'
+			' WHERE index_status = ? AND node_type = ? AND path LIKE ?'
+			' ORDER BY id LIMIT ?',
+			(STATUS_NEED_UPDATE, node_type, prefix + '%', self.batch_size)
+		).fetchall()
 
-			try:
-				if node_type == TYPE_FOLDER:
-					folder = self.folder.folder(path)
-					if folder.exists():
-						self.update_folder(node_id, folder)
-					else:
-						self.delete_folder(node_id)
+	def _is_pending(self, node_id):
+		row = self.db.execute(
+			'SELECT index_status FROM files WHERE id = ?', (node_id,)
+		).fetchone()
+		return row is not None and row[0] == STATUS_NEED_UPDATE
+
+	def _update_node(self, node_id, path, node_type):
+		try:
+			if node_type == TYPE_FOLDER:
+				folder = self.folder.folder(path)
+				if folder.exists():
+					self.update_folder(node_id, folder)
 				else:
-					file = self.folder.file(path)
-					if file.exists():
-						self.update_file(node_id, file)
-					else:
-						self.delete_file(node_id)
-			except:
-				self.db.execute( # avoid looping
-					'UPDATE files SET index_status = ? WHERE id = ?',
-					(STATUS_UPTODATE, node_id)
-				)
-				logger.exception('Error while indexing: %s', path)
-					# do this logging *after* above update - else test suite still loops due to log-to-error handler
-
-			self.db.commit()
-			yield
+					self.delete_folder(node_id)
+			else:
+				file = self.folder.file(path)
+				if file.exists():
+					self.update_file(node_id, file)
+				else:
+					self.delete_file(node_id)
+		except:
+			self.db.execute( # avoid looping
+				'UPDATE files SET index_status = ? WHERE id = ?',
+				(STATUS_UPTODATE, node_id)
+			)
+			logger.exception('Error while indexing: %s', path)
+				# do this logging *after* above update - else test suite still loops due to log-to-error handler
 
 	def interactive_add_file(self, file):
 		assert isinstance(file, File) and file.exists()
@@ -215,7 +260,10 @@ class FilesIndexer(SignalEmitter):
 				if index_status == STATUS_NEED_UPDATE:
 					# If the status was "need update" already, don't overrule it
 					# here with mtime check - else we break flag_reindex()
-					pass
+					self.db.execute(
+						'UPDATE files SET index_status = ? WHERE id = ?',
+						(STATUS_NEED_UPDATE, child_id)
+					)
 				elif child.mtime() != child_mtime:
 					self.db.execute(
 						'UPDATE files SET index_status = ? WHERE id = ?',
@@ -269,6 +317,33 @@ class FilesIndexer(SignalEmitter):
 			(STATUS_UPTODATE, mtime, node_id)
 		)
 
+	def move_file(self, node_id, file):
+		'''Update the path of a file that was moved on disk, keeps the
+		row id and status. Does not emit any signals.
+		'''
+		parent_id = self._add_parent(file.parent())
+		self.db.execute(
+			'UPDATE files SET path = ?, parent = ? WHERE id = ?',
+			(file.relpath(self.folder), parent_id, node_id)
+		)
+
+	def move_folder(self, node_id, folder):
+		'''Like L{move_file()} but for a folder, also updates the paths
+		of all files and folders below it.
+		'''
+		oldpath, = self.db.execute(
+			'SELECT path FROM files WHERE id = ?', (node_id,)
+		).fetchone()
+		newpath = folder.relpath(self.folder)
+		self.move_file(node_id, folder)
+		# Select children by range instead of LIKE, the path can contain
+		# wildcard characters and the range can use the unique index
+		self.db.execute(
+			'UPDATE files SET path = ? || substr(path, ?)'
+			' WHERE path > ? AND path < ?',
+			(newpath, len(oldpath) + 1, oldpath + SEP, oldpath + chr(ord(SEP) + 1))
+		)
+
 	def delete_file(self, node_id):
 		row = self.db.execute('SELECT * FROM files WHERE id=?', (node_id,)).fetchone()
 		logger.debug('Drop file: %s', row['path'])
@@ -351,64 +426,82 @@ class FilesIndexChecker(object):
 		# sort folders before files: first index structure, then contents
 		# this makes e.g. index links more efficient and robust
 		# sort by id to ensure parents are found before children
-
+		#
+		# Rows are fetched in batches, the status of each row is verified
+		# again before the check because the updater can run in between
+		# the yields of this generator.
+		count = 0
 		while True:
-			row = self.db.execute(
-				'SELECT id, path, node_type, mtime, index_status FROM files'
+			batch = self.db.execute(
+				'SELECT id, path, node_type FROM files'
 				' WHERE index_status > ? '
-				' ORDER BY node_type, id',
-				(STATUS_UPTODATE,)
-			).fetchone()
-
-			if row:
-				#~ logger.debug('Check %s', row['path'])
-				node_id, path, node_type, mtime, check = row
-			else:
+				' ORDER BY node_type, id LIMIT ?',
+				(STATUS_UPTODATE, FilesIndexer.batch_size)
+			).fetchall()
+			if not batch:
 				break # done
 
-			if check == STATUS_NEED_UPDATE:
-				yield True
-				continue # let updater handle this first
+			for node_id, path, node_type in batch:
+				row = self.db.execute(
+					'SELECT mtime, index_status FROM files WHERE id = ?',
+					(node_id,)
+				).fetchone()
+				if row is None or row[1] == STATUS_UPTODATE:
+					continue # dropped or updated in the mean time
+
+				#~ logger.debug('Check %s', path)
+				mtime, check = row
+				if check == STATUS_NEED_UPDATE:
+					self.db.commit()
+					yield True
+					break # let updater handle this first, then re-query
+
+				new_status = self._check_node(node_id, path, node_type, mtime)
+				count += 1
+				if new_status == STATUS_NEED_UPDATE \
+					or count % FilesIndexer.transaction_size == 0:
+						self.db.commit()
+
+				yield new_status == STATUS_NEED_UPDATE
+
+		self.db.commit()
+
+	def _check_node(self, node_id, path, node_type, mtime):
+		try:
+			if node_type == TYPE_FOLDER:
+				obj = self.folder.folder(path)
+			else:
+				obj = self.folder.file(path)
 
-			try:
+			if not obj.exists():
+				new_status = STATUS_NEED_UPDATE
+			else:
 				if node_type == TYPE_FOLDER:
-					obj = self.folder.folder(path)
-				else:
-					obj = self.folder.file(path)
-
-				if not obj.exists():
-					check = STATUS_CHECK # update will drop children, no need to recurs anymore
-					new_status = STATUS_NEED_UPDATE
-
+					if mtime == obj.mtime() and self._check_folder_content(node_id, obj):
+						new_status = STATUS_UPTODATE
+					else:
+						new_status = STATUS_NEED_UPDATE
 				else:
-					if node_type == TYPE_FOLDER:
-						if mtime == obj.mtime() and self._check_folder_content(node_id, obj):
-							new_status = STATUS_UPTODATE
-						else:
-							new_status = STATUS_NEED_UPDATE
+					if mtime == obj.mtime():
+						new_status = STATUS_UPTODATE
 					else:
-						if mtime == obj.mtime():
-							new_status = STATUS_UPTODATE
-						else:
-							new_status = STATUS_NEED_UPDATE
+						new_status = STATUS_NEED_UPDATE
 
-				self.db.execute(
-					'UPDATE files SET index_status = ?'
-					' WHERE id = ?',
-					(new_status, node_id)
-				)
-				self.db.commit()
+			self.db.execute(
+				'UPDATE files SET index_status = ?'
+				' WHERE id = ?',
+				(new_status, node_id)
+			)
 
-			except:
-				logger.exception('Error while indexing: %s', path)
-				self.db.execute( # avoid looping
-					'UPDATE files SET index_status = ? WHERE id = ?',
-					(STATUS_NEED_UPDATE, node_id)
-				)
-				self.db.commit()
-				new_status = STATUS_NEED_UPDATE
+		except:
+			logger.exception('Error while indexing: %s', path)
+			self.db.execute( # avoid looping
+				'UPDATE files SET index_status = ? WHERE id = ?',
+				(STATUS_NEED_UPDATE, node_id)
+			)
+			new_status = STATUS_NEED_UPDATE
 
-			yield new_status == STATUS_NEED_UPDATE
+		return new_status
 
 	def _check_folder_content(self, node_id, folder):
 		# This method adds more robustness for detecting new / missing files
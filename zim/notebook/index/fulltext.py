@@ -0,0 +1,131 @@
+# Copyright 2026 agent <agent@local>
+
+'''Full text index of page contents
+
+The "pagetext" table is a SQLite FTS5 virtual table with the text of each
+page, using the page id as row id. It is only created when the sqlite
+library supports FTS5, check L{FullTextIndexer.is_available()} or
+L{FullTextView.is_available()} before use.
+
+The tokenizer is configured to match the word boundaries used by the
+regular expressions in L{zim.search}: case-insensitive, diacritics are
+significant and "_" is a word character.
+'''
+
+import re
+import sqlite3
+import logging
+
+logger = logging.getLogger('zim.notebook.index')
+
+
+from .base import IndexerBase, IndexView
+from .pages import PageIndexRecord
+
+
+_fts_query_re = re.compile(r'^(\w+)(\*?)$', re.U)
+
+
+def _has_fts5(db):
+	try:
+		db.execute('CREATE VIRTUAL TABLE temp._fts5_test USING fts5(content)')
+	except sqlite3.OperationalError:
+		return False
+	else:
+		db.execute('DROP TABLE temp._fts5_test')
+		return True
+
+
+class FullTextIndexer(IndexerBase):
+	'''Indexer for the "pagetext" full text table'''
+
+	__signals__ = {}
+
+	@staticmethod
+	def is_available(db):
+		'''Returns C{True} if the sqlite library supports FTS5'''
+		return _has_fts5(db)
+
+	def __init__(self, db, pagesindexer):
+		IndexerBase.__init__(self, db)
+		self.connectto_all(pagesindexer, (
+			'page-changed', 'page-row-deleted'
+		))
+
+		self.db.execute('''
+			CREATE VIRTUAL TABLE IF NOT EXISTS pagetext USING fts5(
+				content,
+				tokenize="unicode61 remove_diacritics 0 tokenchars '_'"
+			);
+		''')
+
+	def on_page_changed(self, pagesindexer, pagerow, doc):
+		self.db.execute('DELETE FROM pagetext WHERE rowid=?', (pagerow['id'],))
+		self.db.execute(
+			'INSERT INTO pagetext(rowid, content) VALUES (?, ?)',
+			(pagerow['id'], ' '.join(doc.iter_text()))
+		)
+
+	def on_page_row_deleted(self, pagesindexer, pagerow):
+		self.db.execute('DELETE FROM pagetext WHERE rowid=?', (pagerow['id'],))
+
+
+class FullTextView(IndexView):
+	'''Index view that exposes the "pagetext" full text table'''
+
+	def is_available(self):
+		'''Returns C{True} if the full text table exists in the index'''
+		row = self.db.execute(
+			'SELECT name FROM sqlite_master WHERE name="pagetext"'
+		).fetchone()
+		return row is not None
+
+	@staticmethod
+	def can_match(string):
+		'''Returns C{True} if a search term can be answered from the full
+		text table with the same outcome as matching a content regex from
+		L{zim.search}. This is the case for a single word, optionally with a
+		"*" wildcard at the end. Leading wildcards, multiple words or
+		punctuation need exact regex matching.
+		'''
+		return bool(_fts_query_re.match(string)) \
+			and not any('\u4e00' <= c <= '\u9fff' for c in string)
+				# Chinese does not use whitespace between words
+
+	def match_pages(self, string):
+		'''Query the full text table for a search term
+		@param string: a search term for which L{can_match()} is C{True}
+		@returns: a dict mapping L{PageIndexRecord} objects to a score
+		between 1 and 10, based on the "bm25" rank of each match
+		'''
+		m = _fts_query_re.match(string)
+		if not m:
+			raise ValueError('Can not match: %s' % string)
+		word, wildcard = m.groups()
+		query = '"%s"%s' % (word, wildcard)
+
+		rows = self.db.execute(
+			'SELECT pages.*, bm25(pagetext) AS rank FROM pagetext '
+			'JOIN pages ON pages.id = pagetext.rowid '
+			'WHERE pagetext MATCH ? ORDER BY rank',
+			(query,)
+		).fetchall()
+		if not rows:
+			return {}
+
+		# bm25 is negative, lower is better, scale relative to the best match
+		best = rows[0]['rank'] or -1
+		return dict(
+			(PageIndexRecord(row), 1 + int(round(9 * (row['rank'] / best))))
+				for row in rows
+		)
+
+	def list_pages(self):
+		'''Generator for all pages that have text in the full text table
+		@returns: yields L{PageIndexRecord} objects
+		'''
+		for row in self.db.execute(
+			'SELECT pages.* FROM pagetext '
+			'JOIN pages ON pages.id = pagetext.rowid'
+		):
+			yield PageIndexRecord(row)
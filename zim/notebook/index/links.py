@@ -67,10 +67,10 @@ class LinksIndexer(IndexerBase):
 		self._pagesindexer = pagesindexer
 		self.connectto_all(pagesindexer, (
 			'page-row-inserted', 'page-row-changed', 'page-row-deleted',
-			'page-changed'
+			'page-row-moved', 'page-changed'
 		))
 
-		self.db.execute('''
+		self.db.executescript('''
 			CREATE TABLE IF NOT EXISTS links (
 				source INTEGER REFERENCES pages(id),
 				target INTEGER REFERENCES pages(id),
@@ -87,6 +87,9 @@ class LinksIndexer(IndexerBase):
 
 				CONSTRAINT uc_LinkOnce UNIQUE (source, rel, names)
 			);
+			CREATE INDEX IF NOT EXISTS links_target ON links(target);
+			CREATE INDEX IF NOT EXISTS links_anchorkey ON links(anchorkey, rel);
+			CREATE INDEX IF NOT EXISTS links_needscheck ON links(needscheck);
 		''')
 
 	def on_page_changed(self, o, row, doc):
@@ -155,6 +158,25 @@ class LinksIndexer(IndexerBase):
 			(ROOT_ID, row['id'],)
 		) # Need to link somewhere, if target is gone, use ROOT instead
 
+	def on_page_row_moved(self, o, row, oldrow):
+		# Page ids did not change, but links from and to the moved pages
+		# can resolve differently now. Relative links within the moved
+		# section do not change, relative links from outside are
+		# flagged as links into the moved section.
+		section = 'SELECT id FROM pages WHERE name=? OR (name>? AND name<?)'
+		args = (row['name'], row['name'] + ':', row['name'] + ';')
+		self.db.execute(
+			'UPDATE links SET needscheck=1 '
+			'WHERE rel<>? AND source IN (%s)' % section,
+			(HREF_REL_RELATIVE,) + args
+		)
+		self.db.execute(
+			'UPDATE links SET needscheck=1 '
+			'WHERE target IN (%s) AND source NOT IN (%s)' % (section, section),
+			args + args
+		)
+		self.on_page_row_inserted(o, row) # new name can be anchor for floating links
+
 	def is_uptodate(self):
 		row = self.db.execute(
 			'SELECT * FROM links WHERE needscheck=1 '
@@ -171,30 +193,66 @@ class LinksIndexer(IndexerBase):
 			self.on_page_row_deleted(None, row)
 			yield
 
-		# Check total
-		n, = self.db.execute('SELECT COUNT(*) FROM links WHERE needscheck=1').fetchone()
-
 		# Resolve pending links
-		for i, row in enumerate(self.db.execute(
-			'SELECT * FROM links WHERE needscheck=1 '
-			'ORDER BY anchorkey, names'
-		)):
-			if i > 0 and i % 100 == 0:
+		# Floating links from the same namespace with the same anchor
+		# resolve to the same anchor page, so we group them and look up
+		# the anchor once per group. Results are written in batches.
+		rows = self.db.execute(
+			'SELECT links.source, links.rel, links.names, links.anchorkey, pages.name '
+			'FROM links JOIN pages ON links.source = pages.id '
+			'WHERE links.needscheck=1 '
+			'ORDER BY links.anchorkey, links.names'
+		).fetchall()
+		n = len(rows)
+
+		groups = {}
+		for row in rows:
+			source = Path(row['name'])
+			if row['rel'] == HREF_REL_FLOATING and not source.isroot:
+				key = (source.parent.name, row['anchorkey'])
+			else:
+				key = None # resolve these one by one
+			groups.setdefault(key, []).append((source, row))
+
+		self._resolved_names = {}
+		updates = []
+		i = 0
+		for key, group in groups.items():
+			if key is None:
+				for source, row in group:
+					href = HRef(row['rel'], row['names'])
+					parent, parent_id, names = self._pages._resolve_link(source, href, source_id=row['source'])
+					target_id = self._resolve_pagename(parent, parent_id, names)
+					updates.append((target_id, row['source'], row['names'], row['rel']))
+			else:
+				source, row = group[0]
+				found = self._pages._find_floating_anchors(source, source, row['anchorkey'])
+				for source, row in group:
+					parts = HRef(row['rel'], row['names']).parts()
+					if found: # try to match case first, else just use first match
+						anchor = parts.pop(0)
+						name, pid = found[0]
+						for myname, mypid in found:
+							if myname.endswith(anchor):
+								name, pid = myname, mypid
+								break
+						target_id = self._resolve_pagename(Path(name), pid, parts)
+					else:
+						# Resolve as "brother" of source
+						target_id = self._resolve_pagename(source.parent, None, parts)
+					updates.append((target_id, row['source'], row['names'], row['rel']))
+
+			i += len(group)
+			if len(updates) >= 100 or i == n:
+				self._update_targets(updates)
+				updates = []
 				self.db.commit()
 				logger.debug('Update link %i of %i', i, n)
-
-			href = HRef(row['rel'], row['names'])
-			source = self._pages.get_pagename(row['source'])
-			target_id, targetname = self._pages.resolve_link(source, href, source_id=row['source'])
-			if target_id is None:
-				target_id = self._pagesindexer.insert_link_placeholder(targetname)
-
-			self.db.execute(
-				'UPDATE links SET target=?, needscheck=0 WHERE source=? and names=? and rel=?',
-				(target_id, row['source'], row['names'], row['rel'])
-			)
 			yield
 
+		self._update_targets(updates)
+		self._resolved_names = {}
+
 		# Delete un-used placeholders
 		for row in self.db.execute('''
 			SELECT pages.id FROM pages LEFT JOIN links ON pages.id=links.target
@@ -210,6 +268,29 @@ class LinksIndexer(IndexerBase):
 
 		self.db.commit()
 
+	def _resolve_pagename(self, parent, parent_id, names):
+		# Resolve a pagename and return the page id, inserting a
+		# placeholder if needed. Results are cached per update run, but
+		# inserting a placeholder can change the outcome for other names
+		# so the cache is reset in that case.
+		key = (parent.name, tuple(names))
+		if key in self._resolved_names:
+			return self._resolved_names[key]
+
+		target_id, targetname = self._pages.resolve_pagename(parent, names, parent_id)
+		if target_id is None:
+			target_id = self._pagesindexer.insert_link_placeholder(targetname)
+			self._resolved_names.clear()
+
+		self._resolved_names[key] = target_id
+		return target_id
+
+	def _update_targets(self, updates):
+		self.db.executemany(
+			'UPDATE links SET target=?, needscheck=0 WHERE source=? and names=? and rel=?',
+			updates
+		)
+
 	def _allow_cleanup(self, row):
 		c, = self.db.execute(
 			'SELECT COUNT(*) FROM links WHERE target=?', (row['id'],)
@@ -317,6 +398,203 @@ class LinksView(IndexView):
 			n += self._n_list_links(child.id, direction)
 		return n
 
+	def neighbourhood(self, pagename, depth=1, direction=LINK_DIR_BOTH, limit=None):
+		'''Get the pages and links around a page, up to a maximum number
+		of links away. This is done in a single query, so it is suitable
+		for a graph of the links around a page.
+
+		@param pagename: the L{Path} of the page at the center
+		@param depth: the maximum number of links between the center
+		and other pages
+		@param direction: the direction in which links are followed,
+		one of C{LINK_DIR_FORWARD}, C{LINK_DIR_BACKWARD} or C{LINK_DIR_BOTH}
+		@param limit: maximum number of pages to return or C{None}, pages
+		closest to the center are returned first
+		@returns: a 2-tuple of a list of pages and a list of links. The
+		pages are 2-tuples of a L{Path} and the number of links from the
+		center, in order of that number. The links are L{IndexLink}
+		objects for all links that are followed from those pages, not
+		including links to pages that are not in the list.
+		@raises IndexNotFoundError: if C{path} is not found in the index
+		'''
+		page_id = self._pages.get_page_id(pagename) # can raise IndexNotFoundError
+
+		# Links from ROOT_ID are used as a hack to create placeholders
+		if direction == LINK_DIR_FORWARD:
+			step = 'links.source = hops.id'
+			other = 'links.target'
+			followed = 's.distance < :depth'
+		elif direction == LINK_DIR_BACKWARD:
+			step = 'links.target = hops.id and links.source <> :root'
+			other = 'links.source'
+			followed = 't.distance < :depth'
+		else:
+			step = '(links.source = hops.id or links.target = hops.id) and links.source <> :root'
+			other = 'CASE WHEN links.source = hops.id THEN links.target ELSE links.source END'
+			followed = '(s.distance < :depth or t.distance < :depth)'
+
+		nodes, edges = [], []
+		for row in self.db.execute('''
+			WITH RECURSIVE
+			hops(id, distance) AS (
+				VALUES (:page, 0)
+				UNION
+				SELECT %s, hops.distance + 1 FROM hops JOIN links ON %s
+				WHERE hops.distance < :depth
+			),
+			nodes(id, distance) AS (
+				SELECT hops.id, min(hops.distance) FROM hops
+				JOIN pages ON pages.id = hops.id
+				GROUP BY hops.id
+				ORDER BY 2, pages.sortkey, pages.name
+				LIMIT :limit
+			)
+			SELECT nodes.id AS source, NULL AS target, nodes.distance, pages.name
+			FROM nodes JOIN pages ON pages.id = nodes.id
+			UNION ALL
+			SELECT DISTINCT links.source, links.target, NULL, NULL FROM links
+			JOIN nodes AS s ON s.id = links.source
+			JOIN nodes AS t ON t.id = links.target
+			WHERE links.source <> :root and %s
+			''' % (other, step, followed),
+			{'page': page_id, 'depth': depth, 'root': ROOT_ID, 'limit': -1 if limit is None else limit}
+		):
+			if row['target'] is None:
+				nodes.append((row['distance'], row['name'], row['source']))
+			else:
+				edges.append((row['source'], row['target']))
+
+		nodes.sort()
+		paths = {id: Path(name) for distance, name, id in nodes}
+		return (
+			[(paths[id], distance) for distance, name, id in nodes],
+			[IndexLink(paths[source], paths[target]) for source, target in edges]
+		)
+
+	def n_all_links(self):
+		'''Get the total number of links between pages, multiple links
+		from the same source to the same target are counted once and
+		links from a page to itself are not counted
+		'''
+		c = self.db.execute(
+			'SELECT count(*) FROM (SELECT DISTINCT source, target FROM links WHERE source<>? AND source<>target)',
+			(ROOT_ID,)
+		)
+		return c.fetchone()[0]
+
+	def list_orphan_pages(self):
+		'''List pages that do not link to other pages and are not
+		linked from other pages
+		@returns: yields L{Path} objects sorted by name
+		'''
+		for row in self.db.execute('''
+			SELECT name FROM pages
+			WHERE id<>:root and source_file IS NOT NULL
+			and NOT EXISTS (
+				SELECT 1 FROM links WHERE source=pages.id and target<>pages.id
+			)
+			and NOT EXISTS (
+				SELECT 1 FROM links WHERE target=pages.id and source<>pages.id and source<>:root
+			)
+			ORDER BY name
+			''', {'root': ROOT_ID}
+		):
+			yield Path(row['name'])
+
+	def list_pages_without_backlinks(self):
+		'''List pages that are not linked from other pages
+		@returns: yields L{Path} objects sorted by name
+		'''
+		for row in self.db.execute('''
+			SELECT name FROM pages
+			WHERE id<>:root and source_file IS NOT NULL
+			and NOT EXISTS (
+				SELECT 1 FROM links WHERE target=pages.id and source<>pages.id and source<>:root
+			)
+			ORDER BY name
+			''', {'root': ROOT_ID}
+		):
+			yield Path(row['name'])
+
+	def list_link_placeholders(self):
+		'''List placeholders, these are pages that do not exist but
+		are the target of one or more links
+		@returns: yields 2-tuples of a L{Path} and the number of pages
+		that link to it, sorted by name
+		'''
+		for row in self.db.execute('''
+			SELECT pages.name, count(DISTINCT links.source) AS n FROM pages
+			JOIN links ON links.target=pages.id
+			WHERE pages.is_link_placeholder=1 and links.source<>:root
+			GROUP BY pages.id
+			ORDER BY pages.name
+			''', {'root': ROOT_ID}
+		):
+			yield Path(row['name']), row['n']
+
+	def list_most_linked_pages(self, limit=10):
+		'''List the pages that are linked from the most other pages
+		@param limit: maximum number of pages to return or C{None}
+		@returns: yields 2-tuples of a L{Path} and the number of pages
+		that link to it, in order of that number
+		'''
+		for row in self.db.execute('''
+			SELECT pages.name, count(DISTINCT links.source) AS n FROM pages
+			JOIN links ON links.target=pages.id
+			WHERE links.source<>:root and links.source<>pages.id
+			GROUP BY pages.id
+			ORDER BY n DESC, pages.name
+			LIMIT :limit
+			''', {'root': ROOT_ID, 'limit': -1 if limit is None else limit}
+		):
+			yield Path(row['name']), row['n']
+
+	def list_components(self):
+		'''Get the connected components of the graph of links between
+		pages, ignoring the direction of the links. Pages without links
+		each form a component of one page.
+
+		The links are read once and the components are determined
+		in memory, which is a lot faster than following links per page.
+
+		@returns: a list of components, each component is a list of
+		L{Path} objects sorted by name. Largest components come first.
+		'''
+		names = {}
+		for row in self.db.execute('''
+			SELECT id, name FROM pages
+			WHERE id<>:root and (
+				source_file IS NOT NULL or is_link_placeholder=1
+				or id IN (SELECT target FROM links WHERE source<>:root)
+			)
+			''', {'root': ROOT_ID}
+		):
+			names[row['id']] = row['name']
+
+		# Union-find with path halving
+		parent = {id: id for id in names}
+		def find(id):
+			while parent[id] != id:
+				parent[id] = parent[parent[id]]
+				id = parent[id]
+			return id
+
+		for source, target in self.db.execute(
+			'SELECT DISTINCT source, target FROM links WHERE source<>?', (ROOT_ID,)
+		):
+			if source in parent and target in parent:
+				a, b = find(source), find(target)
+				if a != b:
+					parent[a] = b
+
+		groups = {}
+		for id, name in names.items():
+			groups.setdefault(find(id), []).append(name)
+
+		components = [sorted(group) for group in groups.values()]
+		components.sort(key=lambda c: (-len(c), c[0]))
+		return [[Path(name) for name in c] for c in components]
+
 	def list_floating_links(self, basename):
 		anchorkey = natural_sort_key(basename)
 		for row in self.db.execute(
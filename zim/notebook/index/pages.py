@@ -5,15 +5,20 @@
 from datetime import datetime
 from typing import Generator, Optional
 
+import bisect
 import sqlite3
 import logging
+import concurrent.futures
 
 logger = logging.getLogger('zim.notebook.index')
 
 from zim.utils import natural_sort_key
 from zim.notebook.page import Path, HRef, \
 	HREF_REL_ABSOLUTE, HREF_REL_FLOATING, HREF_REL_RELATIVE
-from zim.formats import ParseTreeBuilder
+from zim.formats import ParseTreeBuilder, get_format, iter_page_hrefs, \
+	HEADING, PARAGRAPH, BULLETLIST, NUMBEREDLIST, LINK, IMAGE, TAG, ANCHOR
+from zim.tokenparser import TokenList, iterTopLevelLists, TEXT, END
+from zim.newfs import LocalFile
 
 from .base import *
 
@@ -38,6 +43,211 @@ def emptyParseTree():
 	return b.get_parsetree()
 
 
+class PageDigest(object):
+	'''Summary of the content of a page, given to indexers with the
+	"page-changed" signal of the L{PagesIndexer}.
+
+	Links, tags, anchors, headings, text and the tokens needed to find
+	tasks are all collected in a single walk of the parse tree, which is
+	done the first time any of them is requested.
+
+	Before this class was added the signal gave the L{ParseTree} itself.
+	To stay compatible with indexers written for that interface, methods
+	that also exist for L{ParseTree} have the same interface and result,
+	and any other L{ParseTree} method or attribute is looked up in
+	L{parsetree}.
+
+	@ivar parsetree: the L{ParseTree} for the page content
+	'''
+
+	# Top level elements that can contain tasks, for other top level
+	# elements only the start and end token are kept
+	_TASK_ELEMENTS = (HEADING, PARAGRAPH, BULLETLIST, NUMBEREDLIST)
+
+	def __init__(self, parsetree):
+		self.parsetree = parsetree
+		self._hrefs = None
+		self._tags = None
+		self._anchors = None
+		self._headings = None
+		self._text = None
+		self._tokens = None
+
+	def _collect(self):
+		hrefs, tags, anchors, headings, text = [], [], [], [], []
+		tokens = TokenList()
+		depth = 0
+		skip = False
+		heading = None
+		tag = None
+
+		root = self.parsetree._etree.getroot()
+		for t in iterTopLevelLists(self.parsetree._get_tokens(root, copy_attrib=False)):
+			if t[0] == TEXT:
+				text.append(t[1])
+				if heading is not None:
+					heading[1].append(t[1])
+				if tag is not None:
+					tag.append(t[1])
+				if not skip:
+					tokens.text(t[1])
+			elif t[0] == END:
+				depth -= 1
+				if t[1] == HEADING and heading is not None:
+					headings.append((heading[0], ''.join(heading[1]).strip()))
+					heading = None
+				elif t[1] == TAG and tag is not None:
+					tags.append(''.join(tag))
+					tag = None
+
+				if skip and depth == 1:
+					skip = False
+				if not skip:
+					tokens.end(t[1])
+			else:
+				depth += 1
+				attrib = t[1] or {}
+				if t[0] in (LINK, IMAGE):
+					hrefs.append(attrib.get('href'))
+				elif t[0] == TAG:
+					tag = []
+				elif t[0] == ANCHOR:
+					anchors.append(attrib.get('name'))
+				elif t[0] == HEADING:
+					heading = (int(attrib.get('level', 1)), [])
+
+				if not skip:
+					tokens.start(t[0], attrib)
+					if depth == 2 and t[0] not in self._TASK_ELEMENTS:
+						skip = True
+
+		self._hrefs, self._tags, self._anchors = hrefs, tags, anchors
+		self._headings, self._text, self._tokens = headings, text, tokens
+
+	def iter_href(self, include_page_local_links=False, include_anchors=False):
+		'''Like L{ParseTree.iter_href()}'''
+		if self._hrefs is None:
+			self._collect()
+		return iter_page_hrefs(self._hrefs, include_anchors)
+
+	def iter_tag_names(self):
+		'''Like L{ParseTree.iter_tag_names()}'''
+		if self._tags is None:
+			self._collect()
+		seen = set()
+		for name in self._tags:
+			if not name in seen:
+				seen.add(name)
+				yield name.lstrip('@')
+
+	def iter_anchors(self):
+		'''Generator for the names of anchors in the page content'''
+		if self._anchors is None:
+			self._collect()
+		return iter(self._anchors)
+
+	def iter_headings(self):
+		'''Generator for the headings in the page content
+		@returns: yields 2-tuples of the heading level and the text
+		'''
+		if self._headings is None:
+			self._collect()
+		return iter(self._headings)
+
+	def iter_text(self):
+		'''Like L{ParseTree.iter_text()}, yields the same text in
+		document order, but split per line
+		'''
+		if self._text is None:
+			self._collect()
+		return iter(self._text)
+
+	def iter_tokens(self):
+		'''Like L{ParseTree.iter_tokens()}'''
+		return self.parsetree.iter_tokens()
+
+	def iter_task_tokens(self):
+		'''Like L{iter_tokens()}, but content of top level elements that
+		can not contain tasks, like verbatim blocks and tables, is left
+		out. Attributes are shared and should not be modified.
+		'''
+		if self._tokens is None:
+			self._collect()
+		return iter(self._tokens) # already in "topLevelLists" order
+
+	def __getattr__(self, name):
+		# Only called for attributes not found on this object, provides
+		# the rest of the ParseTree interface
+		if name.startswith('__') or name == 'parsetree':
+			raise AttributeError(name)
+		return getattr(self.parsetree, name)
+
+
+def _read_and_parse(path, format_name, digest=None):
+	# Runs in a worker process of the L{PageParserPool}
+	return _parse_file(LocalFile(path), get_format(format_name), digest)
+
+
+def _parse_file(file, format, digest=None):
+	# Returns mtime, digest and parse tree for a page source file, if the
+	# digest did not change since last time the tree is C{None}
+	content, (mtime, newdigest) = file.read_with_etag()
+	if newdigest == digest:
+		return mtime, newdigest, None
+	else:
+		return mtime, newdigest, format.Parser().parse(content, file_input=True)
+
+
+class PageParserPool(object):
+	'''Pool of worker processes that read and parse page source files
+	in parallel. Used by the L{PagesIndexer} for large index updates,
+	the results are used in the main process to update the database.
+	'''
+
+	def __init__(self, jobs=None):
+		'''Constructor
+		@param jobs: number of worker processes, defaults to the number
+		of processors
+		'''
+		self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+		self._pending = {}
+
+	def submit(self, key, file, format, digest=None):
+		'''Queue a file for parsing
+		@param key: key to retrieve the result with L{pop()}
+		@param file: a L{LocalFile} object
+		@param format: the format module for the file
+		@param digest: digest of the content as last indexed, if the
+		content still matches the file is not parsed
+		'''
+		if key not in self._pending:
+			format_name = format.__name__.rsplit('.', 1)[-1]
+			self._pending[key] = self._executor.submit(_read_and_parse, file.path, format_name, digest)
+
+	def pop(self, key):
+		'''Get the result for a file queued with L{submit()}
+		Blocks until the worker is done with the file.
+		@returns: a 3-tuple of the mtime, the content digest and the
+		parse tree, or C{None} if the file was not queued or parsing
+		failed. The parse tree is C{None} if the digest did not change.
+		'''
+		future = self._pending.pop(key, None)
+		if future is None:
+			return None
+
+		try:
+			return future.result()
+		except Exception:
+			logger.debug('Parsing failed in worker process for: %s', key, exc_info=True)
+			return None # let the caller retry in the main process
+
+	def close(self):
+		for future in self._pending.values():
+			future.cancel()
+		self._pending.clear()
+		self._executor.shutdown()
+
+
 class PagesIndexer(IndexerBase):
 	'''Indexer for the "pages" table.
 
@@ -45,8 +255,15 @@ class PagesIndexer(IndexerBase):
 	@signal: C{page-row-changed (row, oldrow)}: row changed
 	@signal: C{page-row-delete (row)}: row to be deleted
 	@signal: C{page-row-deleted (row)}: row that has been deleted
-
-	@signal: C{page-changed (row, content)}: page contents changed
+	@signal: C{page-row-move (row)}: row to be moved
+	@signal: C{page-row-moved (row, oldrow)}: row that has been moved, the
+	id is the same but the name has changed, also for all child pages
+
+	@signal: C{page-changed (row, content)}: page contents changed,
+	C{content} is a L{PageDigest}, indexers should use it instead of
+	walking the parse tree themselves. It also supports the L{ParseTree}
+	methods, so indexers written for older versions, which got the
+	L{ParseTree} itself, keep working
 	'''
 
 	__signals__ = {
@@ -54,14 +271,19 @@ class PagesIndexer(IndexerBase):
 		'page-row-changed': (None, None, (object, object)),
 		'page-row-delete': (None, None, (object,)),
 		'page-row-deleted': (None, None, (object,)),
+		'page-row-move': (None, None, (object,)),
+		'page-row-moved': (None, None, (object, object)),
 		'page-changed': (None, None, (object, object))
 	}
 
 	def __init__(self, db, layout, filesindexer):
 		IndexerBase.__init__(self, db)
 		self.layout = layout
+		self._parser_pool = None
+		self._known_content = {}
 		self.connectto_all(filesindexer, (
-			'file-row-inserted', 'file-row-changed', 'file-row-deleted'
+			'file-row-inserted', 'file-row-changed', 'file-row-deleted',
+			'file-rows-pending'
 		))
 
 		self.db.executescript('''
@@ -82,7 +304,8 @@ class PagesIndexer(IndexerBase):
 			);
 			CREATE UNIQUE INDEX IF NOT EXISTS pages_name ON pages(name);
 			CREATE INDEX IF NOT EXISTS pages_sortkey ON pages(sortkey);
-			CREATE INDEX IF NOT EXISTS pages_parent ON pages(parent);
+			DROP INDEX IF EXISTS pages_parent;
+			CREATE INDEX IF NOT EXISTS pages_parent_sortkey ON pages(parent, sortkey, name);
 		''')
 		row = self.db.execute('SELECT * FROM pages WHERE id == 1').fetchone()
 		if row is None:
@@ -98,6 +321,36 @@ class PagesIndexer(IndexerBase):
 			'SELECT * FROM pages WHERE name=?', (pagename.name,)
 		).fetchone()
 
+	def start_parser_pool(self, jobs=None):
+		'''Start a pool of worker processes to parse page sources in
+		parallel during index updates. Only used for notebooks on the
+		local file system.
+		@param jobs: number of worker processes, defaults to the number
+		of processors
+		'''
+		if self._parser_pool is None:
+			self._parser_pool = PageParserPool(jobs)
+
+	def stop_parser_pool(self):
+		'''Stop the pool started with L{start_parser_pool()}'''
+		if self._parser_pool is not None:
+			self._parser_pool.close()
+			self._parser_pool = None
+
+	def on_file_rows_pending(self, o, filerows):
+		if self._parser_pool is None:
+			return
+
+		for filerow in filerows:
+			pagename, file_type = self.layout.map_filepath(filerow['path'])
+			if file_type == FILE_TYPE_PAGE_SOURCE:
+				file = self.layout.root.file(filerow['path'])
+				if isinstance(file, LocalFile):
+					digest, = self.db.execute(
+						'SELECT digest FROM files WHERE id=?', (filerow['id'],)
+					).fetchone()
+					self._parser_pool.submit(filerow['path'], file, self.layout.get_format(file), digest)
+
 	# We should not read file contents on db-file-inserted because
 	# there can be many in one iterarion when the FileIndexer indexes
 	# a folder. Therefore we only send page-changed in response to
@@ -124,9 +377,42 @@ class PagesIndexer(IndexerBase):
 			# TODO: Flag conflict
 			raise NotImplementedError
 
+	def set_known_content(self, path, lines, etag, parsetree=None):
+		'''Set the content of a page source file that is about to be
+		indexed, so it does not need to be read again. Used when a page
+		was just written.
+
+		If C{parsetree} is given it is indexed as is, else C{lines} are
+		parsed like they are when reading the file. A tree that was
+		not produced by the parser can not be used, it can have plain
+		text that becomes a tag or link when parsed.
+
+		@param path: the path of the file relative to the notebook folder
+		@param lines: the lines that were written to the file
+		@param etag: the etag for the content of the file as returned by
+		L{File.writelines_with_etag()}
+		@param parsetree: the L{ParseTree} that results from parsing
+		C{lines}, if known
+		'''
+		self._known_content[path] = (lines, etag, parsetree)
+
+	def _pop_known_content(self, filerow):
+		try:
+			lines, (mtime, digest), tree = self._known_content.pop(filerow['path'])
+		except KeyError:
+			return None
+		else:
+			if digest == filerow['digest']:
+				tree = None # content did not change
+			elif tree is None:
+				file = self.layout.root.file(filerow['path'])
+				tree = self.layout.get_format(file).Parser().parse(lines, file_input=True)
+			return mtime, digest, tree
+
 	def on_file_row_changed(self, o, filerow):
 		pagename, file_type = self.layout.map_filepath(filerow['path'])
 		if file_type != FILE_TYPE_PAGE_SOURCE:
+			self._known_content.pop(filerow['path'], None)
 			return # nothing to do
 
 		row = self._select(pagename)
@@ -135,13 +421,47 @@ class PagesIndexer(IndexerBase):
 			row = self._select(pagename)
 
 		if row['source_file'] == filerow['id']:
-			file = self.layout.root.file(filerow['path'])
-			format = self.layout.get_format(file)
-			mtime = file.mtime()
-			tree = format.Parser().parse(file.read())
-			self.update_page(pagename, mtime, tree)
+			# The digest of the content is kept in the files table, if the
+			# content did not change (e.g. only mtime was touched by a sync
+			# tool) there is no need to parse and update other indexers
+			result = self._pop_known_content(filerow) \
+				or (self._parser_pool and self._parser_pool.pop(filerow['path']))
+			if result:
+				mtime, digest, tree = result
+			else:
+				file = self.layout.root.file(filerow['path'])
+				format = self.layout.get_format(file)
+				mtime, digest, tree = _parse_file(file, format, filerow['digest'])
+
+			if tree is None:
+				self.db.execute(
+					'UPDATE pages SET mtime=? WHERE id=?',
+					(mtime, row['id']),
+				)
+			else:
+				self.db.execute(
+					'UPDATE files SET digest=? WHERE id=?',
+					(digest, filerow['id'])
+				)
+				self.update_page(pagename, mtime, tree)
 		else:
-			pass # some conflict file changed
+			self._known_content.pop(filerow['path'], None) # some conflict file changed
+
+	def flag_reindex_section(self, pagename):
+		'''Flag the source files of a page and all its sub-pages to be
+		indexed again on the next update, even when their content did not
+		change. For indexers that depend on the page name, e.g. after a
+		page was moved.
+		@param pagename: a L{Path}
+		'''
+		from .files import STATUS_NEED_UPDATE
+		self.db.execute(
+			'UPDATE files SET index_status=?, digest=NULL '
+			'WHERE id IN ('
+			'	SELECT source_file FROM pages WHERE name=? OR (name>? AND name<?)'
+			')',
+			(STATUS_NEED_UPDATE, pagename.name, pagename.name + ':', pagename.name + ';')
+		) # reset digest, else unchanged pages are skipped
 
 	def on_file_row_deleted(self, o, filerow):
 		pagename, file_type = self.layout.map_filepath(filerow['path'])
@@ -162,7 +482,7 @@ class PagesIndexer(IndexerBase):
 					# checks if any children have sources - else will be removed
 				try:
 					row = self._select(pagename)
-					self.emit('page-changed', row, emptyParseTree())
+					self.emit('page-changed', row, PageDigest(emptyParseTree()))
 				except IndexNotFoundError:
 					pass
 			else:
@@ -267,9 +587,71 @@ class PagesIndexer(IndexerBase):
 		)
 
 		row = self._select(pagename)
-		self.emit('page-changed', row, content)
+		self.emit('page-changed', row, PageDigest(content))
 		self.emit('page-row-changed', row, row)
 
+	def can_move_page(self, pagename, newpagename):
+		'''Returns C{True} if L{move_page()} can be used to move a page.
+		This is not the case if the page is moved below itself or if there
+		are pages other than placeholders at the new location.
+		'''
+		if newpagename.ischild(pagename) or self._select(pagename) is None:
+			return False
+
+		n, = self.db.execute(
+			'SELECT COUNT(*) FROM pages WHERE is_link_placeholder=0 '
+			'AND (name=? OR (name>? AND name<?))',
+			(newpagename.name, newpagename.name + ':', newpagename.name + ';')
+		).fetchone()
+		return n == 0
+
+	def move_page(self, pagename, newpagename):
+		'''Move a page and all child pages to a new name. The rows keep
+		their id, so the content indexed for these pages remains valid.
+		Placeholders at the new location are removed first. Check
+		L{can_move_page()} before calling this method.
+		'''
+		# Children sort after their parent by name length, so this
+		# removes placeholders bottom up
+		for name, in self.db.execute(
+			'SELECT name FROM pages WHERE name=? OR (name>? AND name<?) '
+			'ORDER BY length(name) DESC',
+			(newpagename.name, newpagename.name + ':', newpagename.name + ';')
+		).fetchall():
+			if self._select(Path(name)) is not None: # else cleaned up already
+				self.delete_link_placeholder(Path(name))
+
+		parent_row = self._select(newpagename.parent)
+		if parent_row is None:
+			self._insert_page(newpagename.parent, False)
+			parent_row = self._select(newpagename.parent)
+
+		oldrow = self._select(pagename)
+		self.emit('page-row-move', oldrow)
+		self.db.execute(
+			'UPDATE pages SET name=?, lowerbasename=?, sortkey=?, parent=? WHERE id=?',
+			(
+				newpagename.name, newpagename.basename.lower(),
+				natural_sort_key(newpagename.basename),
+				parent_row['id'], oldrow['id']
+			)
+		)
+		# Select children by range instead of LIKE, the name can contain
+		# wildcard characters and the range can use the "pages_name" index
+		self.db.execute(
+			'UPDATE pages SET name=? || substr(name, ?) WHERE name>? AND name<?',
+			(newpagename.name, len(pagename.name) + 1, pagename.name + ':', pagename.name + ';')
+		)
+		self._update_parent_nchildren(pagename.parent)
+		self._update_parent_nchildren(newpagename.parent)
+
+		row = self._select(newpagename)
+		self.emit('page-row-moved', row, oldrow)
+
+		self.update_parent(newpagename.parent)
+		if self._select(pagename.parent) is not None:
+			self.update_parent(pagename.parent)
+
 	def remove_page(self, pagename, allow_cleanup=lambda r: True):
 		# allow_cleanup is used by LinksIndexer when cleaning up placeholders
 
@@ -402,39 +784,7 @@ class PagesViewInternal(object):
 					i = [c for c, k in enumerate(keys) if k == anchor_key][-1]
 					return (start, start_id, relnames[:i] + href.parts())
 
-			if ignore_link_placeholders:
-				c = self.db.execute(
-					'SELECT name, id FROM pages '
-					'WHERE sortkey=? and is_link_placeholder=0 '
-					'ORDER BY name DESC',
-					(anchor_key,)
-				) # sort longest first
-			else:
-				c = self.db.execute(
-					'SELECT name, id FROM pages '
-					'WHERE sortkey=? '
-					'ORDER BY name DESC',
-					(anchor_key,)
-				) # sort longest first
-
-			maxdepth = source.name.count(':')
-			depth = -1 # level where items were found
-			found = [] # candidates that match the link - these can only differ in case of the basename
-			for name, pid in c:
-				mydepth = name.count(':')
-				if mydepth > maxdepth:
-					continue
-				elif mydepth < depth:
-					break
-
-				if mydepth > 0: # check whether we have a common parent
-					parentname = name.rsplit(':', 1)[0]
-					if start.name.startswith(parentname):
-						depth = mydepth
-						found.append((name, pid))
-				else: # resolve from root namespace
-					found.append((name, pid))
-
+			found = self._find_floating_anchors(source, start, anchor_key, ignore_link_placeholders)
 			if found: # try to match case first, else just use first match
 				parts = href.parts()
 				anchor = parts.pop(0)
@@ -452,6 +802,47 @@ class PagesViewInternal(object):
 				else:
 					return (start.parent, None, href.parts())
 
+	def _find_floating_anchors(self, source, start, anchor_key, ignore_link_placeholders=True):
+		# Returns a list of (name, id) for candidate pages matching the
+		# anchor of a floating link. Candidates can only differ in case of
+		# the basename. The result only depends on the namespace of "source"
+		# (and "start") and the anchor key, so it can be re-used for all
+		# links from the same namespace with the same anchor.
+		if ignore_link_placeholders:
+			c = self.db.execute(
+				'SELECT name, id FROM pages '
+				'WHERE sortkey=? and is_link_placeholder=0 '
+				'ORDER BY name DESC',
+				(anchor_key,)
+			) # sort longest first
+		else:
+			c = self.db.execute(
+				'SELECT name, id FROM pages '
+				'WHERE sortkey=? '
+				'ORDER BY name DESC',
+				(anchor_key,)
+			) # sort longest first
+
+		maxdepth = source.name.count(':')
+		depth = -1 # level where items were found
+		found = [] # candidates that match the link - these can only differ in case of the basename
+		for name, pid in c:
+			mydepth = name.count(':')
+			if mydepth > maxdepth:
+				continue
+			elif mydepth < depth:
+				break
+
+			if mydepth > 0: # check whether we have a common parent
+				parentname = name.rsplit(':', 1)[0]
+				if start.name.startswith(parentname):
+					depth = mydepth
+					found.append((name, pid))
+			else: # resolve from root namespace
+				found.append((name, pid))
+
+		return found
+
 	def resolve_pagename(self, parent, names, parent_id=None):
 		'''Resolve a pagename in the right case'''
 		# We do not ignore placeholders here. This can lead to a dependencies
@@ -844,12 +1235,22 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 	# Optimize lookup for finding records in the same level
 	# - always cache parent, to retrieve other children more quickly
 	# - cache a range of 20 records at once
+	# - keep a sorted list of keys per parent, so the position of a page
+	#   and the page at a position can be found by bisecting, and a range
+	#   can be selected by key instead of by offset
+	#
+	# The key lists are kept up to date with the row signals, so unlike
+	# the iter cache they survive "flush_cache()". Lookups are O(log n)
+	# for any namespace size, only the first lookup for a parent needs to
+	# load all keys from the (covering) index.
 
 	# Signals use "find_all" instead of "find" to allow for subclasses that
 	# have multiple entries, like models for tags
 
 	def __init__(self, index, root=None, reverse=False):
+		self._keys = {} # parent id -> sorted list of (sortkey, name)
 		TreeModelMixinBase.__init__(self, index)
+		self.connectto(index, 'new-update-iter', self._flush_keys)
 		self._REVERSE = reverse
 		if root is None:
 			self._MY_ROOT_NAME = ''
@@ -870,11 +1271,36 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 
 	def connect_to_updateiter(self, index, update_iter):
 		self.connectto_all(update_iter.pages,
-			('page-row-inserted', 'page-row-changed', 'page-row-delete', 'page-row-deleted')
+			('page-row-inserted', 'page-row-changed', 'page-row-delete', 'page-row-deleted',
+			'page-row-move', 'page-row-moved')
 		)
 
+	def _flush_keys(self, *a):
+		self._keys.clear()
+
+	def _get_keys(self, parent_id):
+		try:
+			return self._keys[parent_id]
+		except KeyError:
+			keys = [
+				tuple(r) for r in self.db.execute(
+					'SELECT sortkey, name FROM pages WHERE parent=? ORDER BY sortkey, name',
+					(parent_id,)
+				)
+			]
+			self._keys[parent_id] = keys
+			return keys
+
+	def _get_offset(self, parent_id, sortkey, name):
+		keys = self._get_keys(parent_id)
+		i = bisect.bisect_left(keys, (sortkey, name))
+		return len(keys) - 1 - i if self._REVERSE else i
+
 	def on_page_row_inserted(self, o, row):
 		self.flush_cache()
+		if row['parent'] in self._keys:
+			bisect.insort(self._keys[row['parent']], (row['sortkey'], row['name']))
+
 		if row['name'] == self._MY_ROOT_NAME:
 			self._set_root_id()
 		else:
@@ -906,6 +1332,13 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 		# always deal with that.
 
 		self.flush_cache()
+		keys = self._keys.get(row['parent'])
+		if keys:
+			i = bisect.bisect_left(keys, (row['sortkey'], row['name']))
+			if i < len(keys) and keys[i] == (row['sortkey'], row['name']):
+				keys.pop(i)
+		self._keys.pop(row['id'], None)
+
 		if row['name'] == self._MY_ROOT_NAME:
 			self._MY_ROOT_ID = None
 		else:
@@ -916,13 +1349,39 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 
 		self._deleted_paths = None
 
+	def on_page_row_move(self, o, row):
+		self.on_page_row_delete(o, row)
+
+	def on_page_row_moved(self, o, row, oldrow):
+		# Shown as a delete at the old position and an insert at the new
+		# position, child rows are included in the insert
+		self._flush_keys() # names changed for all child rows
+		self.on_page_row_deleted(o, oldrow)
+		self.on_page_row_inserted(o, row)
+		if row['n_children'] > 0:
+			for treepath in self._find_all_pages(row['name']):
+				self._emit_children_inserted(row['id'], treepath)
+
+	def _emit_children_inserted(self, pageid, treepath):
+		treeiter = self.get_iter(treepath) # not mytreeiter !
+		self.emit('row-has-child-toggled', treepath, treeiter)
+		for row in self.db.execute(
+			'SELECT id, name, n_children FROM pages WHERE parent = ?',
+			(pageid,)
+		):
+			for childtreepath in self._find_all_pages(row['name']):
+				if Gtk.TreePath(childtreepath[:-1]) == treepath:
+					treeiter = self.get_iter(childtreepath) # not mytreeiter !
+					self.emit('row-inserted', childtreepath, treeiter)
+					if row['n_children'] > 0:
+						self._emit_children_inserted(row['id'], childtreepath) # recurs
+					break
+
 	def n_children_top(self):
 		if self._MY_ROOT_ID is None:
 			return 0
 		else:
-			return self.db.execute(
-				'SELECT COUNT(*) FROM pages WHERE parent=?', (self._MY_ROOT_ID,)
-			).fetchone()[0]
+			return len(self._get_keys(self._MY_ROOT_ID))
 
 	def get_mytreeiter(self, treepath):
 		if self._MY_ROOT_ID is None:
@@ -944,21 +1403,30 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 			else:
 				return None
 
-		# Now cache a slice at the target level
+		# Now cache a slice at the target level, selecting from the key
+		# at the offset instead of using "OFFSET" in the query
 		offset = treepath[-1]
+		keys = self._get_keys(parent_id)
+		if offset >= len(keys):
+			return None
+
 		if self._REVERSE:
+			sortkey, name = keys[len(keys) - 1 - offset]
 			rows = self.db.execute('''
-				SELECT * FROM pages WHERE parent=?
-				ORDER BY sortkey DESC, name DESC LIMIT 20 OFFSET ?
+				SELECT * FROM pages WHERE parent=? AND sortkey<=?
+				AND (sortkey<? OR name<=?)
+				ORDER BY sortkey DESC, name DESC LIMIT 20
 				''',
-				(parent_id, offset)
+				(parent_id, sortkey, sortkey, name)
 			)
 		else:
+			sortkey, name = keys[offset]
 			rows = self.db.execute('''
-				SELECT * FROM pages WHERE parent=?
-				ORDER BY sortkey ASC, name ASC LIMIT 20 OFFSET ?
+				SELECT * FROM pages WHERE parent=? AND sortkey>=?
+				AND (sortkey>? OR name>=?)
+				ORDER BY sortkey ASC, name ASC LIMIT 20
 				''',
-				(parent_id, offset)
+				(parent_id, sortkey, sortkey, name)
 			)
 		for i, row in enumerate(rows):
 			mytreepath = tuple(parentpath) + (offset + i,)
@@ -1017,24 +1485,7 @@ class PagesTreeModelMixin(TreeModelMixinBase):
 			if myrow is None:
 				raise IndexNotFoundError
 
-			sortkey = myrow['sortkey']
-			if self._REVERSE:
-				row = self.db.execute('''
-					SELECT COUNT(*) FROM pages
-					WHERE parent=? and (
-						sortkey>? or (sortkey=? and name>?)
-					)''',
-					(parent_id, sortkey, sortkey, name)
-				).fetchone()
-			else:
-				row = self.db.execute('''
-					SELECT COUNT(*) FROM pages
-					WHERE parent=? and (
-						sortkey<? or (sortkey=? and name<?)
-					)''',
-					(parent_id, sortkey, sortkey, name)
-				).fetchone()
-			treepath.append(row[0])
+			treepath.append(self._get_offset(parent_id, myrow['sortkey'], name))
 			parent_id = myrow['id']
 
 			if update_cache:
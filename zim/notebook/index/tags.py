@@ -351,24 +351,10 @@ class TagsTreeModelBase(PagesTreeModelMixin):
 		else:
 			self._tagquery = ' in %s ' % (self._tagids,)
 
-	def _emit_children_inserted(self, pageid, treepath):
-		treeiter = self.get_iter(treepath) # not mytreeiter !
-		self.emit('row-has-child-toggled', treepath, treeiter)
-		for row in self.db.execute(
-			'SELECT id, name, n_children FROM pages WHERE parent = ?',
-			(pageid,)
-		):
-			for childtreepath in self._find_all_pages(row['name']):
-				if Gtk.TreePath(childtreepath[:-1]) == treepath:
-					treeiter = self.get_iter(childtreepath) # not mytreeiter !
-					self.emit('row-inserted', childtreepath, treeiter)
-					if row['n_children'] > 0:
-						self._emit_children_inserted(row['id'], childtreepath) # recurs
-					break
-
 	def connect_to_updateiter(self, index, update_iter):
 		self.connectto_all(update_iter.pages,
-			('page-row-inserted', 'page-row-changed', 'page-row-delete', 'page-row-deleted')
+			('page-row-inserted', 'page-row-changed', 'page-row-delete', 'page-row-deleted',
+			'page-row-move', 'page-row-moved')
 		)
 		self.connectto_all(update_iter.tags,
 			('tag-row-inserted', 'tag-row-deleted', 'tag-added-to-page', 'tag-remove-from-page', 'tag-removed-from-page')
@@ -29,6 +29,7 @@ from zim.signals import ConnectorMixin, SignalEmitter, SIGNAL_NORMAL
 
 from .operations import notebook_state, NOOP, SimpleAsyncOperation, ongoing_operation
 from .page import Path, Page, HRef, HREF_REL_ABSOLUTE, HREF_REL_FLOATING, HREF_REL_RELATIVE
+from .parsetreecache import ParseTreeCache
 from .index import IndexNotFoundError, LINK_DIR_BACKWARD, ROOT_PATH
 
 DATA_FORMAT_VERSION = (0, 4)
@@ -108,6 +109,20 @@ def _cache_dir_for_dir(dir):
 	return XDG_CACHE_HOME.folder(('zim', path))
 
 
+def _layout_from_config(config, folder):
+	from .layout import FilesLayout
+
+	if config['Notebook']['notebook_layout'] == 'files':
+		return FilesLayout(
+			folder,
+			config['Notebook']['endofline'],
+			config['Notebook']['default_file_format'],
+			config['Notebook']['default_file_extension']
+		)
+	else:
+		raise ValueError('Unkonwn notebook layout: %s' % config['Notebook']['notebook_layout'])
+
+
 class PageError(Error):
 
 	def __init__(self, path):
@@ -204,6 +219,7 @@ class Notebook(ConnectorMixin, SignalEmitter):
 	@ivar config: A L{SectionedConfigDict} for the notebook config
 	(the C{X{notebook.zim}} config file in the notebook folder)
 	@ivar index: The L{Index} object used by the notebook
+	@ivar parsetree_cache: The L{ParseTreeCache} object used for pages or C{None}
 	'''
 
 	# define signals we want to use - (closure type, return type and arg types)
@@ -241,7 +257,6 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			return nb
 
 		from .index import Index
-		from .layout import FilesLayout
 
 		config = NotebookConfig(dir.file('notebook.zim'))
 
@@ -254,33 +269,49 @@ class Notebook(ConnectorMixin, SignalEmitter):
 				cache_dir = _cache_dir_for_dir(dir)
 
 		folder = LocalFolder(dir.path)
-		if config['Notebook']['notebook_layout'] == 'files':
-			layout = FilesLayout(
-				folder,
-				config['Notebook']['endofline'],
-				config['Notebook']['default_file_format'],
-				config['Notebook']['default_file_extension']
-			)
-		else:
-			raise ValueError('Unkonwn notebook layout: %s' % config['Notebook']['notebook_layout'])
+		layout = _layout_from_config(config, folder)
 
 		cache_dir.touch() # must exist for index to work
 		index = Index(cache_dir.file('index.db').path, layout)
+		parsetree_cache = ParseTreeCache(cache_dir.file('parsetrees.db').path)
 
-		nb = klass(cache_dir, config, folder, layout, index)
+		nb = klass(cache_dir, config, folder, layout, index, parsetree_cache)
 		_NOTEBOOK_CACHE[dir.uri] = nb
 		return nb
 
-	def __init__(self, cache_dir, config, folder, layout, index):
+	@classmethod
+	def new_for_reading(klass, dir, dbpath):
+		'''Constructor for a notebook that uses an existing index without
+		updating it, e.g. to read the notebook in a worker process while
+		the index is owned by the main process. Unlike L{new_from_dir()}
+		the object is not shared.
+
+		@param dir: a L{LocalFolder} object
+		@param dbpath: the file path of the index database
+		@returns: a L{Notebook} object
+		@raises ValueError: if the index can not be opened
+		'''
+		from .index import Index
+
+		config = NotebookConfig(dir.file('notebook.zim'))
+		folder = LocalFolder(dir.path)
+		layout = _layout_from_config(config, folder)
+		index = Index(dbpath, layout, readonly=True)
+		cache_dir = LocalFile(dbpath).parent()
+		return klass(cache_dir, config, folder, layout, index)
+
+	def __init__(self, cache_dir, config, folder, layout, index, parsetree_cache=None):
 		'''Constructor
 		@param cache_dir: a L{Folder} object used for caching the notebook state
 		@param config: a L{NotebookConfig} object
 		@param folder: a L{Folder} object for the notebook location
 		@param layout: a L{NotebookLayout} object
 		@param index: an L{Index} object
+		@param parsetree_cache: a L{ParseTreeCache} object or C{None}
 		'''
 		self.folder = folder
 		self.cache_dir = cache_dir
+		self.parsetree_cache = parsetree_cache
 		self.state = INIConfigFile(cache_dir.file('state.conf'))
 		self.config = config
 		self.properties = config['Notebook']
@@ -409,7 +440,7 @@ class Notebook(ConnectorMixin, SignalEmitter):
 
 			folder = self.layout.get_attachments_folder(path)
 			format = self.layout.get_format(file)
-			page = Page(path, False, file, folder, format)
+			page = Page(path, False, file, folder, format, self.parsetree_cache)
 			if self.readonly:
 				page._readonly = True # XXX
 			try:
@@ -466,21 +497,30 @@ class Notebook(ConnectorMixin, SignalEmitter):
 		@emits: store-page before storing the page
 		@emits: stored-page on success
 		'''
+		self._store_page(page)
+		page.set_modified(False)
+		self.emit('stored-page', page)
+
+	def _store_page(self, page):
+		# Write the page and update the index, the index update is queued
+		# when within L{Index.deferred_update()}. Caller should emit
+		# "stored-page" when the index is updated.
 		logger.debug('Store page: %s', page)
 		self.emit('store-page', page)
-		page._store()
+		tree = page.get_parsetree()
+		lines = page._store_tree(tree)
 		file, folder = self.layout.map_page(page)
-		self.index.update_file(file)
-		page.set_modified(False)
-		self.emit('stored-page', page)
+		self.index.update_file(file, lines, page._last_etag,
+			tree if page._is_parsed_tree(tree) else None)
 
 	@notebook_state
 	def store_page_async(self, page, parsetree):
 		logger.debug('Store page in background: %s', page)
 		self.emit('store-page', page)
 		error = threading.Event()
+		stored = []
 		thread = threading.Thread(
-			target=partial(self._store_page_async_thread_main, page, parsetree, error)
+			target=partial(self._store_page_async_thread_main, page, parsetree, error, stored)
 		)
 		thread.start()
 		pre_modified = page.modified
@@ -488,23 +528,26 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			notebook=self,
 			message='Store page in progress',
 			thread=thread,
-			post_handler=partial(self._store_page_async_finished, page, error, pre_modified)
+			post_handler=partial(self._store_page_async_finished, page, error, pre_modified, stored)
 		)
 		op.error_event = error
 		op.run_on_idle()
 		return op
 
-	def _store_page_async_thread_main(self, page, parsetree, error):
+	def _store_page_async_thread_main(self, page, parsetree, error, stored):
 		try:
-			page._store_tree(parsetree)
+			lines = page._store_tree(parsetree)
+			stored.append((lines, page._last_etag, parsetree))
 		except:
 			error.set()
 			logger.exception('Error in background save')
 
-	def _store_page_async_finished(self, page, error, pre_modified):
+	def _store_page_async_finished(self, page, error, pre_modified, stored):
 		if not error.is_set():
 			file, folder = self.layout.map_page(page)
-			self.index.update_file(file)
+			lines, etag, parsetree = stored[0] if stored else (None, None, None)
+			self.index.update_file(file, lines, etag,
+				parsetree if page._is_parsed_tree(parsetree) else None)
 			if page.modified == pre_modified:
 				# HACK: Checking modified state protects against race condition
 				# in async store. Works because pageview sets "page.modified"
@@ -543,8 +586,8 @@ class Notebook(ConnectorMixin, SignalEmitter):
 	@assert_index_uptodate
 	@notebook_state
 	def move_page_iter(self, path, newpath, update_links=True, update_heading=False):
-		'''Like L{move_page()} but yields pages that are being updated
-		if C{update_links} is C{True}
+		'''Like L{move_page()} but yields progress while updating links
+		if C{update_links} is C{True}, see L{_update_pages_iter()}
 		'''
 		logger.debug('Move page %s to %s', path, newpath)
 
@@ -638,31 +681,55 @@ class Notebook(ConnectorMixin, SignalEmitter):
 
 		# Process index changes after all fs changes
 		# more robust if anything goes wrong in index update
-		for old, new in changes:
-			self.index.file_moved(old, new)
-
+		self.index.page_moved(path, newpath, changes)
+
+
+	def _update_pages_iter(self, updates):
+		# Batch update of page contents, used to update links in many
+		# pages at once. All pages are stored within a single deferred
+		# index update, so the new parse trees are computed from the
+		# state of the index before the update and the index is updated
+		# with a single commit at the end. This also happens when the
+		# operation is cancelled, for the pages stored so far.
+		# Yields progress as 3-tuples of the step number, the total
+		# number of steps and the path, see NotebookOperation.
+		total = len(updates)
+		stored = []
+		try:
+			with self.index.deferred_update():
+				for i, (path, func) in enumerate(updates):
+					yield i, total, path
+					page = self.get_page(path)
+					tree = page.get_parsetree()
+					if tree:
+						page.set_parsetree(func(page, tree))
+						self._store_page(page)
+						stored.append(page)
+		finally:
+			for page in stored:
+				page.set_modified(False)
+				self.emit('stored-page', page)
 
 	def _update_links_in_moved_page(self, oldroot, newroot):
 		# Find (floating) links that originate from the moved page
 		# check if they would resolve different from the old location
+		updates = []
 		seen = set()
-		for link in list(self.links.list_links_section(newroot)):
+		for link in self.links.list_links_section(newroot):
 			if link.source.name not in seen:
 				if link.source == newroot:
 					oldpath = oldroot
 				else:
 					oldpath = oldroot + link.source.relname(newroot)
 
-				yield link.source
-				self._update_moved_page(link.source, oldpath, newroot, oldroot)
+				updates.append((link.source,
+					partial(self._update_moved_page, oldpath=oldpath, newroot=newroot, oldroot=oldroot)))
 				seen.add(link.source.name)
 
-	def _update_moved_page(self, path, oldpath, newroot, oldroot):
-		logger.debug('Updating links in page moved from %s to %s', oldpath, path)
-		page = self.get_page(path)
-		tree = page.get_parsetree()
-		if not tree:
-			return
+		return self._update_pages_iter(updates)
+
+	def _update_moved_page(self, page, tree, oldpath, newroot, oldroot):
+		logger.debug('Updating links in page moved from %s to %s', oldpath, page)
 
 		def replacefunc(elt):
 			text = elt.attrib['href']
@@ -699,45 +766,43 @@ class Notebook(ConnectorMixin, SignalEmitter):
 
 			return elt
 
-		newtree = tree.substitute_elements((zim.formats.LINK,), replacefunc)
-		page.set_parsetree(newtree)
-		self.store_page(page)
+		return tree.substitute_elements((zim.formats.LINK,), replacefunc)
 
 	def _update_links_to_moved_page(self, oldroot, newroot):
 		# 1. Check remaining placeholders, update pages causing them
+		updates = []
 		seen = set()
+		def func(page, tree):
+			return self._move_links_in_page(page, tree, oldroot, newroot)
+
 		try:
 			oldroot = self.pages.lookup_by_pagename(oldroot)
 		except IndexNotFoundError:
 			pass
 		else:
-			for link in list(self.links.list_links_section(oldroot, LINK_DIR_BACKWARD)):
+			for link in self.links.list_links_section(oldroot, LINK_DIR_BACKWARD):
 				if link.source.name not in seen:
-					yield link.source
-					self._move_links_in_page(link.source, oldroot, newroot)
+					updates.append((link.source, func))
 					seen.add(link.source.name)
 
 		# 2. Check for links that have anchor of same name as the moved page
 		# and originate from a (grand)child of the parent of the moved page
 		# and no longer resolve to the moved page
 		parent = oldroot.parent
-		for link in list(self.links.list_floating_links(oldroot.basename)):
+		for link in self.links.list_floating_links(oldroot.basename):
 			if link.source.name not in seen \
 			and link.source.ischild(parent) \
 			and not (
 				link.target == newroot
 				or link.target.ischild(newroot)
 			):
-				yield link.source
-				self._move_links_in_page(link.source, oldroot, newroot)
+				updates.append((link.source, func))
 				seen.add(link.source.name)
 
-	def _move_links_in_page(self, path, oldroot, newroot):
-		logger.debug('Updating page %s to move link from %s to %s', path, oldroot, newroot)
-		page = self.get_page(path)
-		tree = page.get_parsetree()
-		if not tree:
-			return
+		return self._update_pages_iter(updates)
+
+	def _move_links_in_page(self, page, tree, oldroot, newroot):
+		logger.debug('Updating page %s to move link from %s to %s', page, oldroot, newroot)
 
 		def replacefunc(elt):
 			text = elt.attrib['href']
@@ -774,9 +839,7 @@ class Notebook(ConnectorMixin, SignalEmitter):
 
 			return elt
 
-		newtree = tree.substitute_elements((zim.formats.LINK,), replacefunc)
-		page.set_parsetree(newtree)
-		self.store_page(page)
+		return tree.substitute_elements((zim.formats.LINK,), replacefunc)
 
 	def _update_link_tag(self, elt, source, target, oldhref):
 		if oldhref.rel == HREF_REL_ABSOLUTE: # prefer to keep absolute links
@@ -938,21 +1001,15 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			else:
 				pages = set(
 					l.source for l in self.links.list_links_section(path, LINK_DIR_BACKWARD))
-
-				for p in pages:
-					yield p
-					page = self.get_page(p)
-					self._remove_links_in_page(page, path)
-					self.store_page(page)
+				func = partial(self._remove_links_in_page, path=path)
+				for step in self._update_pages_iter([(p, func) for p in pages]):
+					yield step
 
 		# let everybody know what happened
 		self.emit('deleted-page', path)
 
-	def _remove_links_in_page(self, page, path):
+	def _remove_links_in_page(self, page, tree, path):
 		logger.debug('Removing links in %s to %s', page, path)
-		tree = page.get_parsetree()
-		if not tree:
-			return
 
 		def replacefunc(elt):
 			href = elt.attrib['href']
@@ -969,8 +1026,7 @@ class Notebook(ConnectorMixin, SignalEmitter):
 			else:
 				return elt
 
-		newtree = tree.substitute_elements((zim.formats.LINK,), replacefunc)
-		page.set_parsetree(newtree)
+		return tree.substitute_elements((zim.formats.LINK,), replacefunc)
 
 	def resolve_file(self, filename, path=None):
 		'''Resolve a file or directory path relative to a page or
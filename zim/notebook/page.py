@@ -449,7 +449,7 @@ class Page(Path, SignalEmitter):
 		'modified-changed': (SIGNAL_NORMAL, None, ()),
 	}
 
-	def __init__(self, path, haschildren, file, folder, format):
+	def __init__(self, path, haschildren, file, folder, format, cache=None):
 		assert isinstance(path, Path)
 		self.name = path.name
 		self.haschildren = haschildren
@@ -458,6 +458,7 @@ class Page(Path, SignalEmitter):
 		self._modified = False
 		self._change_counter = 0
 		self._parsetree = None
+		self._parsed_tree = None # last tree that is known to be parser output
 		self._textbuffer = None
 		self._meta = None
 
@@ -469,6 +470,7 @@ class Page(Path, SignalEmitter):
 			self.format = format
 		self.source_file = file
 		self.attachments_folder = folder
+		self._cache = cache
 
 	@property
 	def readonly(self):
@@ -524,9 +526,16 @@ class Page(Path, SignalEmitter):
 
 	def _store(self):
 		tree = self.get_parsetree()
-		self._store_tree(tree)
+		return self._store_tree(tree)
+
+	def _is_parsed_tree(self, tree):
+		# Returns C{True} if C{tree} is known to be the same as the output
+		# of the parser for the content written by L{_store_tree()}, so
+		# the index does not need to parse the stored page again
+		return tree is not None and tree is self._parsed_tree
 
 	def _store_tree(self, tree):
+		# Returns the lines that were written, or None if the file was removed
 		if tree and tree.hascontent:
 			if self._meta is not None:
 				tree.meta.update(self._meta) # Preserver headers
@@ -540,6 +549,7 @@ class Page(Path, SignalEmitter):
 					parser = self.format.Parser()
 					tree = parser.parse(text)
 					self._meta = tree.meta
+					self._parsed_tree = None # tree written is not the tree given
 					tree.meta.update(self._meta) # Preserver headers
 			else: # not self.source_file.exists()
 				now = datetime.now()
@@ -552,7 +562,9 @@ class Page(Path, SignalEmitter):
 			self.source_file.remove()
 			self._last_etag = None
 			self._meta = None
+			lines = None
 		self.emit('storage-changed', False)
+		return lines
 
 	def check_source_changed(self):
 		'''Checks for changes in the source file and load it if needed
@@ -612,11 +624,21 @@ class Page(Path, SignalEmitter):
 			if self._textbuffer.get_modified() or self._parsetree is None:
 				self._parsetree = self._textbuffer.get_parsetree()
 				self._textbuffer.set_modified(False)
+				if self.format is zim.formats.get_format('wiki'):
+					# The buffer returns the tree as parsed from wiki text
+					self._parsed_tree = self._parsetree
 			#~ print self._parsetree.tostring()
 			return self._parsetree
 		elif self._parsetree:
 			return self._parsetree
 		else:
+			cached = self._cache and self._cache.get(self.source_file, self.format)
+			if cached:
+				self._parsetree, self._last_etag = cached
+				self._parsed_tree = self._parsetree
+				self._meta = self._parsetree.meta
+				return self._parsetree
+
 			try:
 				text, self._last_etag = self.source_file.read_with_etag()
 			except zim.newfs.FileNotFoundError:
@@ -624,8 +646,11 @@ class Page(Path, SignalEmitter):
 			else:
 				parser = self.format.Parser()
 				self._parsetree = parser.parse(text, file_input=True)
+				self._parsed_tree = self._parsetree
 				self._meta = self._parsetree.meta
 				assert self._meta is not None
+				if self._cache:
+					self._cache.set(self.source_file, self.format, self._parsetree, self._last_etag)
 				return self._parsetree
 
 	def set_parsetree(self, tree):
@@ -644,6 +669,8 @@ class Page(Path, SignalEmitter):
 
 	def _set_parsetree(self, tree):
 		self._parsetree = tree
+		if tree is not self._parsed_tree:
+			self._parsed_tree = None
 		if self._textbuffer:
 			assert not self._textbuffer.get_modified(), 'BUG: changing parsetree while buffer was changed as well'
 			try:
@@ -0,0 +1,219 @@
+# Copyright 2026 agent <agent@local>
+
+'''Persistent cache of parse trees for page source files
+
+The cache is a sqlite database in the notebook cache folder, next to the
+index. Entries are keyed by the path of the source file and are only
+valid for the same mtime, size and format version. Parse trees are stored
+with a compact binary encoding based on the C{marshal} module, which is
+much faster to load than parsing the source again.
+
+The total size of the cache is bounded, the least recently used entries
+are dropped first. The cache is only an optimization, any error in
+reading or writing the cache disables it without affecting the notebook.
+'''
+
+import marshal
+import sqlite3
+import logging
+import threading
+
+import zim
+
+from zim.newfs import FileNotFoundError
+from zim.formats import ParseTree, ElementTreeModule
+
+
+logger = logging.getLogger('zim.notebook')
+
+
+CACHE_VERSION = 1 #: version of the binary encoding, bump when changing it
+
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024 #: default size bound in bytes
+
+
+def encode_parsetree(tree):
+	'''Encode a parse tree as bytes
+	@param tree: a L{ParseTree} object
+	@returns: a C{bytes} object
+	@raises ValueError: if the tree contains attributes that can not be
+	encoded
+	'''
+	def encode_element(elt):
+		return (
+			elt.tag, elt.attrib, elt.text, elt.tail,
+			tuple(encode_element(c) for c in elt) # recurs
+		)
+
+	root = tree._etree.getroot()
+	return marshal.dumps((tuple(tree.meta.items()), encode_element(root)))
+
+
+def decode_parsetree(data):
+	'''Decode a parse tree encoded with L{encode_parsetree()}
+	@param data: a C{bytes} object
+	@returns: a L{ParseTree} object
+	'''
+	def decode_element(data):
+		tag, attrib, text, tail, children = data
+		elt = ElementTreeModule.Element(tag, attrib)
+		elt.text = text
+		elt.tail = tail
+		elt.extend(decode_element(c) for c in children) # recurs
+		return elt
+
+	meta, root = marshal.loads(data)
+	tree = ParseTree(decode_element(root))
+	for k, v in meta:
+		tree.meta[k] = v
+	return tree
+
+
+class ParseTreeCache(object):
+	'''Cache of parse trees for page source files, used by L{Page}
+	objects to avoid parsing files that did not change.
+	'''
+
+	def __init__(self, dbpath, max_size=DEFAULT_MAX_SIZE):
+		'''Constructor
+		@param dbpath: path for the cache database file or ":memory:"
+		@param max_size: maximum total size of the cached data in bytes
+		'''
+		self.dbpath = dbpath
+		self.max_size = max_size
+		self._lock = threading.Lock()
+		self._db = None
+		self._size = 0
+		self._counter = 0
+		try:
+			self._db_connect()
+		except sqlite3.Error:
+			logger.exception('Could not open parse tree cache: %s', dbpath)
+			self._db = None
+
+	def _db_connect(self):
+		# The cache can be regenerated at any time, so durability is not
+		# needed, use autocommit and no syncing to keep writes cheap
+		self._db = sqlite3.connect(self.dbpath, isolation_level=None, check_same_thread=False)
+		self._db.executescript('''
+			PRAGMA synchronous=OFF;
+			CREATE TABLE IF NOT EXISTS parsetrees (
+				path TEXT PRIMARY KEY,
+				mtime REAL,
+				size INTEGER,
+				version TEXT,
+				md5 BLOB,
+				data BLOB,
+				atime INTEGER
+			);
+			CREATE INDEX IF NOT EXISTS parsetrees_atime ON parsetrees(atime);
+		''')
+		size, counter = self._db.execute(
+			'SELECT SUM(length(data)), MAX(atime) FROM parsetrees'
+		).fetchone()
+		self._size = size or 0
+		self._counter = counter or 0
+
+	@staticmethod
+	def _version(format):
+		return '%s %s %s %s' % (zim.__version__, format.__name__, marshal.version, CACHE_VERSION)
+
+	def get(self, file, format):
+		'''Get a cached parse tree
+		@param file: the source L{File}
+		@param format: the format module used to parse the file
+		@returns: a 2-tuple of a L{ParseTree} and an etag for C{file} as
+		returned by L{File.read_with_etag()}, or C{None} if there is no
+		valid entry for the current state of C{file}
+		'''
+		if self._db is None:
+			return None
+
+		try:
+			mtime, size = file.mtime(), file.size()
+		except FileNotFoundError:
+			return None
+
+		with self._lock:
+			try:
+				row = self._db.execute(
+					'SELECT md5, data FROM parsetrees '
+					'WHERE path=? AND mtime=? AND size=? AND version=?',
+					(file.path, mtime, size, self._version(format))
+				).fetchone()
+				if row is None:
+					return None
+
+				self._counter += 1
+				self._db.execute(
+					'UPDATE parsetrees SET atime=? WHERE path=?',
+					(self._counter, file.path)
+				)
+				md5, data = row
+				return decode_parsetree(data), (mtime, md5)
+			except Exception:
+				self._disable()
+				return None
+
+	def set(self, file, format, tree, etag):
+		'''Store a parse tree in the cache
+		@param file: the source L{File}
+		@param format: the format module used to parse the file
+		@param tree: the L{ParseTree} for the content of C{file}
+		@param etag: the etag for the content of C{file} as returned by
+		L{File.read_with_etag()}
+		'''
+		if self._db is None:
+			return
+
+		try:
+			data = encode_parsetree(tree)
+		except ValueError:
+			logger.debug('Could not encode parse tree for: %s', file.path)
+			return
+
+		mtime, md5 = etag
+		with self._lock:
+			try:
+				self._counter += 1
+				old, = self._db.execute(
+					'SELECT length(data) FROM parsetrees WHERE path=?', (file.path,)
+				).fetchone() or (0,)
+				self._db.execute(
+					'INSERT OR REPLACE INTO parsetrees(path, mtime, size, version, md5, data, atime) '
+					'VALUES (?, ?, ?, ?, ?, ?, ?)',
+					(file.path, mtime, file.size(), self._version(format), md5, data, self._counter)
+				)
+				self._size += len(data) - old
+				if self._size > self.max_size:
+					self._evict()
+			except Exception:
+				self._disable()
+
+	def _evict(self):
+		# Drop least recently used entries until we are well within bounds
+		target = self.max_size * 3 // 4
+		drop = []
+		for path, size in self._db.execute(
+			'SELECT path, length(data) FROM parsetrees ORDER BY atime'
+		).fetchall():
+			if self._size <= target:
+				break
+			drop.append((path,))
+			self._size -= size
+		self._db.executemany('DELETE FROM parsetrees WHERE path=?', drop)
+
+	def _disable(self):
+		logger.exception('Error in parse tree cache, disabling cache: %s', self.dbpath)
+		try:
+			self._db.close()
+		except sqlite3.Error:
+			pass
+		self._db = None
+
+	def clear(self):
+		'''Remove all entries from the cache'''
+		if self._db is not None:
+			with self._lock:
+				self._db.execute('DELETE FROM parsetrees')
+				self._size = 0
@@ -133,6 +133,9 @@ class FileBrowserIconView(Gtk.IconView):
 		self.folder = None
 		self._thumbnailer = ThumbnailQueue()
 		self._idle_event_id = None
+		self._visible_event_id = None
+		self._vadjustment = None
+		self._iters = {} # basename -> iter
 		self._monitor = None
 		self._mtime = None
 
@@ -159,6 +162,8 @@ class FileBrowserIconView(Gtk.IconView):
 
 		self.connect('button-press-event', self.on_button_press_event)
 		self.connect('item-activated', self.on_item_activated)
+		self.connect('notify::vadjustment', self._on_vadjustment_changed)
+		self.connect('size-allocate', lambda *a: self._queue_update_visible())
 
 	def set_use_thumbnails(self, use_thumbnails):
 		self.use_thumbnails = use_thumbnails
@@ -196,9 +201,7 @@ class FileBrowserIconView(Gtk.IconView):
 		#~ print("start", time.time())
 
 		self._thumbnailer.clear_queue()
-		if self._idle_event_id:
-			GObject.source_remove(self._idle_event_id)
-			self._idle_event_id = None
+		self._stop_idle_events()
 
 		# Get cache, clear model
 		cache = {}
@@ -206,6 +209,7 @@ class FileBrowserIconView(Gtk.IconView):
 		for str, pixbuf, mtime in model:
 			cache[str] = (pixbuf, mtime)
 		model.clear()
+		self._iters = {}
 
 		# Cache for mime icons - speed up lookup
 		min_icon_size = min((self.icon_size, MAX_ICON_SIZE)) # Avoid huge icons
@@ -229,6 +233,10 @@ class FileBrowserIconView(Gtk.IconView):
 				pixbuf = my_get_mime_icon(file)
 				mtime = None
 			elif show_thumbs and file.isimage():
+				if not pixbuf:
+					# Thumbnails of previous folders are kept in memory,
+					# the request below checks whether they are still valid
+					pixbuf, mtime = self._thumbnailer.cache.get(file, self.icon_size)
 				if not pixbuf:
 					pixbuf = my_get_mime_icon(file) # temporary icon
 					mtime = None
@@ -243,34 +251,86 @@ class FileBrowserIconView(Gtk.IconView):
 			else:
 				pass # re-use from cache
 
-			model.append((file.basename, pixbuf, mtime))
+			self._iters[file.basename] = model.append((file.basename, pixbuf, mtime))
 
 		self._set_orientation_and_size(max_text)
 
 		if not self._thumbnailer.queue_empty():
-			self._thumbnailer.start() # delay till here - else reduces our speed on loading
+			self._start_thumbnailer() # delay till here - else reduces our speed on loading
+			self._queue_update_visible()
+
+		#~ print("stop ", time.time())
+
+	def _start_thumbnailer(self):
+		self._thumbnailer.start()
+		if not self._idle_event_id:
 			self._idle_event_id = \
 				GObject.idle_add(self._on_check_thumbnail_queue)
 
-		#~ print("stop ", time.time())
+	def _stop_idle_events(self):
+		for attr in ('_idle_event_id', '_visible_event_id'):
+			id = getattr(self, attr)
+			if id:
+				GObject.source_remove(id)
+				setattr(self, attr, None)
 
 	def _on_check_thumbnail_queue(self):
-		file, size, thumbfile, pixbuf, mtime = \
-			self._thumbnailer.get_ready_thumbnail()
-		if file is not None:
-			basename = file.basename
-			model = self.get_model()
-			def update(model, path, iter):
-				if model[iter][BASENAME_COL] == basename:
-					model[iter][PIXBUF_COL] = pixbuf
-					model[iter][MTIME_COL] = mtime
-			model.foreach(update)
+		# Handle a batch of thumbnails per idle event, with multiple
+		# worker threads they come in faster than one per event
+		model = self.get_model()
+		for i in range(20):
+			file, size, thumbfile, pixbuf, mtime = \
+				self._thumbnailer.get_ready_thumbnail()
+			if file is None:
+				break
+
+			iter = self._iters.get(file.basename)
+			if iter is not None and size == self.icon_size:
+				model[iter][PIXBUF_COL] = pixbuf
+				model[iter][MTIME_COL] = mtime
 
 		cont = not self._thumbnailer.queue_empty()
 		if not cont:
 			self._idle_event_id = None
 		return cont # if False event is stopped
 
+	def _on_vadjustment_changed(self, *a):
+		if self._vadjustment:
+			adjustment, id = self._vadjustment
+			adjustment.disconnect(id)
+			self._vadjustment = None
+
+		adjustment = self.get_vadjustment()
+		if adjustment:
+			id = adjustment.connect('value-changed', lambda *a: self._queue_update_visible())
+			self._vadjustment = (adjustment, id)
+
+	def _queue_update_visible(self):
+		if not self._visible_event_id:
+			self._visible_event_id = \
+				GObject.idle_add(self._update_visible)
+
+	def _update_visible(self):
+		# Tell the thumbnailer which icons are visible, so these get
+		# thumbnails first and requests for icons that scrolled out of
+		# view are cancelled.
+		self._visible_event_id = None
+		visible = self.get_visible_range()
+		if self.folder is None or not visible:
+			return False # stop event
+
+		start, end = visible
+		model = self.get_model()
+		files = [
+			self.folder.file(model[i][BASENAME_COL])
+				for i in range(start.get_indices()[0], end.get_indices()[0] + 1)
+		]
+		self._thumbnailer.set_visible(files, self.icon_size)
+		if not self._thumbnailer.queue_empty():
+			self._start_thumbnailer()
+
+		return False # stop event
+
 	def _set_orientation_and_size(self, max_text_length):
 		# Set item width to force wrapping text for long items
 		# Set to icon size + some space for padding etc.
@@ -308,9 +368,7 @@ class FileBrowserIconView(Gtk.IconView):
 		finally:
 			self._monitor = None
 
-		if self._idle_event_id:
-			GObject.source_remove(self._idle_event_id)
-			self._idle_event_id = None
+		self._stop_idle_events()
 
 		try:
 			self._thumbnailer.clear_queue()
@@ -318,6 +376,7 @@ class FileBrowserIconView(Gtk.IconView):
 			logger.exception('Could not stop thumbnailer')
 
 		self.get_model().clear()
+		self._iters = {}
 
 	def _on_folder_changed(self, *a):
 		try:
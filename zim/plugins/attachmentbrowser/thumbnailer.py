@@ -45,6 +45,7 @@ import hashlib
 import time
 import threading
 
+from collections import OrderedDict
 from queue import Queue
 from queue import Empty as QueueEmpty
 
@@ -86,7 +87,9 @@ def pixbufThumbnailCreator(file, thumbfile, thumbsize):
 	if not (isinstance(file, LocalFile) and isinstance(thumbfile, LocalFile)):
 		raise ThumbnailCreatorFailure()
 
-	tmpfile = thumbfile.parent().file('zim-thumb.new~')
+	tmpfile = thumbfile.parent().file('%s.%i-%i.new~' % (
+		thumbfile.basename, os.getpid(), threading.get_ident()
+	)) # unique per thumbnail and thread, thumbnails are created in parallel
 	options = { # no unicode allowed in options!
 		'tEXt::Thumb::URI': str(file.uri),
 		'tEXt::Thumb::MTime': str(int(file.mtime())),
@@ -101,32 +104,104 @@ def pixbufThumbnailCreator(file, thumbfile, thumbsize):
 		pixbuf.savev(tmpfile.path, 'png', optionskeys, optionsvalues)
 		_atomic_rename(tmpfile.path, thumbfile.path)
 	except:
+		if os.path.exists(tmpfile.path):
+			os.remove(tmpfile.path)
 		raise ThumbnailCreatorFailure()
 	else:
 		return pixbuf
 
 
+class PixbufCache(object):
+	'''Thread safe LRU cache for thumbnail pixbufs, keeps the thumbnails
+	of recently shown files in memory when switching folders
+	'''
+
+	def __init__(self, max_size=500):
+		'''Constructor
+		@param max_size: maximum number of pixbufs in the cache
+		'''
+		self.max_size = max_size
+		self._lock = threading.Lock()
+		self._data = OrderedDict()
+
+	def get(self, file, size):
+		'''Get a cached thumbnail
+		@param file: the original file as L{File} object
+		@param size: the thumbnail size in pixels
+		@returns: a 2-tuple of the pixbuf and the mtime of the original
+		file when the thumbnail was made, or 2 times C{None}
+		'''
+		key = (file.path, size)
+		with self._lock:
+			try:
+				self._data.move_to_end(key)
+			except KeyError:
+				return None, None
+			else:
+				return self._data[key]
+
+	def set(self, file, size, pixbuf, mtime):
+		'''Store a thumbnail, drops the least recently used thumbnail if
+		the cache is full
+		@param file: the original file as L{File} object
+		@param size: the thumbnail size in pixels
+		@param pixbuf: the thumbnail pixbuf
+		@param mtime: the mtime of the original file
+		'''
+		key = (file.path, size)
+		with self._lock:
+			self._data[key] = (pixbuf, mtime)
+			self._data.move_to_end(key)
+			while len(self._data) > self.max_size:
+				self._data.popitem(last=False)
+
+	def clear(self):
+		'''Drop all cached thumbnails'''
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self):
+		return len(self._data)
+
+
 class ThumbnailQueue(object):
 
 	'''Wrapper for L{ThumbnailManager} that does that actual thumbnailing
-	in a separate thread and manages the requests and the results with
-	queues.
+	in a pool of worker threads and manages the requests and the results
+	with queues.
+
+	Requests for files that are visible, see L{set_visible()}, are
+	handled first, other requests are handled in the order they were
+	added. Thumbnails that are ready are also stored in L{cache}.
+
+	@ivar cache: a L{PixbufCache} with recent thumbnails
 	'''
 
-	def __init__(self, thumbnailcreator=pixbufThumbnailCreator):
-		self._thread = None
-		self._in_queue = Queue()
+	def __init__(self, thumbnailcreator=pixbufThumbnailCreator, n_workers=None, cache=None):
+		'''Constructor
+		@param thumbnailcreator: function to create thumbnails
+		@param n_workers: number of worker threads, defaults to the
+		number of processors with a maximum of 4
+		@param cache: a L{PixbufCache} or C{None} for a new cache
+		'''
+		self._n_workers = n_workers or min(4, os.cpu_count() or 1)
+		self._n_active = 0
+		self._threads = []
+		self._pending = OrderedDict() # (path, size) -> request
+		self._cancelled = {} # (path, size) -> request
+		self._visible = [] # list of (path, size)
 		self._out_queue = Queue()
 		self._thumbmanager = ThumbnailManager(thumbnailcreator)
+		self.cache = cache if cache is not None else PixbufCache()
 		self._count = 0
-		self._count_lock = threading.Lock()
+		self._lock = threading.Lock()
 		self._running = threading.Event()
 
 	def queue_empty(self):
 		'''Returns C{True} when both input and output queue are empty'''
 		# Guard total count of items in process
-		# input + output + in between in main function
-		# use lock to protect queue
+		# input + output + in between in worker threads
+		# use lock to protect count
 		return self._count == 0
 
 	def queue_thumbnail_request(self, file, size, mtime=None):
@@ -136,61 +211,107 @@ class ThumbnailQueue(object):
 		@param mtime: the mtime of a previous loaded thumbnail, if this
 		matches the current file, the request will be dropped
 		'''
-		with self._count_lock:
-			self._count += 1
-			self._in_queue.put_nowait((file, size, mtime))
+		key = (file.path, size)
+		with self._lock:
+			self._cancelled.pop(key, None)
+			if key not in self._pending:
+				self._count += 1
+			self._pending[key] = (file, size, mtime)
+
+	def set_visible(self, files, size):
+		'''Set the files that are currently visible, requests for these
+		files are handled before other requests. Pending requests for
+		files that were visible before, but are not visible anymore, are
+		cancelled. These are queued again when the file becomes visible
+		again.
+		@param files: list of L{File} objects
+		@param size: the size of the thumbnails in pixels
+		'''
+		keys = [(file.path, size) for file in files]
+		with self._lock:
+			visible = set(keys)
+			for key in self._visible:
+				if key not in visible and key in self._pending:
+					self._cancelled[key] = self._pending.pop(key)
+					self._count -= 1
+
+			for key in keys:
+				if key in self._cancelled:
+					self._pending[key] = self._cancelled.pop(key)
+					self._count += 1
+
+			self._visible = keys
 
 	def start(self):
-		if not (self._thread and self._thread.is_alive()):
+		with self._lock:
 			self._running.set()
-			self._thread = threading.Thread(
-				name=self.__class__.__name__,
-				target=self._thread_main,
-			)
-			self._thread.setDaemon(True)
-			self._thread.start()
+			self._threads = [t for t in self._threads if t.is_alive()]
+			while self._n_active < min(self._n_workers, len(self._pending)):
+				self._n_active += 1
+				thread = threading.Thread(
+					name='%s-%i' % (self.__class__.__name__, self._n_active),
+					target=self._thread_main,
+				)
+				thread.daemon = True
+				thread.start()
+				self._threads.append(thread)
 
 	def _thread_main(self):
-		# Loop executed in the thread
-		import time
-		try:
-			while self._running.is_set():
-				time.sleep(0.1) # give other threads a change as well
-				file, size, mtime = self._in_queue.get_nowait()
-				self._in_queue.task_done()
+		# Loop executed in the worker threads, the count of active
+		# threads is updated under the same lock as the check for
+		# pending requests, so start() never misses a request.
+		while True:
+			with self._lock:
+				if not (self._running.is_set() and self._pending):
+					self._n_active -= 1
+					return
+				file, size, mtime = self._pop_request()
 
-				try:
-					if mtime and file.mtime() == mtime:
-						self._count -= 1 # skip
+			try:
+				if mtime and file.mtime() == mtime:
+					self._drop_request() # skip
+				else:
+					mtime = file.mtime()
+					thumbfile, pixbuf = self._thumbmanager.get_thumbnail(file, size)
+					if thumbfile and pixbuf:
+						self.cache.set(file, size, pixbuf, mtime)
+						self._out_queue.put_nowait((file, size, thumbfile, pixbuf, mtime))
 					else:
-						mtime = file.mtime()
-						thumbfile, pixbuf = self._thumbmanager.get_thumbnail(file, size)
-						if thumbfile and pixbuf:
-							self._out_queue.put_nowait((file, size, thumbfile, pixbuf, mtime))
-						else:
-							self._count -= 1 # skip
-				except:
-					logger.exception('Exception in thumbnail queue')
-					self._count -= 1 # drop
-		except QueueEmpty:
-			pass
-		finally:
-			self._running.clear()
+						self._drop_request() # skip
+			except:
+				logger.exception('Exception in thumbnail queue')
+				self._drop_request() # drop
+
+			time.sleep(0.01) # give other threads a change as well
+
+	def _pop_request(self):
+		# Call with lock held
+		for key in self._visible:
+			if key in self._pending:
+				return self._pending.pop(key)
+
+		key, request = self._pending.popitem(last=False)
+		return request
+
+	def _drop_request(self):
+		with self._lock:
+			self._count -= 1
 
 	def get_ready_thumbnail(self, block=False):
 		'''Check output queue for a thumbnail that is ready
 		@returns: a 5-tuple C{(file, size, thumbfile, pixbuf, mtime)} or 5 times
 		C{None} when nothing is ready and C{block} is C{False}.
 		'''
-		with self._count_lock:
-			try:
-				file, size, thumbfile, pixbuf, mtime = self._out_queue.get(block=block)
-				self._out_queue.task_done()
-				assert self._count > 0
-				self._count -= 1
-				return file, size, thumbfile, pixbuf, mtime
-			except QueueEmpty:
-				return (None, None, None, None, None)
+		try:
+			file, size, thumbfile, pixbuf, mtime = self._out_queue.get(block=block)
+		except QueueEmpty:
+			return (None, None, None, None, None)
+
+		self._out_queue.task_done()
+		with self._lock:
+			assert self._count > 0
+			self._count -= 1
+		return file, size, thumbfile, pixbuf, mtime
 
 	def clear_queue(self):
 		def _clear_queue(myqueue):
@@ -201,16 +322,18 @@ class ThumbnailQueue(object):
 				except QueueEmpty:
 					pass
 
-		with self._count_lock: # nothing in or out while locked!
-			self._running.clear() # stop thread from competing with us
-			_clear_queue(self._in_queue)
+		with self._lock: # stop worker threads from taking new requests
+			self._running.clear()
+			self._pending.clear()
+			self._cancelled.clear()
+			self._visible = []
+			threads, self._threads = self._threads, []
 
-			if self._thread and self._thread.is_alive():
-				self._thread.join()
-				self._thread = None
+		for thread in threads: # join outside lock, threads may finish a request
+			thread.join()
 
+		with self._lock:
 			_clear_queue(self._out_queue)
-
 			self._count = 0
 
 
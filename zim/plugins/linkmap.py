@@ -68,34 +68,23 @@ This is a core plugin shipping with zim.
 
 class LinkMap(object):
 
-	def __init__(self, notebook, path, depth=2):
+	def __init__(self, notebook, path, depth=2, limit=None):
 		self.notebook = notebook
 		self.path = path
 		self.depth = depth
+		self.limit = limit
 
 	def _all_links(self):
 		for page in self.notebook.pages.walk():
 			for link in self.notebook.links.list_links(page):
 				yield link
 
-	def _links(self, path, depth, seen=None):
-		if seen is None:
-			seen = set()
-
-		for link in self.notebook.links.list_links(path, direction=LINK_DIR_BOTH):
-			key = (link.source.name, link.target.name)
-
-			if not key in seen:
-				yield link
-				seen.add(key)
-
-				if link.source == path:
-					other = link.target
-				else:
-					other = link.source
-				if depth > 0:
-					for link in self._links(other, depth - 1, seen):
-						yield link
+	def _links(self, path, depth):
+		# Links are followed from pages up to "depth" links away from
+		# "path", so the map shows pages up to "depth + 1" links away
+		nodes, links = self.notebook.links.neighbourhood(
+			path, depth + 1, LINK_DIR_BOTH, self.limit)
+		return links
 
 	def get_linkmap(self, format=None):
 		dotcode = self.get_dotcode()
@@ -92,7 +92,7 @@ This is a core plugin shipping with zim.
 class TaskListNotebookExtension(NotebookExtension):
 
 	__signals__ = {
-		'tasklist-changed': (None, None, ()),
+		'tasklist-changed': (None, None, (object, object, object)),
 	}
 
 	def __init__(self, plugin, notebook):
@@ -132,8 +132,8 @@ class TaskListNotebookExtension(NotebookExtension):
 			self.index.flag_reindex()
 			self.connectto(self.indexer, 'tasklist-changed')
 
-	def on_tasklist_changed(self, indexer):
-		self.emit('tasklist-changed')
+	def on_tasklist_changed(self, indexer, added, modified, removed):
+		self.emit('tasklist-changed', added, modified, removed)
 
 	def _get_parser_key(self):
 		return tuple(
@@ -225,7 +225,7 @@ class TaskListNotebookViewExtension(NotebookViewExtension):
 		self._connect_tasklist_changed(self._widget)
 
 	def _connect_tasklist_changed(self, widget):
-		callback = DelayedCallback(10, lambda o: widget.reload_view())
+		callback = DelayedCallback(10, lambda o, *a: widget.reload_view())
 			# Don't really care about the delay, but want to
 			# make it less blocking - now it is at least on idle
 		nb_ext = find_extension(self.pageview.notebook, TaskListNotebookExtension)
@@ -6,6 +6,8 @@
 import logging
 import re
 import sqlite3
+import hashlib
+import itertools
 
 import zim.datetimetz as datetime
 
@@ -79,6 +81,22 @@ def _task_labels_re(labels, flags=0):
 		flags=flags
 	)
 
+def _sql_task_label(labels):
+	# SQL expression giving the label of a task out of "labels", or NULL.
+	# The "label" column is set by the indexer for the labels configured
+	# for the indexer; for other labels the description is matched like
+	# "_task_labels_re()" does, except that only ASCII characters are
+	# taken into account for the word boundary.
+	labels = [l.strip(':') for l in labels]
+	sql = 'CASE WHEN tasklist.label IN (%s) THEN tasklist.label' % ','.join('?' * len(labels))
+	args = tuple(labels)
+	for label in labels:
+		sql += ' WHEN tasklist.label IS NULL AND substr(tasklist.description, 1, ?)=?' \
+			' AND substr(tasklist.description, ?, 1) NOT GLOB \'[A-Za-z0-9_]\' THEN ?'
+		args += (len(label), label, len(label) + 1, label)
+	return sql + ' END', args
+
+
 def _parse_page_list(input):
 	paths = []
 	if not input or not input.strip():
@@ -98,12 +116,14 @@ class TasksIndexer(IndexerBase):
 	'''
 
 	PLUGIN_NAME = "tasklist"
-	PLUGIN_DB_FORMAT = "0.9"
+	PLUGIN_DB_FORMAT = "0.11"
 
 	INIT_SCRIPT = '''
 		CREATE TABLE IF NOT EXISTS tasklist (
 			id INTEGER PRIMARY KEY,
 			source INTEGER,
+			key TEXT,
+			ordinal INTEGER,
 			parent INTEGER,
 			haschildren BOOLEAN,
 			hasopenchildren BOOLEAN,
@@ -113,18 +133,30 @@ class TasksIndexer(IndexerBase):
 			start TEXT,
 			due TEXT,
 			tags TEXT,
+			label TEXT,
 			description TEXT
 		);
+		CREATE INDEX IF NOT EXISTS tasklist_source ON tasklist(source);
+		CREATE INDEX IF NOT EXISTS tasklist_parent ON tasklist(parent);
+		CREATE INDEX IF NOT EXISTS tasklist_status ON tasklist(status, start);
+		CREATE INDEX IF NOT EXISTS tasklist_due ON tasklist(due);
+		CREATE TABLE IF NOT EXISTS tasktags (
+			task INTEGER,
+			name TEXT,
+			lowername TEXT
+		);
+		CREATE INDEX IF NOT EXISTS tasktags_task ON tasktags(task);
 		INSERT OR REPLACE INTO zim_index VALUES (%r, %r);
 	''' % (PLUGIN_NAME, PLUGIN_DB_FORMAT)
 
 	TEARDOWN_SCRIPT = '''
 		DROP TABLE IF EXISTS "tasklist";
+		DROP TABLE IF EXISTS "tasktags";
 		DELETE FROM zim_index WHERE key = %r;
 	''' % PLUGIN_NAME
 
 	__signals__ = {
-		'tasklist-changed': (None, None, ()),
+		'tasklist-changed': (None, None, (object, object, object)),
 	}
 
 	@classmethod
@@ -149,80 +181,130 @@ class TasksIndexer(IndexerBase):
 			all_checkboxes=properties['all_checkboxes'],
 		)
 
+		self._pagesindexer = pagesindexer
 		self.integrate_with_journal = properties['integrate_with_journal']
 		self.included_subtrees = _parse_page_list(properties['included_subtrees'])
 		self.excluded_subtrees = _parse_page_list(properties['excluded_subtrees'])
 		self.db.executescript(self.INIT_SCRIPT)
 
 		self.connectto_all(pagesindexer, (
-			'page-changed', 'page-row-deleted'
+			'page-changed', 'page-row-deleted', 'page-row-moved'
 		))
 
 	def on_page_changed(self, o, row, doc):
-		changes = False
-		count, = self.db.execute(
-			'SELECT count(*) FROM tasklist WHERE source=?',
-			(row['id'],)
-		).fetchone()
-		if count > 0:
-			self.db.execute(
-				'DELETE FROM tasklist WHERE source=?',
-				(row['id'],)
-			)
-			changes = True
-
 		mypath = Path(row['name'])
-		if self.included_subtrees:
-			if not any(mypath.match_namespace(n) for n in self.included_subtrees):
-				if changes:
-					self.emit('tasklist-changed')
-				return
-		if self.excluded_subtrees:
-			if any(mypath.match_namespace(n) for n in self.excluded_subtrees):
-				if changes:
-					self.emit('tasklist-changed')
-				return
-
-		opts = {}
-		if self.integrate_with_journal:
-			date = daterange_from_path(Path(row['name']))
-			if date and self.integrate_with_journal == 'start':
-				opts['default_start_date'] = date[1].isoformat()
-				opts['daterange'] = (date[1], date[2])
-			elif date and self.integrate_with_journal == 'due':
-				opts['default_due_date'] = date[2].isoformat()
-				opts['daterange'] = (date[1], date[2])
-
-		tasks = self.parser.parse(doc.iter_tokens(), **opts)
-		c = self.db.cursor()
-		count = c.rowcount
-		self._insert_tasks(c, row['id'], 0, tasks)
-		if changes or c.rowcount > count:
-			self.emit('tasklist-changed')
-
-	def _insert_tasks(self, db, pageid, parentid, tasks):
-		# Helper function to insert tasks in table
-		for task, children in tasks:
-			task[_t_tags] = ','.join(sorted(task[_t_tags])) # make tag list a string
-			db.execute(
-				'INSERT INTO tasklist(source, parent, haschildren, hasopenchildren, status, prio, waiting, start, due, tags, description)'
-				'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-				(pageid, parentid, bool(children), any(c[0][_t_status] == TASK_STATUS_OPEN for c in children)) + tuple(task)
+		if (self.included_subtrees and not any(mypath.match_namespace(n) for n in self.included_subtrees)) \
+		or (self.excluded_subtrees and any(mypath.match_namespace(n) for n in self.excluded_subtrees)):
+			tasks = []
+		else:
+			opts = {}
+			if self.integrate_with_journal:
+				date = daterange_from_path(mypath)
+				if date and self.integrate_with_journal == 'start':
+					opts['default_start_date'] = date[1].isoformat()
+					opts['daterange'] = (date[1], date[2])
+				elif date and self.integrate_with_journal == 'due':
+					opts['default_due_date'] = date[2].isoformat()
+					opts['daterange'] = (date[1], date[2])
+
+			tasks = self.parser.parse(doc.iter_task_tokens(), **opts)
+
+		# Compare with the tasks already in the table, tasks that did not
+		# change are left alone, so they keep their id
+		old = {
+			r['key']: r for r in self.db.execute(
+				'SELECT * FROM tasklist WHERE source=?', (row['id'],)
 			)
+		}
+		added, modified = [], []
+		self._update_tasks(row['id'], 0, '', tasks, old, {}, itertools.count(), added, modified)
+		removed = sorted(r['id'] for r in old.values()) # not matched by new tasks
+		self._delete_tasks(removed)
+		if added or modified or removed:
+			self.emit('tasklist-changed', added, modified, removed)
+
+	def _update_tasks(self, pageid, parentid, parentkey, tasks, old, seen, ordinals, added, modified):
+		# Helper function to insert or update tasks in the table. The key
+		# of a task is based on the description and the key of the parent,
+		# with a counter for tasks that are otherwise the same.
+		for task, children in tasks:
+			digest = hashlib.md5((parentkey + '\n' + task[_t_desc]).encode('UTF-8')).hexdigest()
+			n = seen.get(digest, 0)
+			seen[digest] = n + 1
+			key = '%s:%i' % (digest, n)
+			ordinal = next(ordinals)
+
+			m = self.parser.task_label_re.match(task[_t_desc])
+			tags = sorted(task[_t_tags])
+			values = (parentid, bool(children), any(c[0][_t_status] == TASK_STATUS_OPEN for c in children)) \
+				+ tuple(task[:_t_tags]) + (','.join(tags), m.group(1) if m else None, task[_t_desc])
+
+			oldrow = old.pop(key, None)
+			if oldrow is None:
+				taskid = self.db.execute(
+					'INSERT INTO tasklist(source, key, ordinal, %s) '
+					'VALUES (?, ?, ?, %s)' % (', '.join(self._COLUMNS), ', '.join('?' * len(values))),
+					(pageid, key, ordinal) + values
+				).lastrowid
+				self._insert_tags(taskid, tags)
+				added.append(taskid)
+			else:
+				taskid = oldrow['id']
+				if tuple(oldrow[c] for c in self._COLUMNS) != values:
+					self.db.execute(
+						'UPDATE tasklist SET ordinal=?, %s WHERE id=?' % ', '.join(c + '=?' for c in self._COLUMNS),
+						(ordinal,) + values + (taskid,)
+					)
+					if oldrow['tags'] != values[-3]:
+						self.db.execute('DELETE FROM tasktags WHERE task=?', (taskid,))
+						self._insert_tags(taskid, tags)
+					modified.append(taskid)
+				elif oldrow['ordinal'] != ordinal:
+					# Only position in the page changed, e.g. a task was
+					# added above this one
+					self.db.execute('UPDATE tasklist SET ordinal=? WHERE id=?', (ordinal, taskid))
+
 			if children:
-				self._insert_tasks(db, pageid, db.lastrowid, children) # recurs
+				self._update_tasks(pageid, taskid, key, children, old, seen, ordinals, added, modified) # recurs
+
+	_COLUMNS = ('parent', 'haschildren', 'hasopenchildren', 'status', 'prio', 'waiting', 'start', 'due', 'tags', 'label', 'description')
+
+	def _insert_tags(self, taskid, tags):
+		if tags:
+			self.db.executemany(
+				'INSERT INTO tasktags(task, name, lowername) VALUES (?, ?, ?)',
+				[(taskid, tag, tag.lower()) for tag in tags]
+			)
+
+	def _delete_tasks(self, ids):
+		for i in range(0, len(ids), 500): # stay below sqlite limit for parameters
+			batch = ids[i:i+500]
+			placeholders = ','.join('?' * len(batch))
+			self.db.execute('DELETE FROM tasktags WHERE task IN (%s)' % placeholders, batch)
+			self.db.execute('DELETE FROM tasklist WHERE id IN (%s)' % placeholders, batch)
 
 	def on_page_row_deleted(self, o, row):
-		count, = self.db.execute(
-			'SELECT count(*) FROM tasklist WHERE source=?',
+		removed = [r[0] for r in self.db.execute(
+			'SELECT id FROM tasklist WHERE source=?',
 			(row['id'],)
-		).fetchone()
-		if count > 0:
-			self.db.execute(
-				'DELETE FROM tasklist WHERE source=?',
-				(row['id'],)
-			)
-			self.emit('tasklist-changed')
+		)]
+		if removed:
+			self._delete_tasks(removed)
+			self.emit('tasklist-changed', [], [], removed)
+
+	def on_page_row_moved(self, o, row, oldrow):
+		if self.included_subtrees or self.excluded_subtrees or self.integrate_with_journal:
+			# Tasks depend on the page name, flag moved pages to be indexed again
+			self._pagesindexer.flag_reindex_section(Path(row['name']))
+		else:
+			section = 'SELECT id FROM pages WHERE name=? OR (name>? AND name<?)'
+			args = (row['name'], row['name'] + ':', row['name'] + ';')
+			modified = [r[0] for r in self.db.execute(
+				'SELECT id FROM tasklist WHERE source IN (%s)' % section,
+				args
+			)]
+			if modified:
+				self.emit('tasklist-changed', [], modified, []) # page names changed
 
 
 class AllTasks(IndexView):
@@ -285,7 +367,7 @@ class AllTasks(IndexView):
 			SELECT tasklist.*, pages.name FROM tasklist
 			LEFT JOIN pages ON tasklist.source = pages.id
 			WHERE tasklist.status in %s and tasklist.parent=? and tasklist.start<=? %s
-			ORDER BY tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.id ASC
+			ORDER BY tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.ordinal ASC
 			''' % (self._status_sql, _sql_filter), (parentid, today)
 		):
 			yield row
@@ -294,40 +376,105 @@ class AllTasks(IndexView):
 				SELECT tasklist.*, pages.name FROM tasklist
 				LEFT JOIN pages ON tasklist.source = pages.id
 				WHERE tasklist.status in %s and tasklist.parent=? and tasklist.start>? %s
-				ORDER BY tasklist.start ASC, tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.id ASC
+				ORDER BY tasklist.start ASC, tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.ordinal ASC
 				''' % (self._status_sql, _sql_filter), (parentid, today)
 			):
 				yield row
 
+	def _sql_where(self, today, _sql_filter, _include_not_started):
+		# Returns 2-tuple of sql condition and arguments for one level of
+		# tasks, matching the query in "list_tasks()"
+		sql = 'tasklist.status in %s %s' % (self._status_sql, _sql_filter)
+		if _include_not_started:
+			return sql, ()
+		else:
+			return sql + ' and tasklist.start<=?', (today,)
+
+	def _sql_selection(self, today):
+		# Returns sql conditions that select the same tasks as
+		# "list_tasks()", 2-tuple of condition for the top level tasks and
+		# condition for child tasks, or C{None} when there are no child
+		# tasks. Each condition is a 2-tuple of sql and arguments.
+		sql, args = self._sql_where(today, self._sql_filter, self._include_not_started)
+		return ('tasklist.parent=0 and ' + sql, args), (sql, args)
+
 	def count_labels_and_tags_pages(self, task_labels, intersect=None):
 		'''Get mapping with count of the tasks with given label or tag
-		@param task_labels: list of task labels to be parsed
+		@param task_labels: list of task labels to be parsed, labels
+		that are not configured for the indexer are matched against the
+		start of the task description
 		@param intersect: 2-tuple of labels and tags already selected, will
 		return count based on intersecting with this selection
 		@returns: 3 maps, one for label count, one for tag count and one for pagenames
 		'''
-		# TODO more efficient sql-based version of this
-		label_filter_func = lambda r: True
-		tag_filter_func = lambda r: True
+		# The selection of tasks is done in a recursive query, mirroring
+		# the recursion over child tasks when listing tasks. Task labels are
+		# determined by the indexer, tags are in a separate table.
+		filter_sql, filter_args = '', ()
 		if intersect:
 			if intersect[0]:
-				filter_label_re = _task_labels_re(intersect[0])
-				label_filter_func = lambda r: bool(filter_label_re.match(r['description']))
+				label_sql, label_args = _sql_task_label(intersect[0])
+				filter_sql += ' and (%s) IS NOT NULL' % label_sql
+				filter_args += label_args
 
 			if _NO_TAGS in intersect[1]:
-				tag_filter_func = lambda r: not r['tags']
+				filter_sql += " and tasklist.tags=''"
 			elif intersect[1]:
-				filter_tags = [t.lower() for t in intersect[1]]
-				def _tag_filter_func(r):
-					tags = r['tags'].lower().split(',')
-					return all(t in tags for t in filter_tags)
-				tag_filter_func = _tag_filter_func
+				for tag in intersect[1]:
+					filter_sql += ' and EXISTS (SELECT 1 FROM tasktags WHERE tasktags.task=tasklist.id AND tasktags.lowername=?)'
+					filter_args += (tag.lower(),)
+
+		today = str(datetime.date.today())
+		(roots_sql, roots_args), children = self._sql_selection(today)
+		selection = 'SELECT tasklist.id FROM tasklist WHERE %s %s' % (roots_sql, filter_sql)
+		args = roots_args + filter_args
+		if children:
+			children_sql, children_args = children
+			selection += ' UNION ALL ' \
+				'SELECT tasklist.id FROM tasklist JOIN selection ON tasklist.parent=selection.id ' \
+				'WHERE %s %s' % (children_sql, filter_sql)
+			args += children_args + filter_args
+		selection = 'WITH RECURSIVE selection(id) AS (%s) ' % selection
 
-		task_label_re = _task_labels_re(task_labels)
 		labels = {}
-		tags = {_NO_TAGS: 0}
+		if task_labels:
+			label_sql, label_args = _sql_task_label(task_labels)
+			for label, count in self.db.execute(
+				selection +
+				'SELECT %s AS tasklabel, count(*) FROM selection '
+				'JOIN tasklist ON tasklist.id=selection.id '
+				'WHERE tasklabel IS NOT NULL '
+				'GROUP BY tasklabel' % label_sql,
+				args + label_args
+			):
+				labels[label] = count
+
+		tags = dict(self.db.execute(
+			selection +
+			'SELECT tasktags.name, count(*) FROM selection '
+			'JOIN tasktags ON tasktags.task=selection.id '
+			'GROUP BY tasktags.name',
+			args
+		))
+		tags[_NO_TAGS], = self.db.execute(
+			selection +
+			'SELECT count(*) FROM selection '
+			'JOIN tasklist ON tasklist.id=selection.id '
+			'WHERE tasklist.tags=\'\'',
+			args
+		).fetchone()
+
 		pages = {}
-		self._count_rows(None, tag_filter_func, label_filter_func, task_label_re, labels, tags, pages)
+		for name, count in self.db.execute(
+			selection +
+			'SELECT pages.name, count(*) FROM selection '
+			'JOIN tasklist ON tasklist.id=selection.id '
+			'JOIN pages ON tasklist.source=pages.id '
+			'GROUP BY tasklist.source',
+			args
+		):
+			for part in name.split(':'):
+				pages[part] = pages.get(part, 0) + count
 
 		# Remove duplicates by case in tags - keeps version with uppercase due
 		# to sorting 2nd element in tuple
@@ -340,35 +487,6 @@ class AllTasks(IndexView):
 
 		return labels, tags, pages
 
-	def _count_rows(self, parent, tag_filter_func, label_filter_func, task_label_re, labels, tags, pages):
-		for row in filter(tag_filter_func, filter(label_filter_func, self.list_tasks(parent))):
-			m = task_label_re.match(row['description'])
-			if m:
-				key = m.group(1)
-				if key in labels:
-					labels[key] += 1
-				else:
-					labels[key] = 1
-
-			if row['tags']:
-				for tag in row['tags'].split(','):
-					if tag in tags:
-						tags[tag] += 1
-					else:
-						tags[tag] = 1
-			else:
-				tags[_NO_TAGS] += 1
-
-			for part in row['name'].split(':'):
-				if part in pages:
-					pages[part] += 1
-				else:
-					pages[part] = 1
-
-			if row['haschildren']:
-				self._count_rows(row, tag_filter_func, label_filter_func, task_label_re, labels, tags, pages)
-				# recurs
-
 	def get_task(self, taskid):
 		row = self.db.execute(
 			'SELECT * FROM tasklist WHERE id=?',
@@ -396,6 +514,12 @@ class ActiveTasks(AllTasks):
 	def set_status_included(self, *status):
 		pass # ignore - keep default on TASK_STATUS_OPEN
 
+	def _sql_selection(self, today):
+		return (
+			'tasklist.status=0 and tasklist.start<=? and hasopenchildren=0 and waiting=0 %s' % self._sql_filter,
+			(today,)
+		), None
+
 	def list_tasks(self, parent=None):
 		'''List tasks
 		@param parent: the parent task (as returned by this method) or C{None} to list
@@ -414,7 +538,7 @@ class ActiveTasks(AllTasks):
 			SELECT tasklist.*, pages.name FROM tasklist
 			LEFT JOIN pages ON tasklist.source = pages.id
 			WHERE tasklist.status=0 and tasklist.start<=? and hasopenchildren=0 and waiting=0 %s
-			ORDER BY tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.id ASC
+			ORDER BY tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.ordinal ASC
 			''' % self._sql_filter, (today,)
 		):
 			yield row
@@ -423,7 +547,7 @@ class ActiveTasks(AllTasks):
 				SELECT tasklist.*, pages.name FROM tasklist
 				LEFT JOIN pages ON tasklist.source = pages.id
 				WHERE tasklist.status=0 and tasklist.start>? and hasopenchildren=0 and waiting=0 %s
-				ORDER BY tasklist.start ASC, tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.id ASC
+				ORDER BY tasklist.start ASC, tasklist.waiting ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.ordinal ASC
 				''' % self._sql_filter, (today,)
 			):
 				yield row
@@ -437,6 +561,13 @@ class NextActionTasks(ActiveTasks):
 	# TODO use _sql_filter attribute more effectively'
 	_include_not_started = False
 
+	def _sql_selection(self, today):
+		(sql, args), children = ActiveTasks._sql_selection(self, today)
+		return (
+			sql + ' and (parent!=0 or prio>0 or due!=?) and haschildren=0',
+			args + (_MAX_DUE_DATE,)
+		), None
+
 	def list_tasks(self, parent=None):
 		today = str(datetime.date.today())
 		for row in ActiveTasks.list_tasks(self):
@@ -457,6 +588,13 @@ class InboxTasks(ActiveTasks):
 
 	STYLE = 'inbox'
 
+	def _sql_selection(self, today):
+		(sql, args), children = ActiveTasks._sql_selection(self, today)
+		return (
+			sql + ' and parent=0 and haschildren=0 and prio=0 and due=?',
+			args + (_MAX_DUE_DATE,)
+		), None
+
 	def list_tasks(self, parent=None):
 		today = str(datetime.date.today())
 		for row in ActiveTasks.list_tasks(self):
@@ -478,6 +616,11 @@ class OpenProjectsTasks(AllTasks):
 		else:
 			return AllTasks.list_tasks(self, _sql_filter='and status=0 and haschildren=1', _include_not_started=False)
 
+	def _sql_selection(self, today):
+		sql, args = self._sql_where(today, 'and status=0 and haschildren=1', False)
+		children = self._sql_where(today, self._sql_filter, self._include_not_started)
+		return ('tasklist.parent=0 and ' + sql, args), children
+
 
 
 
@@ -492,6 +635,14 @@ class WaitingTasks(AllTasks):
 	def set_status_included(self, *status):
 		pass # ignore - keep default on TASK_STATUS_OPEN
 
+	def _sql_selection(self, today):
+		# Skip tasks with a parent that is also selected
+		sql, args = self._sql_where(today, 'and waiting', self._include_not_started)
+		return (
+			sql + ' and tasklist.parent NOT IN (SELECT id FROM tasklist WHERE %s)' % sql,
+			args + args
+		), None
+
 	def list_tasks(self, parent=None):
 		if parent:
 			return AllTasks.list_tasks(self, parent)
@@ -514,7 +665,7 @@ class WaitingTasks(AllTasks):
 			SELECT tasklist.*, pages.name FROM tasklist
 			LEFT JOIN pages ON tasklist.source = pages.id
 			WHERE tasklist.status in %s and tasklist.start<=? %s
-			ORDER BY tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.id ASC
+			ORDER BY tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.ordinal ASC
 			''' % (self._status_sql, _sql_filter), (today,)
 		):
 			yield row
@@ -523,7 +674,7 @@ class WaitingTasks(AllTasks):
 				SELECT tasklist.*, pages.name FROM tasklist
 				LEFT JOIN pages ON tasklist.source = pages.id
 				WHERE tasklist.status in %s and tasklist.start>? %s
-				ORDER BY tasklist.start ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.id ASC
+				ORDER BY tasklist.start ASC, tasklist.prio DESC, tasklist.due ASC, pages.name ASC, tasklist.ordinal ASC
 				''' % (self._status_sql, _sql_filter), (today,)
 			):
 				yield row
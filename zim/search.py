@@ -25,7 +25,9 @@ Supported keywords:
 
 For the Content field we need to request the actual page contents,
 all other fields we get from the index and are more efficient to
-query.
+query. If the index has a full text table, content terms that are a
+single word, optionally with a '*' at the right side, are also answered
+from the index.
 
 For link keywords only a '*' at the right side is allowed
 For the name keyword a '*' is allowed on both sides
@@ -52,6 +54,7 @@ from zim.parsing import Re, unescape_string
 from zim.notebook import Path, \
 	PageNotFoundError, IndexNotFoundError, \
 	LINK_DIR_BACKWARD, LINK_DIR_FORWARD
+from zim.notebook.index import FullTextView
 
 
 logger = logging.getLogger('zim.search')
@@ -548,6 +551,28 @@ class SearchSelection(PageSelection):
 		# contentorname optimization
 		# For OR 'results' is whatever was found so far while 'scope' can be larger
 		# we extend the results with any matches from scope
+		fulltext = FullTextView.new_from_index(self.notebook.index)
+		if fulltext.is_available():
+			indexed = [t for t in terms if fulltext.can_match(t.string)]
+			if indexed and operator == OPERATOR_OR:
+				# Terms are independent, process indexed terms separately
+				results = self._process_fulltext(fulltext, indexed, results, scope, operator)
+				terms = [t for t in terms if not fulltext.can_match(t.string)]
+				if not terms:
+					if callback and not callback(results, None):
+						self.cancelled = True
+					return results
+			elif indexed and len(indexed) == len(terms):
+				results = self._process_fulltext(fulltext, indexed, results, scope, operator)
+				if callback and not callback(results, None):
+					self.cancelled = True
+				return results
+			elif indexed:
+				# Use indexed terms to limit the pages that need to be parsed
+				scope = self._fulltext_scope(fulltext, indexed, scope)
+				if not scope:
+					return SearchSelection(None) if results is None else results
+
 		for term in terms:
 			term.content_regex = self._content_regex(term.string)
 			# term.name_regex already defined in _process_from_index
@@ -620,6 +645,74 @@ class SearchSelection(PageSelection):
 
 		return results
 
+	def _process_fulltext(self, fulltext, terms, results, scope, operator):
+		# Like _process_content() but answers terms from the full text
+		# index instead of parsing each page. Scores are based on the rank
+		# of the match instead of the number of matches.
+		matches = [fulltext.match_pages(term.string) for term in terms]
+		withcontent = set(fulltext.list_pages())
+		if scope:
+			paths = [p for p in scope if p in withcontent]
+		else:
+			paths = withcontent
+
+		if results is None:
+			results = SearchSelection(None)
+
+		for path in paths:
+			path = Path(path.name)
+			if operator == OPERATOR_AND:
+				score = 0
+				for term, termmatches in zip(terms, matches):
+					myscore = termmatches.get(path, 0)
+					if term.keyword == 'contentorname' \
+					and term.name_regex.match(path.name):
+						myscore += 1 # effective score going to 11
+
+					if bool(myscore) != term.inverse: # implicit XOR
+						score += myscore or 1
+					else:
+						score = 0
+						break
+
+				if score:
+					results.add(path)
+					self._count_score(path, score)
+			else: # OPERATOR_OR
+				for term, termmatches in zip(terms, matches):
+					score = termmatches.get(path, 0)
+					if term.keyword == 'contentorname' \
+					and term.name_regex.match(path.name):
+						score += 1 # effective score going to 11
+
+					if bool(score) != term.inverse: # implicit XOR
+						results.add(path)
+						self._count_score(path, score or 1)
+
+		return results
+
+	def _fulltext_scope(self, fulltext, terms, scope):
+		# Limit scope for an AND group to pages that can match all
+		# (non-inverse) indexed terms, either by content or by name
+		if scope:
+			paths = set(scope)
+		else:
+			paths = set(fulltext.list_pages())
+
+		for term in terms:
+			if term.inverse:
+				continue
+			matches = fulltext.match_pages(term.string)
+			paths = set(
+				p for p in paths
+					if p in matches or (
+						term.keyword == 'contentorname'
+						and term.name_regex.match(p.name)
+					)
+			)
+
+		return paths
+
 	def _name_regex(self, string, case=False):
 		# Build a regex for matching a glob against a page name
 		# Don't use word delimiters here, since page names could be in
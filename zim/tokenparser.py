@@ -15,7 +15,13 @@
 # "atomic" token for items that do not have content.
 #
 # Tags need to be properly nested, so they represent a hierarchy.
+#
+# Token lists can be kept in memory as python lists of tuples, or with
+# the more compact L{TokenList} class for large content.
+
+import threading
 
+from array import array
 
 from zim.parser import Builder
 from zim.formats import NUMBEREDLIST, BULLETLIST, LISTITEM, PARAGRAPH, ANCHOR
@@ -150,7 +156,7 @@ class TokenParser(object):
 		self.builder = builder
 
 	def parse(self, tokens):
-		for t in reverseTopLevelLists(tokens):
+		for t in iterReverseTopLevelLists(tokens):
 			if t[0] == END:
 				self.builder.end(t[1])
 			elif t[0] == TEXT:
@@ -159,6 +165,171 @@ class TokenParser(object):
 				self.builder.start(*t)
 
 
+_tag_names = [None] #: interned tag names, index is the tag id used in L{TokenList}
+_tag_ids = {}
+_tag_lock = threading.Lock()
+
+
+def _intern_tag(tag):
+	try:
+		return _tag_ids[tag]
+	except KeyError:
+		with _tag_lock:
+			if tag not in _tag_ids:
+				_tag_names.append(tag)
+				_tag_ids[tag] = len(_tag_names) - 1
+			return _tag_ids[tag]
+
+
+class TokenList(Builder):
+	'''Compact representation of a token list
+
+	Tokens are stored in two arrays of integers instead of a list of
+	tuples. Tag names are interned in a table shared by all token lists
+	and identical attribute dicts are shared within a token list. Text is
+	stored per line as for other token lists.
+
+	Token lists are in "raw" order like the tokens of a L{ParseTree},
+	so lists can still be inside paragraphs. Iterating the object yields
+	these raw tokens, use L{iter_tokens()} to get tokens processed with
+	L{topLevelLists()} like the tokens of L{ParseTree.iter_tokens()}.
+
+	The object implements the L{Builder} interface, so a parser can
+	build a token list directly instead of a L{ParseTree}, and it has an
+	C{iter_tokens()} method, so it can be given to a L{DumperClass}
+	instead of a L{ParseTree}.
+
+	@note: attribute dicts in the tokens are shared and should be
+	treated as read-only by consumers
+
+	@ivar meta: dict with meta data of the content, like L{ParseTree.meta}
+	'''
+
+	# Encoding: "_ops" has the tag id for a start token, the negative
+	# tag id for an end token and 0 for a text token. "_args" has the
+	# index in "_attribs" for a start token and the index in "_text" for
+	# a text token. Consecutive text is joined and split per line, so
+	# the tokens are the same as for the equivalent ParseTree.
+
+	def __init__(self, tokens=None):
+		self._ops = array('i')
+		self._args = array('I')
+		self._text = []
+		self._attribs = []
+		self._attrib_ids = {}
+		self.meta = {}
+		if tokens is not None:
+			self.extend(tokens)
+
+	@classmethod
+	def new_from_parsetree(klass, parsetree):
+		'''Create a token list with the content of a L{ParseTree}
+		@param parsetree: a L{ParseTree}
+		@returns: a new L{TokenList}
+		'''
+		tokenlist = klass()
+		root = parsetree._etree.getroot()
+		if root is not None:
+			tokenlist.extend(parsetree._get_tokens(root, copy_attrib=False))
+		tokenlist.meta.update(parsetree.meta)
+		return tokenlist
+
+	def _attrib_id(self, attrib):
+		# Like the ParseTreeBuilder, "None" is stored as an empty dict
+		try:
+			key = tuple(attrib.items()) if attrib else ()
+			return self._attrib_ids[key]
+		except KeyError:
+			self._attribs.append(dict(attrib or {}))
+			self._attrib_ids[key] = len(self._attribs) - 1
+			return self._attrib_ids[key]
+		except TypeError:
+			# Unhashable value, do not share
+			self._attribs.append(dict(attrib))
+			return len(self._attribs) - 1
+
+	def __len__(self):
+		return len(self._ops)
+
+	def __iter__(self):
+		tags = _tag_names
+		text = self._text
+		attribs = self._attribs
+		for op, arg in zip(self._ops, self._args):
+			if op > 0:
+				yield (tags[op], attribs[arg])
+			elif op < 0:
+				yield (END, tags[-op])
+			else:
+				yield (TEXT, text[arg])
+
+	def iter_tokens(self):
+		'''Generator for the tokens in the same form as
+		L{ParseTree.iter_tokens()}
+		'''
+		return iterTopLevelLists(self)
+
+	def iter_text(self):
+		'''Generator for all text in the token list'''
+		return iter(self._text)
+
+	def extend(self, tokens):
+		'''Add tokens to the list
+		@param tokens: an iterable of tokens
+		'''
+		for t in tokens:
+			if t[0] == TEXT:
+				self.text(t[1])
+			elif t[0] == END:
+				self.end(t[1])
+			else:
+				self.start(t[0], t[1])
+
+	def start(self, tag, attrib=None):
+		self._ops.append(_intern_tag(tag))
+		self._args.append(self._attrib_id(attrib))
+
+	def text(self, text):
+		if self._ops and self._ops[-1] == 0 and not self._text[-1].endswith('\n'):
+			# Join with previous text, like the ParseTreeBuilder does
+			text = self._text.pop() + text
+			self._ops.pop()
+			self._args.pop()
+
+		for line in text.splitlines(True):
+			self._ops.append(0)
+			self._args.append(len(self._text))
+			self._text.append(line)
+
+	def end(self, tag):
+		self._ops.append(-_intern_tag(tag))
+		self._args.append(0)
+
+	def append(self, tag, attrib=None, text=None):
+		self.start(tag, attrib)
+		if text:
+			self.text(text)
+		self.end(tag)
+
+	def get_parsetree(self):
+		'''Convert the tokens to a L{ParseTree}
+		@returns: a new L{ParseTree}
+		'''
+		from zim.formats import ParseTreeBuilder
+
+		builder = ParseTreeBuilder()
+		for t in self:
+			if t[0] == TEXT:
+				builder.text(t[1])
+			elif t[0] == END:
+				builder.end(t[1])
+			else:
+				builder.start(*t)
+		tree = builder.get_parsetree()
+		tree.meta.update(self.meta)
+		return tree
+
+
 def topLevelLists(tokens):
 	# Make tree more HTML-like:
 	# - Move UL / OL to top level, outside P
@@ -172,40 +343,53 @@ def topLevelLists(tokens):
 	# ..<ul>...</ul>.. --> ..</p><ul>...</ul><p>..
 	# ..<ul>...</ul></p> --> ..</p><ul>...</ul>
 	#
+	return list(iterTopLevelLists(tokens))
+
+
+def iterTopLevelLists(tokens):
+	# Generator version of topLevelLists(), only the tokens of a list
+	# section are buffered. One token is held back because an opening
+	# paragraph directly before a list is dropped.
 	para_end = (END, PARAGRAPH)
 	seen_para = False
 	tokeniter = iter(tokens)
-	newtokens = []
+	pending = None
 	for t in tokeniter:
 		if t[0] in (NUMBEREDLIST, BULLETLIST):
 			assert seen_para, 'Looks like tokenlist had top level lists to start with'
-			if newtokens[-1][0] == PARAGRAPH:
-				newtokens.pop()
+			if pending is not None and pending[0] == PARAGRAPH:
+				pending = None
 			else:
-				newtokens.append((END, PARAGRAPH))
+				if pending is not None:
+					yield pending
+					pending = None
+				yield (END, PARAGRAPH)
 
-			newtokens.append(t)
-			newtokens.extend(_changeList(tokeniter))
+			yield t
+			yield from _changeList(tokeniter)
 
 			nexttoken = next(tokeniter)
 			while nexttoken[0] in (BULLETLIST, NUMBEREDLIST):
-				newtokens.append(nexttoken)
-				newtokens.extend(_changeList(tokeniter))
+				yield nexttoken
+				yield from _changeList(tokeniter)
 				nexttoken = next(tokeniter)
 
-			if nexttoken == (END, PARAGRAPH):
+			if nexttoken == para_end:
 				pass
 			else:
-				newtokens.append((PARAGRAPH, None))
-				newtokens.append(nexttoken)
+				yield (PARAGRAPH, None)
+				pending = nexttoken
 		else:
 			if t[0] == PARAGRAPH:
 				seen_para = True
 			elif t == para_end:
 				seen_para = False
-			newtokens.append(t)
+			if pending is not None:
+				yield pending
+			pending = t
 
-	return newtokens
+	if pending is not None:
+		yield pending
 
 
 def _changeList(tokeniter):
@@ -248,33 +432,45 @@ def reverseTopLevelLists(tokens):
 	# ..</p><ul>...</ul>.. --> ..<ul>...</ul></p>
 	#
 
+	return list(iterReverseTopLevelLists(tokens))
+
+
+def iterReverseTopLevelLists(tokens):
+	# Generator version of reverseTopLevelLists(), see iterTopLevelLists()
+	para_end = (END, PARAGRAPH)
 	tokeniter = iter(tokens)
-	newtokens = []
+	pending = None
 	for t in tokeniter:
 		if t[0] in (NUMBEREDLIST, BULLETLIST):
-			if newtokens and newtokens[-1] == (END, PARAGRAPH):
-				newtokens.pop()
+			if pending is not None and pending == para_end:
+				pending = None
 			else:
-				newtokens.append((PARAGRAPH, None))
+				if pending is not None:
+					yield pending
+					pending = None
+				yield (PARAGRAPH, None)
 
-			newtokens.append(t)
-			newtokens.extend(_reverseChangeList(tokeniter))
+			yield t
+			yield from _reverseChangeList(tokeniter)
 
 			nexttoken = next(tokeniter)
 			while nexttoken[0] in (BULLETLIST, NUMBEREDLIST):
-				newtokens.append(nexttoken)
-				newtokens.extend(_reverseChangeList(tokeniter))
+				yield nexttoken
+				yield from _reverseChangeList(tokeniter)
 				nexttoken = next(tokeniter)
 
 			if nexttoken[0] == PARAGRAPH:
 				pass
 			else:
-				newtokens.append((END, PARAGRAPH))
-				newtokens.append(nexttoken)
+				yield para_end
+				pending = nexttoken
 		else:
-			newtokens.append(t)
+			if pending is not None:
+				yield pending
+			pending = t
 
-	return newtokens
+	if pending is not None:
+		yield pending
 
 
 def _reverseChangeList(tokeniter):
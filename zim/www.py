@@ -14,24 +14,31 @@ the standalone server.
 '''
 
 # TODO setting for doc_root_url when running in CGI mode
-# TODO support "etg" and "if-none-match' headers at least for icons
 # TODO: redirect server logging to logging module + set default level to -V in server process
 
 
+import os
 import sys
 import socket
+import hashlib
 import logging
+import threading
 from gi.repository import GObject
 
+from io import BytesIO
 from functools import partial
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
 
+import socketserver
+import wsgiref.simple_server
 from wsgiref.headers import Headers
 import urllib.request
 import urllib.parse
 import urllib.error
 
 from zim.fs import adapt_from_oldfs
-from zim.newfs import SEP, FileNotFoundError
+from zim.newfs import SEP, FileNotFoundError, LocalFile
 from zim.errors import Error
 from zim.notebook import Notebook, Path, Page, encode_filename, PageNotFoundError
 from zim.config import data_file
@@ -47,6 +54,37 @@ from zim.formats import get_format
 logger = logging.getLogger('zim.www')
 
 
+FILE_CHUNK_SIZE = 64 * 1024 #: block size used to send files
+
+
+class FileChunkIterator(object):
+	'''Iterable for the content of a file in blocks, used to send
+	files without loading them in memory. Follows the WSGI API, so the
+	server calls L{close()} when done.
+	'''
+
+	def __init__(self, fh, length, chunk_size=FILE_CHUNK_SIZE):
+		'''Constructor
+		@param fh: a file handle in binary mode, positioned at the start
+		@param length: the number of bytes to send
+		@param chunk_size: the block size
+		'''
+		self.fh = fh
+		self.length = length
+		self.chunk_size = chunk_size
+
+	def __iter__(self):
+		while self.length > 0:
+			data = self.fh.read(min(self.chunk_size, self.length))
+			if not data:
+				break
+			self.length -= len(data)
+			yield data
+
+	def close(self):
+		self.fh.close()
+
+
 class WWWError(Error):
 	'''Error with http error code'''
 
@@ -55,6 +93,7 @@ class WWWError(Error):
 		'403': 'Forbidden',
 		'404': 'Not Found',
 		'405': 'Method Not Allowed',
+		'416': 'Range Not Satisfiable',
 		'500': 'Internal Server Error',
 	}
 
@@ -99,6 +138,55 @@ The requested path is not valid
 		WWWError.__init__(self, 'Invalid path', status='403')
 
 
+class NotModified(Exception):
+	'''Exception used to break off a request that can be answered with
+	"304 Not Modified"
+	'''
+
+	def __init__(self, headers):
+		self.headers = headers
+
+
+class RenderCache(object):
+	'''Thread safe LRU cache for rendered pages'''
+
+	def __init__(self, max_size=100):
+		'''Constructor
+		@param max_size: maximum number of pages in the cache
+		'''
+		self.max_size = max_size
+		self._lock = threading.Lock()
+		self._data = OrderedDict()
+
+	def get(self, key):
+		'''Get a cached value or C{None}'''
+		with self._lock:
+			try:
+				self._data.move_to_end(key)
+			except KeyError:
+				return None
+			else:
+				return self._data[key]
+
+	def set(self, key, value):
+		'''Store a value, drops the least recently used value if the
+		cache is full
+		'''
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end(key)
+			while len(self._data) > self.max_size:
+				self._data.popitem(last=False)
+
+	def clear(self):
+		'''Drop all cached values'''
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self):
+		return len(self._data)
+
+
 class WWWInterface(object):
 	'''Class to handle the WWW interface for zim notebooks.
 
@@ -108,18 +196,33 @@ class WWWInterface(object):
 
 	For basic handlers to run this interface see the "wsgiref" package
 	in the standard library for python.
+
+	Rendered pages are cached. The cache key is based on the modification
+	time of the page source and attachments and the state of the index,
+	so a changed page or a change in the notebook structure results in a
+	new render. The same key is used as "ETag" for conditional requests.
+
+	Requests can be handled in multiple threads. Serving cached pages
+	and static files is done in parallel, but access to the notebook
+	for rendering is serialized as notebook objects are not thread safe.
 	'''
 
-	def __init__(self, notebook, template='Default', auth_creds=None):
+	def __init__(self, notebook, template='Default', auth_creds=None, cache_size=100):
 		'''Constructor
 		@param notebook: a L{Notebook} object
 		@param template: html template for zim pages
 		@param auth_creds: credentials for HTTP-authentication
+		@param cache_size: maximum number of rendered pages to cache
 		'''
 		assert isinstance(notebook, Notebook)
 		self.notebook = notebook
 		self.auth_creds = auth_creds
 
+		self.cache = RenderCache(cache_size)
+		self._render_lock = threading.RLock()
+		self._index_version = 0
+		self.notebook.index.connect('changed', self.on_index_changed)
+
 		self.output = None
 
 		if template is None:
@@ -131,6 +234,141 @@ class WWWInterface(object):
 
 		#~ self.notebook.indexer.check_and_update()
 
+	def on_index_changed(self, index):
+		self._index_version += 1
+		self.cache.clear()
+
+	def _index_state(self):
+		# Changes in the index made by another process, e.g. the GUI,
+		# are noticed from the database files
+		state = [self._index_version]
+		dbpath = self.notebook.index.dbpath
+		if dbpath != ':memory:':
+			for path in (dbpath, dbpath + '-wal'):
+				try:
+					stat = os.stat(path)
+				except OSError:
+					state.append(None)
+				else:
+					state.append((stat.st_mtime_ns, stat.st_size))
+		return tuple(state)
+
+	def _check_modified(self, environ, headers, key, mtime=None):
+		# Set cache headers and raise NotModified for a conditional
+		# request that matches
+		etag = '"%s"' % hashlib.md5(repr(key).encode('UTF-8')).hexdigest()
+		cache_headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+		if mtime is not None:
+			cache_headers.append(('Last-Modified', formatdate(mtime, usegmt=True)))
+		for name, value in cache_headers:
+			headers[name] = value
+
+		if 'HTTP_IF_NONE_MATCH' in environ:
+			tags = [t.strip() for t in environ['HTTP_IF_NONE_MATCH'].split(',')]
+			if etag in tags or '*' in tags:
+				raise NotModified(cache_headers)
+		elif 'HTTP_IF_MODIFIED_SINCE' in environ and mtime is not None:
+			try:
+				since = parsedate_to_datetime(environ['HTTP_IF_MODIFIED_SINCE']).timestamp()
+			except (TypeError, ValueError):
+				pass
+			else:
+				if int(mtime) <= since:
+					raise NotModified(cache_headers)
+
+	def _get_file(self, environ, headers, file):
+		# Returns status and an iterable with the (partial) content, the
+		# file is read in chunks while the response is send
+		file = adapt_from_oldfs(file)
+		mtime, size = file.mtime(), file.size()
+			# Will raise FileNotFound when file does not exist
+		self._check_modified(environ, headers, (file.path, mtime, size), mtime)
+		headers['Content-Type'] = file.mimetype()
+		headers['Accept-Ranges'] = 'bytes'
+
+		start, length = 0, size
+		range = self._get_range(environ, headers, size)
+		if range:
+			start, length = range
+			headers['Content-Range'] = 'bytes %i-%i/%i' % (start, start + length - 1, size)
+			status = '206 Partial Content'
+		else:
+			status = '200 OK'
+		headers['Content-Length'] = str(length)
+
+		if environ['REQUEST_METHOD'] == 'HEAD':
+			return status, []
+		elif isinstance(file, LocalFile):
+			fh = open(file.path, 'rb')
+			if start == 0 and length == size and 'wsgi.file_wrapper' in environ:
+				# Allows the server to use e.g. "sendfile"
+				return status, environ['wsgi.file_wrapper'](fh, FILE_CHUNK_SIZE)
+			else:
+				fh.seek(start)
+				return status, FileChunkIterator(fh, length)
+		else: # e.g. a mock file
+			return status, FileChunkIterator(BytesIO(file.read_binary()[start:start+length]), length)
+
+	def _get_range(self, environ, headers, size):
+		# Returns 2-tuple of start and length for a valid "Range" header
+		# with a single range, C{None} to send the full content
+		value = environ.get('HTTP_RANGE', '').strip()
+		if not value.startswith('bytes=') or ',' in value:
+			return None # multiple ranges not supported, send all
+		elif 'HTTP_IF_RANGE' in environ \
+		and environ['HTTP_IF_RANGE'] not in (headers['ETag'], headers['Last-Modified']):
+			return None # changed since first part was requested
+
+		first, sep, last = value[6:].partition('-')
+		try:
+			if not first:
+				start = max(size - int(last), 0) # suffix
+				end = size - 1
+			else:
+				start = int(first)
+				end = min(int(last), size - 1) if last else size - 1
+		except ValueError:
+			return None # invalid header is ignored
+
+		if not sep or start > end or start >= size:
+			raise WWWError('', status='416', headers=[('Content-Range', 'bytes */%i' % size)])
+		return start, end - start + 1
+
+	def _get_rendered(self, environ, headers, key, render):
+		key = key + (self._index_state(),)
+		self._check_modified(environ, headers, key)
+		content = self.cache.get(key)
+		if content is None:
+			with self._render_lock:
+				lines = render()
+			content = [''.join(lines).encode('UTF-8')]
+			self.cache.set(key, content)
+		return content
+
+	def _page_key(self, path):
+		file, folder = self.notebook.layout.map_page(path)
+		key = [path.name]
+		for f in (file, folder):
+			try:
+				key.append(f.mtime())
+			except FileNotFoundError:
+				key.append(None)
+		if key[1] is not None:
+			key.append(file.size())
+		return tuple(key)
+
+	def _render_path(self, path):
+		try:
+			page = self.notebook.get_page(path)
+			if page.hascontent:
+				return self.render_page(page)
+			elif page.haschildren:
+				return self.render_index(page)
+			else:
+				raise WebPageNotFoundError(path)
+		except PageNotFoundError:
+			raise WebPageNotFoundError(path)
+
 	def __call__(self, environ, start_response):
 		'''Main function for handling a single request. Follows the
 		WSGI API.
@@ -172,6 +410,7 @@ class WWWInterface(object):
 			else:
 				return bad_auth()
 
+		status = '200 OK'
 		headerlist = []
 		headers = Headers(headerlist)
 		path = environ.get('PATH_INFO', '/')
@@ -204,23 +443,17 @@ class WWWInterface(object):
 
 			if path == '/':
 				headers.add_header('Content-Type', 'text/html', charset='utf-8')
-				content = self.render_index()
+				content = self._get_rendered(environ, headers, ('/',), self.render_index)
 			elif path.startswith('/+docs/'):
 				dir = self.notebook.document_root
 				if not dir:
 					raise WebPageNotFoundError(path)
 				file = dir.file(path[7:])
-				file = adapt_from_oldfs(file)
-				content = [file.read_binary()]
-					# Will raise FileNotFound when file does not exist
-				headers['Content-Type'] = file.mimetype()
+				status, content = self._get_file(environ, headers, file)
 			elif path.startswith('/+file/'):
 				file = self.notebook.folder.file(path[7:])
 					# TODO: need abstraction for getting file from top level dir ?
-				file = adapt_from_oldfs(file)
-				content = [file.read_binary()]
-					# Will raise FileNotFound when file does not exist
-				headers['Content-Type'] = file.mimetype()
+				status, content = self._get_file(environ, headers, file)
 			elif path.startswith('/+resources/'):
 				if self.template.resources_dir:
 					file = self.template.resources_dir.file(path[12:])
@@ -230,10 +463,7 @@ class WWWInterface(object):
 					file = data_file('pixmaps/%s' % path[12:])
 
 				if file:
-					file = adapt_from_oldfs(file)
-					content = [file.read_binary()]
-						# Will raise FileNotFound when file does not exist
-					headers['Content-Type'] = file.mimetype()
+					status, content = self._get_file(environ, headers, file)
 				else:
 					raise WebPageNotFoundError(path)
 			else:
@@ -247,16 +477,11 @@ class WWWInterface(object):
 					raise WebPageNotFoundError(path)
 
 				path = self.notebook.pages.lookup_from_user_input(pagename)
-				try:
-					page = self.notebook.get_page(path)
-					if page.hascontent:
-						content = self.render_page(page)
-					elif page.haschildren:
-						content = self.render_index(page)
-					else:
-						raise WebPageNotFoundError(path)
-				except PageNotFoundError:
-					raise WebPageNotFoundError(path)
+				content = self._get_rendered(environ, headers,
+					self._page_key(path), partial(self._render_path, path))
+		except NotModified as error:
+			start_response('304 Not Modified', error.headers)
+			return []
 		except Exception as error:
 			headerlist = []
 			headers = Headers(headerlist)
@@ -284,10 +509,10 @@ class WWWInterface(object):
 			else:
 				return [c.encode('UTF-8') for c in content]
 		else:
-			start_response('200 OK', headerlist)
+			start_response(status, headerlist)
 			if environ['REQUEST_METHOD'] == 'HEAD':
 				return []
-			elif content and isinstance(content[0], str):
+			elif isinstance(content, list) and content and isinstance(content[0], str):
 				return [c.encode('UTF-8') for c in content]
 			else:
 				return content
@@ -367,26 +592,41 @@ class WWWLinker(ExportLinker):
 			return file.uri
 
 
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+	'''WSGI server that handles each request in a new thread'''
+
+	daemon_threads = True
+
+
 def main(notebook, port=8080, public=True, **opts):
-	httpd = make_server(notebook, port, public, **opts)
+	httpd = make_server(notebook, port, public, threaded=True, **opts)
 	logger.info("Serving HTTP on %s port %i...", httpd.server_name, httpd.server_port)
 	httpd.serve_forever()
 
 
-def make_server(notebook, port=8080, public=True, auth_creds=None, **opts):
+def make_server(notebook, port=8080, public=True, auth_creds=None, threaded=False, **opts):
 	'''Create a simple http server
 	@param notebook: the notebook location
 	@param port: the http port to serve on
 	@param public: allow connections to the server from other
 	computers - if C{False} can only connect from localhost
 	@param auth_creds: credentials for HTTP-authentication
+	@param threaded: if C{True} handle each request in a new thread,
+	else requests are handled one by one in the thread calling the
+	server. Ignored when the notebook uses an in-memory index, as
+	that database can not be shared with other threads.
 	@param opts: options for L{WWWInterface.__init__()}
 	@returns: a C{WSGIServer} object
 	'''
-	import wsgiref.simple_server
+	if threaded and notebook.index.dbpath == ':memory:':
+		logger.info('Index is in-memory, handling requests in a single thread')
+		threaded = False
+
 	app = WWWInterface(notebook, auth_creds=auth_creds, **opts) # FIXME make opts explicit
+	server_class = ThreadingWSGIServer if threaded else wsgiref.simple_server.WSGIServer
 	if public:
-		httpd = wsgiref.simple_server.make_server('', port, app)
+		httpd = wsgiref.simple_server.make_server('', port, app, server_class=server_class)
 	else:
-		httpd = wsgiref.simple_server.make_server('localhost', port, app)
+		httpd = wsgiref.simple_server.make_server('localhost', port, app, server_class=server_class)
 	return httpd
+